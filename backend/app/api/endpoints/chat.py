@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import html
@@ -8,17 +8,30 @@ from app.services.rag_service import rag_service
 from app.services.student_service import student_service
 from app.services.conversation_service import conversation_service
 from app.services.quiz_service import quiz_service
+from app.services.ingest_jobs import ingest_job_service, IngestJobConflict
+from app.services.bulk_ingest import bulk_ingest_service
 from app.core.config import settings
 
 router = APIRouter()
 
 class IngestRequest(BaseModel):
     course_id: int
+    incremental: bool = False
+    # Write a new knowledge base generation and switch to it when done (no query downtime).
+    rebuild: bool = False
+
+class BulkIngestRequest(BaseModel):
+    # None ingests every course returned by Moodle.
+    course_ids: Optional[List[int]] = None
+    incremental: bool = False
+    concurrency: Optional[int] = None
 
 class ChatRequest(BaseModel):
     course_id: int
     question: str
     student_id: int = 1
+    # Skip the answer cache lookup and generate a fresh answer (which then replaces the cached one).
+    bypass_cache: bool = False
 
 class ChatResponse(BaseModel):
     answer: str
@@ -72,11 +85,133 @@ class TeacherQuizRequest(BaseModel):
 @router.post("/ingest", response_model=Dict[str, Any])
 def ingest_course(request: IngestRequest):
     """
-    Trigger ingestion of a course's content into the Vector DB.
+    Queue ingestion of a course's content into the Vector DB and return the background job.
+    Set incremental=true to only re-embed modules that changed since the last ingest, or
+    rebuild=true to build a new generation while chat keeps using the current one.
+    If the course already has a queued/running job with the same options, that job is returned
+    (coalesced=true); a job with other options answers 409 naming it.
     """
     try:
-        result = rag_service.ingest_course_content(request.course_id)
-        return result
+        return ingest_job_service.submit(
+            request.course_id, incremental=request.incremental, rebuild=request.rebuild
+        )
+    except IngestJobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/ingest/bulk", response_model=Dict[str, Any])
+def bulk_ingest(request: BulkIngestRequest, admin_token: Optional[str] = None):
+    """
+    Start a bulk ingestion run over a list of courses (or all Moodle courses) in the background.
+    Poll GET /ingest/bulk/{run_id} for the per-course timing and failure report.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN is not configured")
+    if admin_token != settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    try:
+        run = bulk_ingest_service.create_run(
+            request.course_ids, incremental=request.incremental, concurrency=request.concurrency
+        )
+        return bulk_ingest_service.start(run["run_id"])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/ingest/bulk", response_model=List[Dict[str, Any]])
+def list_bulk_ingest_runs(limit: int = 20, admin_token: Optional[str] = None):
+    """
+    Recent bulk ingestion runs with their summaries, newest first.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN is not configured")
+    if admin_token != settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    try:
+        return bulk_ingest_service.list_runs(limit=limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/ingest/bulk/{run_id}", response_model=Dict[str, Any])
+def get_bulk_ingest_run(run_id: str, admin_token: Optional[str] = None):
+    """
+    Per-course status, timing and errors of a bulk ingestion run, plus a summary.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN is not configured")
+    if admin_token != settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    run = bulk_ingest_service.report(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Bulk ingest run not found")
+    return run
+
+@router.post("/ingest/bulk/{run_id}/resume", response_model=Dict[str, Any])
+def resume_bulk_ingest_run(run_id: str, retry_failed: bool = False, admin_token: Optional[str] = None):
+    """
+    Resume an interrupted or cancelled run; courses that already succeeded are skipped.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN is not configured")
+    if admin_token != settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    try:
+        return bulk_ingest_service.start(run_id, retry_failed=retry_failed)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Bulk ingest run not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/ingest/bulk/{run_id}/cancel", response_model=Dict[str, Any])
+def cancel_bulk_ingest_run(run_id: str, admin_token: Optional[str] = None):
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN is not configured")
+    if admin_token != settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    run = bulk_ingest_service.cancel(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Bulk ingest run not found")
+    return run
+
+@router.get("/ingest/jobs", response_model=List[Dict[str, Any]])
+def list_ingest_jobs(course_id: Optional[int] = None, limit: int = 20):
+    """
+    Recent ingestion jobs, newest first, optionally filtered by course.
+    """
+    try:
+        return ingest_job_service.list_jobs(course_id=course_id, limit=limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/ingest/{job_id}", response_model=Dict[str, Any])
+def get_ingest_job(job_id: str):
+    """
+    Status of an ingestion job with per-stage progress
+    (modules_total/modules_processed, files_total/files_parsed, chunks_embedded).
+    """
+    job = ingest_job_service.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job
+
+@router.post("/ingest/{job_id}/cancel", response_model=Dict[str, Any])
+def cancel_ingest_job(job_id: str):
+    """
+    Request cancellation of a queued or running ingestion job.
+    A running job stops at the next module or embedding batch.
+    """
+    job = ingest_job_service.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job
+
+@router.get("/cache/stats", response_model=Dict[str, Any])
+def get_cache_stats():
+    """
+    Hit-rate stats of the ingestion caches (embeddings, extracted attachment text).
+    """
+    try:
+        return rag_service.cache_stats()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -402,17 +537,33 @@ def clear_knowledge_base(course_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/knowledge-base/{course_id}/rollback", response_model=Dict[str, Any])
+def rollback_knowledge_base(course_id: int):
+    """
+    Switch a course back to the knowledge base generation that was active before its last rebuild.
+    """
+    try:
+        result = rag_service.rollback_knowledge_base(course_id)
+        if result.get("status") != "success":
+            raise HTTPException(status_code=409, detail=result.get("message", "Rollback failed"))
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 class LearningPathRequest(BaseModel):
     course_id: int
     student_id: int
 
 @router.post("/learning-path")
-def get_learning_path(request: LearningPathRequest):
+async def get_learning_path(request: LearningPathRequest):
     try:
         # We assume the progress is already synced or cached.
         # If the frontend wants to force a sync, we might need a flag.
         # For now, we rely on the cache in student_service.get_student_progress
-        result = rag_service.generate_learning_path(request.course_id, request.student_id)
+        service = await rag_service.aget()
+        result = await service.agenerate_learning_path(request.course_id, request.student_id)
         overrides = student_service.get_learning_path_overrides(request.student_id, request.course_id)
         if isinstance(overrides, dict):
             pinned = overrides.get("pinned_recommendations") or []
@@ -455,26 +606,50 @@ def submit_quiz_result(submission: QuizSubmission):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _chat_quiz_topic(question: str) -> Optional[str]:
+    """Topic of a quiz requested via chat text, or None when the question is not a quiz request."""
+    lower_q = question.lower()
+    if "quiz" in lower_q and ("give" in lower_q or "create" in lower_q or "generate" in lower_q or "make" in lower_q):
+        # Extract topic (simple heuristic)
+        topic = "General Review"
+        if "on" in lower_q:
+            topic = question.split("on", 1)[1].strip()
+        elif "about" in lower_q:
+            topic = question.split("about", 1)[1].strip()
+        return topic
+    return None
+
+
+async def _save_chat_answer(request: ChatRequest, answer: str, sources: List[Dict[str, Any]]) -> None:
+    try:
+        history_payload = json.dumps(
+            {
+                "type": "chat",
+                "text": answer,
+                "sources": sources or [],
+            }
+        )
+        await conversation_service.aadd_message(request.course_id, request.student_id, "assistant", history_payload)
+    except Exception as e:
+        print(f"Failed to persist chat sources to history: {e}")
+        await conversation_service.aadd_message(request.course_id, request.student_id, "assistant", answer)
+
+
+# The chat, quiz and learning-path handlers are async: they await the LLM and Moodle instead of
+# holding one of the server's worker threads for the whole generation.
 @router.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest):
     """
     Ask a question about a specific course.
     """
     try:
-        conversation_service.add_message(request.course_id, request.student_id, "user", request.question)
+        await conversation_service.aadd_message(request.course_id, request.student_id, "user", request.question)
         
         # Check if the user is asking for a quiz via chat text
-        lower_q = request.question.lower()
-        if "quiz" in lower_q and ("give" in lower_q or "create" in lower_q or "generate" in lower_q or "make" in lower_q):
-            # Extract topic (simple heuristic)
-            topic = "General Review"
-            if "on" in lower_q:
-                topic = request.question.split("on", 1)[1].strip()
-            elif "about" in lower_q:
-                topic = request.question.split("about", 1)[1].strip()
-            
+        topic = _chat_quiz_topic(request.question)
+        if topic is not None:
             # Generate quiz using the existing service
-            quiz_data = quiz_service.get_student_quiz(request.course_id, topic)
+            quiz_data = await quiz_service.aget_student_quiz(request.course_id, topic)
             
             # Create a structured response that the frontend can detect
             # We return the quiz JSON as the answer, but wrapped in a specific way or just the JSON string?
@@ -504,31 +679,81 @@ def chat(request: ChatRequest):
             
             response_text = f"I've generated a quiz for you on {topic}:::JSON_QUIZ:::{quiz_json}"
 
-            conversation_service.add_message(request.course_id, request.student_id, "assistant", history_payload)
+            await conversation_service.aadd_message(request.course_id, request.student_id, "assistant", history_payload)
             
             return {
                 "answer": response_text,
                 "sources": []
             }
 
-        result = rag_service.ask_question(request.course_id, request.question, request.student_id)
-        try:
-            history_payload = json.dumps(
-                {
-                    "type": "chat",
-                    "text": result.get("answer", ""),
-                    "sources": result.get("sources", []) or [],
-                }
-            )
-            conversation_service.add_message(request.course_id, request.student_id, "assistant", history_payload)
-        except Exception as e:
-            print(f"Failed to persist chat sources to history: {e}")
-            conversation_service.add_message(request.course_id, request.student_id, "assistant", result.get("answer", ""))
+        service = await rag_service.aget()
+        result = await service.aask_question(
+            request.course_id, request.question, request.student_id, use_cache=not request.bypass_cache
+        )
+        await _save_chat_answer(request, result.get("answer", ""), result.get("sources", []))
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming variant of /chat (Server-Sent Events). Events, in order:
+    - `sources`: the retrieved sources (same shape as ChatResponse.sources), sent before generation starts
+    - `token`: {"text": ...} for each piece of the answer as the LLM produces it
+    - `done`: {"answer": ..., "sources": [...]} once the answer is complete and saved to the chat history
+    - `error`: {"detail": ...} if retrieval or generation fails; nothing more is sent
+    Quiz requests are answered with a single `token` holding the same text /chat returns.
+    """
+    async def events():
+        try:
+            await conversation_service.aadd_message(request.course_id, request.student_id, "user", request.question)
+
+            topic = _chat_quiz_topic(request.question)
+            if topic is not None:
+                quiz_data = await quiz_service.aget_student_quiz(request.course_id, topic)
+                response_text = f"I've generated a quiz for you on {topic}:::JSON_QUIZ:::{json.dumps(quiz_data)}"
+                await conversation_service.aadd_message(
+                    request.course_id, request.student_id, "assistant",
+                    json.dumps({"type": "quiz", "topic": topic, "quiz": quiz_data}),
+                )
+                yield _sse("sources", [])
+                yield _sse("token", {"text": response_text})
+                yield _sse("done", {"answer": response_text, "sources": []})
+                return
+
+            sources: List[Dict[str, Any]] = []
+            parts: List[str] = []
+            service = await rag_service.aget()
+            async for kind, value in service.astream_answer(
+                request.course_id, request.question, request.student_id, use_cache=not request.bypass_cache
+            ):
+                if kind == "sources":
+                    sources = value
+                    yield _sse("sources", sources)
+                else:
+                    parts.append(value)
+                    yield _sse("token", {"text": value})
+            answer = "".join(parts)
+            await _save_chat_answer(request, answer, sources)
+            yield _sse("done", {"answer": answer, "sources": sources})
+        except Exception as e:
+            print(f"Chat stream failed: {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    # X-Accel-Buffering stops nginx from holding the events back until the response ends.
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/chat/history", response_model=List[ChatHistoryMessage])
 def get_chat_history(course_id: int, student_id: int, limit: int = 50):
     """
@@ -658,7 +883,7 @@ def view_chat_history(course_id: int, student_id: int, request: Request, limit:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/quiz", response_model=QuizResponse)
-def generate_quiz(request: QuizRequest):
+async def generate_quiz(request: QuizRequest):
     """
     Generate a quiz question based on a topic.
     Generates a quiz grounded in course content (RAG).
@@ -666,7 +891,8 @@ def generate_quiz(request: QuizRequest):
     """
     try:
         import uuid
-        quiz_data = rag_service.generate_quiz(
+        service = await rag_service.aget()
+        quiz_data = await service.agenerate_quiz(
             request.course_id,
             request.topic,
             diversity_token=str(uuid.uuid4()),
@@ -678,8 +904,8 @@ def generate_quiz(request: QuizRequest):
         
         # Save to history so it persists (structured JSON for clean rendering on refresh)
         import json
-        conversation_service.add_message(request.course_id, request.student_id, "user", f"Give me a pop quiz on {request.topic}")
-        conversation_service.add_message(
+        await conversation_service.aadd_message(request.course_id, request.student_id, "user", f"Give me a pop quiz on {request.topic}")
+        await conversation_service.aadd_message(
             request.course_id,
             request.student_id,
             "assistant",
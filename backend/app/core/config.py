@@ -10,6 +10,11 @@ class Settings(BaseSettings):
     MOODLE_PUBLIC_URL: Optional[str] = None
     MOODLE_TOKEN: Optional[str] = None
     ENABLE_MOCK_MOODLE: bool = False
+    # Max concurrent requests this process sends to Moodle (API calls and file downloads).
+    MOODLE_MAX_CONCURRENCY: int = 4
+    # Sustained Moodle request rate per process (token bucket); 0 disables the limit.
+    MOODLE_RATE_LIMIT_PER_S: float = 0.0
+    MOODLE_RATE_LIMIT_BURST: int = 10
     
     # AI Settings
     LLM_PROVIDER: str = "ollama"  # options: "ollama", "mistral_api", "groq"
@@ -19,14 +24,62 @@ class Settings(BaseSettings):
     MODEL_NAME: str = "mistral"
 
     CHROMA_PERSIST_DIR: str = "./chroma_db"
+    # "single": all courses in one collection; "per_course": one collection per course, or per
+    # shard of courses when VECTOR_STORE_COURSE_SHARDS > 0 (see scripts/migrate_vector_layout.py).
+    VECTOR_STORE_LAYOUT: str = "single"
+    VECTOR_STORE_COURSE_SHARDS: int = 0
+    # Opt-in compact vector storage for low-memory instances: "off" keeps float32 vectors in
+    # Chroma's HNSW index; "int8" / "float16" keep quantized vectors in memory and re-rank the
+    # best k * VECTOR_COMPACT_RERANK_FACTOR candidates with float32 vectors read from disk
+    # (see scripts/compact_vectors.py to convert existing collections).
+    VECTOR_COMPACT_MODE: str = "off"
+    VECTOR_COMPACT_RERANK_FACTOR: int = 4
     CHAT_DB_PATH: str = "./chat_history.db"
     QUIZ_DATA_DIR: str = "data/quizzes"
     APP_DATA_DIR: str = "./app/data"
     INGEST_EMBED_BATCH_SIZE: int = 32
     MAX_INGEST_FILE_BYTES: int = 8_000_000
+    INGEST_DOWNLOAD_WORKERS: int = 4
+    INGEST_PARSE_WORKERS: int = 2
+    FILE_TEXT_CACHE_MAX_BYTES: int = 256_000_000
+    EMBEDDING_CACHE_ENABLED: bool = True
+    INGEST_JOB_WORKERS: int = 1
+    BULK_INGEST_CONCURRENCY: int = 2
     MAX_PDF_PAGES: int = 10
+    ATTACHMENT_PARSE_TIMEOUT_S: float = 60.0
     MAX_DOCX_CHARS: int = 120_000
     MAX_MODULE_TEXT_CHARS: int = 200_000
+    # Knowledge base generations kept per course after a rebuild: the active one plus older
+    # ones available for rollback. Anything older is garbage-collected in the background.
+    KB_RETAINED_GENERATIONS: int = 2
+
+    # Build and warm up the RAG service (embedding model, Chroma segments of the most recently
+    # ingested courses, LLM connection) in a background thread when the API starts; /ready
+    # answers 503 until that finished. When False, the first request that needs it builds it.
+    RAG_INIT_ON_STARTUP: bool = True
+    WARMUP_MAX_COURSES: int = 20
+    WARMUP_PING_LLM: bool = True
+    WARMUP_LLM_TIMEOUT_S: float = 20.0
+
+    # Exact-match cache of chat answers, keyed on course, normalized question, knowledge base
+    # version and the student context in the prompt. Entries expire after ANSWER_CACHE_TTL_S.
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 2000
+    ANSWER_CACHE_TTL_S: float = 3600.0
+
+    # Semantic answer cache: a question whose embedding reaches SEMANTIC_CACHE_THRESHOLD (cosine)
+    # against a recently answered one of the same course, student context and knowledge base
+    # version gets that answer. Off by default; pick the threshold with
+    # scripts/replay_semantic_cache.py against the deployed embedding model.
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_MAX_ENTRIES_PER_COURSE: int = 500
+    SEMANTIC_CACHE_TTL_S: float = 3600.0
+
+    # Vector search results shared across students (query embedding plus top-k chunks), keyed on
+    # course, normalized query, filter, k and knowledge base version; LRU within RETRIEVAL_CACHE_MAX_MB.
+    RETRIEVAL_CACHE_ENABLED: bool = True
+    RETRIEVAL_CACHE_MAX_MB: float = 64.0
 
     ADMIN_TOKEN: Optional[str] = None
 
@@ -0,0 +1,125 @@
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.core.config import settings
+
+
+def normalize_question(question: str) -> str:
+    """Case, whitespace and trailing punctuation do not change what is being asked."""
+    text = " ".join((question or "").lower().split())
+    return re.sub(r"[\s?!.]+$", "", text)
+
+
+def student_fingerprint(profile: Dict[str, Any], progress: Dict[str, Any]) -> str:
+    """Hash of the student-context fields that ask_question puts into the prompt."""
+    fields = {
+        "name": profile.get("name"),
+        "learning_style": profile.get("learning_style"),
+        "strengths": profile.get("strengths") or [],
+        "weaknesses": profile.get("weaknesses") or [],
+        "completed_modules": progress.get("completed_modules") or [],
+        "quiz_scores": progress.get("quiz_scores") or {},
+    }
+    payload = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    In-memory LRU cache of ask_question results with a TTL.
+
+    Keys combine the course, the normalized question, the course's knowledge base version
+    (changes whenever an ingest, rebuild, rollback or clear touches the course, also from
+    another process) and the student-context fingerprint, so an answer is only reused for the
+    same prompt over the same course content. invalidate_course() drops a course's entries
+    right away when this process changes its knowledge base.
+    """
+
+    def __init__(self, max_entries: int = 2000, ttl_s: float = 3600.0, enabled: bool = True):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self._enabled = enabled
+        self._lock = threading.Lock()
+        # key -> (expires_at, course_id, value)
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled and self.max_entries > 0
+
+    @staticmethod
+    def key(course_id: int, question: str, kb_version: str, fingerprint: str) -> str:
+        payload = json.dumps([int(course_id), normalize_question(question), kb_version, fingerprint])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(entry[2])
+
+    def put(self, key: str, course_id: int, value: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        entry = (time.monotonic() + self.ttl_s, int(course_id), copy.deepcopy(value))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def invalidate_course(self, course_id: int) -> int:
+        """Drops the cached answers of a course; returns how many there were."""
+        with self._lock:
+            keys = [k for k, (_, cid, _) in self._entries.items() if cid == int(course_id)]
+            for k in keys:
+                del self._entries[k]
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_s=settings.ANSWER_CACHE_TTL_S,
+    enabled=settings.ANSWER_CACHE_ENABLED,
+)
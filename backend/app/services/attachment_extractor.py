@@ -0,0 +1,304 @@
+import io
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, Executor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Deque, Iterable, Iterator, Optional, Tuple
+
+PDF_MIMETYPE = "application/pdf"
+DOCX_MIMETYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def attachment_kind(item: Dict[str, Any]) -> Optional[str]:
+    """
+    Returns "pdf" or "docx" when a core_course_get_contents file entry can be text-extracted.
+    """
+    filename = str(item.get("filename") or "").lower()
+    mimetype = item.get("mimetype")
+    if mimetype == PDF_MIMETYPE or filename.endswith(".pdf"):
+        return "pdf"
+    if mimetype == DOCX_MIMETYPE or filename.endswith(".docx"):
+        return "docx"
+    return None
+
+
+# Extractors return (text, truncation reason or None).
+ExtractOutput = Tuple[str, Optional[str]]
+
+# Extra seconds the parent waits past the time budget before killing an extraction process,
+# covering process start-up and sending the text back.
+KILL_GRACE_S = 5.0
+
+
+def extract_pdf_text(data: bytes, max_pages: int = 0, time_budget_s: float = 0) -> ExtractOutput:
+    """
+    Extracts text from at most `max_pages` pages (0 = all). Stops early, keeping the pages read
+    so far, once `time_budget_s` seconds have passed.
+    """
+    # Runs in a worker process, so the import stays local to the function.
+    from pypdf import PdfReader
+
+    deadline = time.monotonic() + time_budget_s if time_budget_s and time_budget_s > 0 else None
+    reader = PdfReader(io.BytesIO(data))
+    total_pages = len(reader.pages)
+    page_limit = min(total_pages, max_pages) if max_pages and max_pages > 0 else total_pages
+    parts = []
+    truncated = None
+    for page_index in range(page_limit):
+        if deadline is not None and time.monotonic() > deadline:
+            truncated = f"time budget of {time_budget_s:g}s reached after {page_index} of {total_pages} pages"
+            break
+        extracted = reader.pages[page_index].extract_text()
+        if extracted:
+            parts.append(extracted + "\n")
+    if truncated is None and page_limit < total_pages:
+        truncated = f"page limit: first {page_limit} of {total_pages} pages"
+    return "".join(parts), truncated
+
+
+def extract_docx_text(data: bytes, max_chars: int = 0, **_: Any) -> ExtractOutput:
+    """Extracts paragraph text, keeping at most `max_chars` characters (0 = all)."""
+    import docx
+
+    doc_file = docx.Document(io.BytesIO(data))
+    text = "\n".join([para.text for para in doc_file.paragraphs])
+    if max_chars and max_chars > 0 and len(text) > max_chars:
+        return text[:max_chars], f"character limit: first {max_chars} of {len(text)} characters"
+    return text, None
+
+
+EXTRACTORS: Dict[str, Callable[..., ExtractOutput]] = {
+    "pdf": extract_pdf_text,
+    "docx": extract_docx_text,
+}
+
+
+class ExtractionSkipped(Exception):
+    """The extraction process was killed or died; the file is skipped for this ingest and retried by the next one."""
+
+
+def _extract_in_child(conn, kind: str, data: bytes, options: Dict[str, Any]) -> None:
+    try:
+        conn.send(("ok", EXTRACTORS[kind](data, **options)))
+    except BaseException as e:
+        conn.send(("error", f"{e.__class__.__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def _process_context():
+    # forkserver forks children from a small clean server process (cheap and thread-safe, and
+    # unlike spawn it does not re-import the parent's __main__); spawn elsewhere.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["pypdf", "docx", __name__])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def extract_isolated(kind: str, data: bytes, options: Dict[str, Any], timeout_s: float, ctx=None) -> ExtractOutput:
+    """
+    Runs one extraction in its own process and kills it if it is still running `timeout_s`
+    (+ KILL_GRACE_S) seconds later. Raises ExtractionSkipped on timeout or crash, and
+    RuntimeError for ordinary parse errors raised inside the child.
+    """
+    ctx = ctx or _process_context()
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_extract_in_child, args=(child_conn, kind, data, options), daemon=True)
+    proc.start()
+    child_conn.close()
+    try:
+        wait_s = timeout_s + KILL_GRACE_S if timeout_s and timeout_s > 0 else None
+        if not parent_conn.poll(wait_s):
+            proc.kill()
+            raise ExtractionSkipped(f"extraction timed out after {timeout_s:g}s")
+        try:
+            status, payload = parent_conn.recv()
+        except EOFError:
+            proc.join(1)
+            raise ExtractionSkipped(f"extraction process crashed (exit code {proc.exitcode})")
+        if status != "ok":
+            raise RuntimeError(payload)
+        return payload
+    finally:
+        parent_conn.close()
+        proc.join(1)
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+
+
+@dataclass
+class AttachmentJob:
+    key: Tuple[int, int]
+    filename: str
+    fileurl: str
+    kind: str
+    source_key: Optional[str] = None
+
+
+@dataclass
+class AttachmentResult:
+    job: AttachmentJob
+    text: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+    # Why only part of the file was extracted (page cap, time budget).
+    truncated: Optional[str] = None
+    # Why the file was skipped entirely (killed after the time budget, parser crash).
+    skipped: Optional[str] = None
+
+
+class AttachmentExtractor:
+    """
+    Bounded two-stage pipeline for course attachments: a thread pool downloads files from
+    Moodle and hands the bytes to `parse_workers` parse slots for CPU-bound PDF/DOCX text
+    extraction.
+
+    Each extraction runs in its own killable process, reads at most `max_pdf_pages` PDF pages
+    (`max_docx_chars` DOCX characters) and gets `parse_timeout_s` seconds: past the budget the child stops between pages and returns
+    what it has, and a child that is stuck inside a single page is killed and the file skipped.
+    With `parse_workers=0` (or when processes cannot be started) extraction runs in threads,
+    where only the between-pages budget applies.
+
+    Results are yielded in the same order as the submitted jobs, and at most `max_in_flight`
+    jobs are downloaded/parsed ahead of the consumer so memory stays bounded.
+
+    When a FileTextCache is given, jobs whose Moodle metadata key is cached skip the download,
+    and downloaded files whose bytes were seen before skip the parse.
+    """
+
+    def __init__(
+        self,
+        download: Callable[[str], Optional[bytes]],
+        download_workers: int = 4,
+        parse_workers: int = 2,
+        max_in_flight: Optional[int] = None,
+        cache: Optional[Any] = None,
+        max_pdf_pages: int = 0,
+        max_docx_chars: int = 0,
+        parse_timeout_s: float = 0,
+    ):
+        self.download = download
+        self.cache = cache if cache is not None and cache.enabled else None
+        self.download_workers = max(1, int(download_workers))
+        self.parse_workers = max(0, int(parse_workers))
+        self.max_in_flight = max_in_flight or (self.download_workers + max(1, self.parse_workers)) * 2
+        self.max_pdf_pages = max(0, int(max_pdf_pages or 0))
+        self.max_docx_chars = max(0, int(max_docx_chars or 0))
+        self.parse_timeout_s = max(0.0, float(parse_timeout_s or 0))
+        self._process_ctx = None
+        self._isolate = self.parse_workers > 0
+
+    def cache_variant(self, kind: str) -> str:
+        """Extraction settings that change the extracted text; part of the cache keys."""
+        if kind == "pdf":
+            return f"pdf:pages={self.max_pdf_pages}:timeout={self.parse_timeout_s:g}"
+        if kind == "docx":
+            return f"docx:chars={self.max_docx_chars}:timeout={self.parse_timeout_s:g}"
+        return f"{kind}:timeout={self.parse_timeout_s:g}"
+
+    def _create_parse_pool(self) -> Executor:
+        return ThreadPoolExecutor(max_workers=max(1, self.parse_workers), thread_name_prefix="attachment-parse")
+
+    def _parse(self, kind: str, data: bytes) -> ExtractOutput:
+        options: Dict[str, Any] = {"time_budget_s": self.parse_timeout_s}
+        if kind == "pdf":
+            options["max_pages"] = self.max_pdf_pages
+        elif kind == "docx":
+            options["max_chars"] = self.max_docx_chars
+        if self._isolate:
+            try:
+                if self._process_ctx is None:
+                    self._process_ctx = _process_context()
+                return extract_isolated(kind, data, options, self.parse_timeout_s, self._process_ctx)
+            except (ExtractionSkipped, RuntimeError):
+                raise
+            except Exception as e:
+                print(f"Warning: extraction processes unavailable, parsing attachments in threads: {e}")
+                self._isolate = False
+        return EXTRACTORS[kind](data, **options)
+
+    def _start(self, job: AttachmentJob, download_pool: Executor, parse_pool: Executor) -> "Future[AttachmentResult]":
+        result: "Future[AttachmentResult]" = Future()
+        cache = self.cache
+
+        def _from_cache(entry: Tuple[str, Dict[str, Any]]) -> AttachmentResult:
+            text, meta = entry
+            return AttachmentResult(
+                job=job,
+                text=text,
+                cached=True,
+                truncated=meta.get("truncated"),
+                skipped=meta.get("skipped"),
+            )
+
+        def _usable(entry: Optional[Tuple[str, Dict[str, Any]]]) -> bool:
+            # Skipped results cached by earlier versions are parsed again.
+            return entry is not None and not entry[1].get("skipped")
+
+        if cache is not None:
+            cached_entry = cache.get_by_source(job.source_key)
+            if _usable(cached_entry):
+                result.set_result(_from_cache(cached_entry))
+                return result
+
+        def _on_parsed(parse_future: Future, content_key: Optional[str]) -> None:
+            try:
+                text, truncated = parse_future.result()
+                text = text or ""
+            except ExtractionSkipped as e:
+                # A timeout or a killed child depends on load (or the OOM killer), not only on the
+                # file, so it is not cached and the module is retried by the next ingest.
+                result.set_result(AttachmentResult(job=job, text="", skipped=str(e)))
+                return
+            except Exception as e:
+                result.set_result(AttachmentResult(job=job, error=str(e) or e.__class__.__name__))
+                return
+            if cache is not None and content_key:
+                # Page and character caps are deterministic for these bytes and settings.
+                meta = {"truncated": truncated} if truncated else {}
+                cache.put(content_key, text, job.source_key, meta=meta)
+            result.set_result(AttachmentResult(job=job, text=text, truncated=truncated))
+
+        def _on_downloaded(download_future: Future) -> None:
+            try:
+                data = download_future.result()
+            except Exception as e:
+                result.set_result(AttachmentResult(job=job, error=f"download failed: {e}"))
+                return
+            if not data:
+                result.set_result(AttachmentResult(job=job, error="download failed or file too large"))
+                return
+            content_key = None
+            if cache is not None:
+                content_key = cache.content_key(data, self.cache_variant(job.kind))
+                cached_entry = cache.get_by_content(content_key, job.source_key)
+                if _usable(cached_entry):
+                    result.set_result(_from_cache(cached_entry))
+                    return
+            try:
+                parse_pool.submit(self._parse, job.kind, data).add_done_callback(
+                    lambda parse_future: _on_parsed(parse_future, content_key)
+                )
+            except Exception as e:
+                result.set_result(AttachmentResult(job=job, error=str(e)))
+
+        print(f"Downloading {job.kind.upper()}: {job.filename}")
+        download_pool.submit(self.download, job.fileurl).add_done_callback(_on_downloaded)
+        return result
+
+    def iter_extract(self, jobs: Iterable[AttachmentJob]) -> Iterator[AttachmentResult]:
+        job_iter = iter(jobs)
+        pending: Deque["Future[AttachmentResult]"] = deque()
+        with ThreadPoolExecutor(max_workers=self.download_workers) as download_pool, self._create_parse_pool() as parse_pool:
+            for job in job_iter:
+                pending.append(self._start(job, download_pool, parse_pool))
+                if len(pending) >= self.max_in_flight:
+                    break
+            while pending:
+                yield pending.popleft().result()
+                next_job = next(job_iter, None)
+                if next_job is not None:
+                    pending.append(self._start(next_job, download_pool, parse_pool))
@@ -0,0 +1,297 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.services.moodle_client import moodle_client
+from app.services.ingest_state import ingest_state_store
+from app.services.rag_service import rag_service, IngestCancelled
+
+BULK_INGEST_DIR = os.path.join(settings.APP_DATA_DIR, "bulk_ingest")
+
+# Result fields kept per course in the run report.
+_RESULT_FIELDS = (
+    "status", "mode", "chunks_count", "chunks_written", "chunks_deleted", "modules_added", "modules_changed", "modules_unchanged", "modules_removed",
+)
+
+
+def _pid_alive(pid: Any) -> bool:
+    try:
+        os.kill(int(pid), 0)
+        return True
+    except Exception:
+        return False
+
+
+class BulkIngestService:
+    """
+    Ingests many courses (e.g. at term rollover) under one global concurrency limit.
+
+    Each run is persisted as JSON under APP_DATA_DIR/bulk_ingest and rewritten after every
+    course, so a crashed or cancelled run can be resumed: courses that already succeeded are
+    skipped. Moodle load is bounded by the client's shared MOODLE_MAX_CONCURRENCY and
+    MOODLE_RATE_LIMIT_PER_S budget, which all concurrent courses draw from.
+
+    Run layout:
+    {
+        "run_id": "...", "status": "running|completed|completed_with_errors|cancelled|interrupted",
+        "incremental": false, "concurrency": 2, "created_at": ..., "started_at": ..., "finished_at": ...,
+        "order": [12, 7, ...],
+        "courses": {"12": {"course_id": 12, "status": "pending|running|succeeded|failed|cancelled",
+                           "attempts": 1, "started_at": ..., "finished_at": ..., "duration_s": 41.2,
+                           "result": {...}, "error": null}}
+    }
+    """
+
+    def __init__(self, runs_dir: str = BULK_INGEST_DIR):
+        self.runs_dir = runs_dir
+        os.makedirs(self.runs_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._mark_interrupted_runs()
+
+    def _get_file_path(self, run_id: str) -> str:
+        return os.path.join(self.runs_dir, f"run_{run_id}.json")
+
+    def _save(self, run: Dict[str, Any]) -> None:
+        # Caller holds self._lock.
+        file_path = self._get_file_path(run["run_id"])
+        tmp_path = f"{file_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(run, f, indent=2)
+            os.replace(tmp_path, file_path)
+        except Exception as e:
+            print(f"Error saving bulk ingest run {file_path}: {e}")
+
+    def _load(self, run_id: str) -> Optional[Dict[str, Any]]:
+        file_path = self._get_file_path(run_id)
+        if not os.path.exists(file_path):
+            return None
+        try:
+            with open(file_path, "r") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else None
+        except Exception as e:
+            print(f"Error loading bulk ingest run {file_path}: {e}")
+            return None
+
+    def _mark_interrupted_runs(self) -> None:
+        for name in os.listdir(self.runs_dir):
+            if not (name.startswith("run_") and name.endswith(".json")):
+                continue
+            run = self._load(name[len("run_"):-len(".json")])
+            if not run or run.get("status") != "running" or _pid_alive(run.get("pid")):
+                continue
+            run["status"] = "interrupted"
+            for course in run.get("courses", {}).values():
+                if course.get("status") == "running":
+                    course["status"] = "pending"
+            with self._lock:
+                self._save(run)
+
+    def _resolve_course_ids(self, course_ids: Optional[List[int]]) -> List[int]:
+        if course_ids:
+            return list(dict.fromkeys(int(c) for c in course_ids))
+        courses = moodle_client.get_courses()
+        if isinstance(courses, dict):
+            courses = courses.get("courses") or []
+        resolved = []
+        for course in courses or []:
+            if not isinstance(course, dict) or course.get("id") is None:
+                continue
+            # The site front page is returned as a course with format "site".
+            if course.get("format") == "site":
+                continue
+            resolved.append(int(course["id"]))
+        return list(dict.fromkeys(resolved))
+
+    def _schedule(self, course_ids: List[int]) -> List[int]:
+        """
+        Largest courses first (by module count of their last ingest), so big courses do not
+        start last and become the tail of the run. Unknown courses keep their given order.
+        """
+        def _size(course_id: int) -> int:
+            return len((ingest_state_store.load(course_id).get("modules") or {}))
+
+        sizes = {course_id: _size(course_id) for course_id in course_ids}
+        return sorted(course_ids, key=lambda course_id: -sizes[course_id])
+
+    def create_run(
+        self,
+        course_ids: Optional[List[int]] = None,
+        incremental: bool = False,
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Creates a run for the given courses (all Moodle courses when None) without starting it."""
+        ids = self._schedule(self._resolve_course_ids(course_ids))
+        run_id = datetime.utcnow().strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        run = {
+            "run_id": run_id,
+            "status": "pending",
+            "incremental": bool(incremental),
+            "concurrency": max(1, int(concurrency or settings.BULK_INGEST_CONCURRENCY)),
+            "created_at": datetime.utcnow().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "order": ids,
+            "courses": {
+                str(course_id): {"course_id": course_id, "status": "pending", "attempts": 0}
+                for course_id in ids
+            },
+        }
+        with self._lock:
+            self._runs[run_id] = run
+            self._save(run)
+        return self.report(run_id)
+
+    def start(self, run_id: str, retry_failed: bool = False) -> Dict[str, Any]:
+        """Runs (or resumes) a run on a background thread and returns its current report."""
+        self._prepare(run_id, retry_failed)
+        threading.Thread(target=self.run, args=(run_id,), name=f"bulk-ingest-{run_id}", daemon=True).start()
+        return self.report(run_id)
+
+    def _prepare(self, run_id: str, retry_failed: bool) -> None:
+        with self._lock:
+            run = self._runs.get(run_id) or self._load(run_id)
+            if run is None:
+                raise KeyError(f"Bulk ingest run {run_id} not found")
+            if run.get("status") == "running" and (
+                run_id in self._cancel_events or (run.get("pid") != os.getpid() and _pid_alive(run.get("pid")))
+            ):
+                raise RuntimeError(f"Bulk ingest run {run_id} is already running")
+            for course in run["courses"].values():
+                if course["status"] in ("running", "cancelled") or (retry_failed and course["status"] == "failed"):
+                    course["status"] = "pending"
+            run["status"] = "running"
+            run["pid"] = os.getpid()
+            run["started_at"] = run.get("started_at") or datetime.utcnow().isoformat()
+            run["finished_at"] = None
+            self._runs[run_id] = run
+            self._cancel_events[run_id] = threading.Event()
+            self._save(run)
+
+    def run(self, run_id: str, retry_failed: bool = False) -> Dict[str, Any]:
+        """Runs a run to completion in the calling thread (used by the CLI and by start())."""
+        if run_id not in self._cancel_events:
+            self._prepare(run_id, retry_failed)
+        cancel_event = self._cancel_events[run_id]
+        with self._lock:
+            run = self._runs[run_id]
+            pending = [c for c in run["order"] if run["courses"][str(c)]["status"] == "pending"]
+            concurrency = run["concurrency"]
+            incremental = run["incremental"]
+
+        print(f"Bulk ingest {run_id}: {len(pending)} course(s), concurrency {concurrency}")
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bulk-ingest") as pool:
+                for course_id in pending:
+                    pool.submit(self._ingest_one, run_id, course_id, incremental, cancel_event)
+        finally:
+            with self._lock:
+                statuses = [c["status"] for c in run["courses"].values()]
+                if cancel_event.is_set():
+                    run["status"] = "cancelled"
+                elif "failed" in statuses:
+                    run["status"] = "completed_with_errors"
+                else:
+                    run["status"] = "completed"
+                run["finished_at"] = datetime.utcnow().isoformat()
+                self._save(run)
+                self._cancel_events.pop(run_id, None)
+        return self.report(run_id)
+
+    def _update_course(self, run_id: str, course_id: int, **fields: Any) -> None:
+        with self._lock:
+            run = self._runs[run_id]
+            run["courses"][str(course_id)].update(fields)
+            self._save(run)
+
+    def _ingest_one(self, run_id: str, course_id: int, incremental: bool, cancel_event: threading.Event) -> None:
+        if cancel_event.is_set():
+            return
+        with self._lock:
+            attempts = self._runs[run_id]["courses"][str(course_id)].get("attempts", 0) + 1
+        self._update_course(
+            run_id, course_id, status="running", attempts=attempts, error=None,
+            started_at=datetime.utcnow().isoformat(),
+        )
+        started = time.monotonic()
+        fields: Dict[str, Any]
+        try:
+            result = rag_service.ingest_course_content(course_id, incremental=incremental, should_cancel=cancel_event.is_set)
+            fields = {
+                "status": "succeeded",
+                "result": {k: result.get(k) for k in _RESULT_FIELDS if k in result},
+            }
+            for key in ("truncated_files", "skipped_files"):
+                if result.get(key):
+                    fields["result"][key] = len(result[key])
+        except IngestCancelled:
+            fields = {"status": "cancelled"}
+        except Exception as e:
+            print(f"Bulk ingest {run_id}: course {course_id} failed: {e}")
+            fields = {"status": "failed", "error": str(e)}
+        duration_s = round(time.monotonic() - started, 2)
+        self._update_course(run_id, course_id, finished_at=datetime.utcnow().isoformat(), duration_s=duration_s, **fields)
+        print(f"Bulk ingest {run_id}: course {course_id} {fields['status']} in {duration_s}s")
+
+    def cancel(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Stops a running run; courses in progress stop at their next module or batch."""
+        event = self._cancel_events.get(run_id)
+        if event is not None:
+            event.set()
+        return self.report(run_id)
+
+    def report(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """The run state plus a summary: counts per status, wall time and the slowest courses."""
+        with self._lock:
+            run = self._runs.get(run_id) or self._load(run_id)
+            if run is None:
+                return None
+            run = json.loads(json.dumps(run))
+
+        courses = list(run.get("courses", {}).values())
+        counts: Dict[str, int] = {}
+        for course in courses:
+            counts[course["status"]] = counts.get(course["status"], 0) + 1
+        timed = [c for c in courses if c.get("duration_s") is not None]
+        wall_s = None
+        if run.get("started_at"):
+            end = run.get("finished_at") or datetime.utcnow().isoformat()
+            wall_s = round((datetime.fromisoformat(end) - datetime.fromisoformat(run["started_at"])).total_seconds(), 2)
+        run["summary"] = {
+            "total": len(courses),
+            **counts,
+            "wall_time_s": wall_s,
+            "course_time_s": round(sum(c["duration_s"] for c in timed), 2),
+            "slowest": [
+                {"course_id": c["course_id"], "duration_s": c["duration_s"], "status": c["status"]}
+                for c in sorted(timed, key=lambda c: -c["duration_s"])[:10]
+            ],
+            "failures": [
+                {"course_id": c["course_id"], "error": c.get("error")}
+                for c in courses if c["status"] == "failed"
+            ],
+        }
+        return run
+
+    def list_runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        names = sorted(
+            (n for n in os.listdir(self.runs_dir) if n.startswith("run_") and n.endswith(".json")),
+            reverse=True,
+        )[:limit]
+        runs = []
+        for name in names:
+            run = self.report(name[len("run_"):-len(".json")])
+            if run:
+                runs.append({k: run.get(k) for k in ("run_id", "status", "created_at", "finished_at", "summary")})
+        return runs
+
+
+bulk_ingest_service = BulkIngestService()
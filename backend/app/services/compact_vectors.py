@@ -0,0 +1,390 @@
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+COMPACT_OFF = "off"
+COMPACT_QUANTIZATIONS = ("int8", "float16")
+
+# Collection metadata marking collections whose Chroma records carry a placeholder vector.
+COMPACT_COLLECTION_KEY = "vector_storage"
+COMPACT_COLLECTION_VALUE = "compact"
+
+# Chroma requires an embedding per record; compact collections store this one-dimensional
+# placeholder so their HNSW index costs next to nothing.
+_PLACEHOLDER = [0.0]
+
+# SQLite's default limit on bound parameters is 999 on older builds.
+_LOOKUP_BATCH = 500
+# Rows scored per step of the quantized scan, which bounds its float32 temporary.
+_SCAN_BLOCK = 8192
+_LOAD_BATCH = 4096
+
+
+class CompactVectorIndex:
+    """
+    Quantized in-memory copy of a collection's embeddings for low-memory deployments.
+
+    The float32 vectors are stored in SQLite (one file per collection); memory only holds an
+    int8 (per-row scale) or float16 copy plus each vector's squared norm. A search scores the
+    candidate rows on the quantized copy, then re-ranks the best k * rerank_factor of them
+    with their float32 vectors read back from SQLite, so the returned order and distances
+    (squared L2, like Chroma's default space) are exact for the re-ranked candidates.
+
+    Other processes writing the same file (e.g. scripts/bulk_ingest.py) bump a version counter;
+    the in-memory copy is reloaded on the next search when it changed.
+    """
+
+    def __init__(self, db_path: str, quantization: str = "int8", rerank_factor: int = 4):
+        if quantization not in COMPACT_QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}' (expected one of {', '.join(COMPACT_QUANTIZATIONS)})")
+        self.db_path = db_path
+        self.quantization = quantization
+        self.rerank_factor = max(1, int(rerank_factor or 1))
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._version = -1
+        self._dim = 0
+        self._size = 0
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._sq_norms: Optional[np.ndarray] = None
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._init_db()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def _init_db(self) -> None:
+        with self._lock:
+            with self._get_connection() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection) -> int:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.quantization == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _reserve(self, rows: int) -> None:
+        # Caller holds self._lock; grows the arrays geometrically like a list.
+        capacity = 0 if self._codes is None else self._codes.shape[0]
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2, 1024)
+        dtype = np.float16 if self.quantization == "float16" else np.int8
+        codes = np.zeros((capacity, self._dim), dtype=dtype)
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        if self._size:
+            codes[:self._size] = self._codes[:self._size]
+            sq_norms[:self._size] = self._sq_norms[:self._size]
+        self._codes, self._sq_norms = codes, sq_norms
+        if self.quantization == "int8":
+            scales = np.ones(capacity, dtype=np.float32)
+            if self._size:
+                scales[:self._size] = self._scales[:self._size]
+            self._scales = scales
+
+    def _apply_upsert(self, ids: List[str], vectors: np.ndarray) -> None:
+        # Caller holds self._lock.
+        if not self._dim:
+            self._dim = vectors.shape[1]
+        rows = []
+        for chunk_id in ids:
+            row = self._rows.get(chunk_id)
+            if row is None:
+                row = self._size
+                self._reserve(row + 1)
+                self._rows[chunk_id] = row
+                self._ids.append(chunk_id)
+                self._size += 1
+            rows.append(row)
+        codes, scales = self._quantize(vectors)
+        self._codes[rows] = codes
+        self._sq_norms[rows] = np.einsum("ij,ij->i", vectors, vectors)
+        if scales is not None:
+            self._scales[rows] = scales
+
+    def _apply_remove(self, ids: Iterable[str]) -> None:
+        # Caller holds self._lock. Moves the last row into each freed slot.
+        for chunk_id in ids:
+            row = self._rows.pop(chunk_id, None)
+            if row is None:
+                continue
+            last = self._size - 1
+            if row != last:
+                moved = self._ids[last]
+                self._ids[row] = moved
+                self._rows[moved] = row
+                self._codes[row] = self._codes[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                if self._scales is not None:
+                    self._scales[row] = self._scales[last]
+            self._ids.pop()
+            self._size -= 1
+
+    def _load(self) -> None:
+        # Caller holds self._lock. Rows are read one at a time into a reused staging buffer and
+        # the arrays are sized once, so loading does not leave batches of blobs behind in the heap.
+        self._dim, self._size = 0, 0
+        self._ids, self._rows = [], {}
+        self._codes = self._scales = self._sq_norms = None
+        skipped = 0
+        with self._get_connection() as conn:
+            version = int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+            first = conn.execute("SELECT vector FROM vectors LIMIT 1").fetchone()
+            if first:
+                self._dim = len(first[0]) // 4
+                self._reserve(int(conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]))
+                staging = np.empty((_LOAD_BATCH, self._dim), dtype=np.float32)
+                staged: List[str] = []
+                for chunk_id, blob in conn.execute("SELECT id, vector FROM vectors"):
+                    if len(blob) != self._dim * 4:
+                        skipped += 1
+                        continue
+                    staging[len(staged)] = np.frombuffer(blob, dtype=np.float32)
+                    staged.append(chunk_id)
+                    if len(staged) == _LOAD_BATCH:
+                        self._apply_upsert(staged, staging)
+                        staged = []
+                if staged:
+                    self._apply_upsert(staged, staging[:len(staged)])
+        if skipped:
+            print(f"Warning: {skipped} vector(s) in {self.db_path} do not have dimension {self._dim}; ignored")
+        self._version = version
+        self._loaded = True
+
+    def _refresh(self) -> None:
+        # Caller holds self._lock.
+        if self._loaded:
+            with self._get_connection() as conn:
+                version = int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+            if version == self._version:
+                return
+        self._load()
+
+    def upsert(self, ids: List[str], vectors: Any) -> None:
+        """Stores (or replaces) the float32 vectors of `ids`."""
+        if not ids:
+            return
+        matrix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        with self._lock:
+            if self._loaded and self._size and matrix.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match the index dimension {self._dim}")
+            with self._get_connection() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO vectors (id, vector) VALUES (?, ?)",
+                    [(chunk_id, matrix[i].tobytes()) for i, chunk_id in enumerate(ids)],
+                )
+                version = self._bump_version(conn)
+            if self._loaded and version == self._version + 1:
+                self._apply_upsert(list(ids), matrix)
+                self._version = version
+            else:
+                # Another process wrote in between (or nothing is loaded yet): reload on next search.
+                self._loaded = False
+
+    def remove(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            with self._get_connection() as conn:
+                for start in range(0, len(ids), _LOOKUP_BATCH):
+                    batch = ids[start:start + _LOOKUP_BATCH]
+                    conn.execute(f"DELETE FROM vectors WHERE id IN ({','.join('?' * len(batch))})", batch)
+                version = self._bump_version(conn)
+            if self._loaded and version == self._version + 1:
+                self._apply_remove(ids)
+                self._version = version
+            else:
+                self._loaded = False
+
+    def vectors(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """The stored float32 vectors of `ids` (ids without a vector are left out)."""
+        found: Dict[str, np.ndarray] = {}
+        with self._get_connection() as conn:
+            for start in range(0, len(ids), _LOOKUP_BATCH):
+                batch = ids[start:start + _LOOKUP_BATCH]
+                cursor = conn.execute(
+                    f"SELECT id, vector FROM vectors WHERE id IN ({','.join('?' * len(batch))})", batch
+                )
+                for chunk_id, blob in cursor.fetchall():
+                    found[chunk_id] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _approx_distances(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # Squared L2 distance up to the constant |q|^2, computed on the quantized vectors.
+        out = np.empty(rows.size, dtype=np.float32)
+        for start in range(0, rows.size, _SCAN_BLOCK):
+            block = rows[start:start + _SCAN_BLOCK]
+            dots = self._codes[block].astype(np.float32) @ query
+            if self._scales is not None:
+                dots *= self._scales[block]
+            out[start:start + block.size] = self._sq_norms[block] - 2.0 * dots
+        return out
+
+    def search(self, vector: Any, k: int, ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """
+        The k nearest stored vectors to `vector` as (id, squared L2 distance), nearest first,
+        restricted to `ids` when given.
+        """
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        with self._lock:
+            self._refresh()
+            if k <= 0 or not self._size:
+                return []
+            if query.size != self._dim:
+                raise ValueError(f"Query dimension {query.size} does not match the index dimension {self._dim}")
+            if ids is None:
+                rows = np.arange(self._size)
+            else:
+                rows = np.fromiter((self._rows[i] for i in ids if i in self._rows), dtype=np.int64)
+            if not rows.size:
+                return []
+            approx = self._approx_distances(rows, query)
+            candidates = min(rows.size, k * self.rerank_factor)
+            if candidates < rows.size:
+                rows = rows[np.argpartition(approx, candidates - 1)[:candidates]]
+            candidate_ids = [self._ids[row] for row in rows]
+        exact = [
+            (chunk_id, float(np.dot(vec - query, vec - query)))
+            for chunk_id, vec in self.vectors(candidate_ids).items()
+        ]
+        exact.sort(key=lambda hit: hit[1])
+        return exact[:k]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            code_bytes = self._dim * (2 if self.quantization == "float16" else 1)
+            per_chunk = code_bytes + 4 + (4 if self.quantization == "int8" else 0)
+            return {
+                "quantization": self.quantization,
+                "loaded": self._loaded,
+                "chunks": self._size,
+                "dim": self._dim,
+                "memory_bytes_per_chunk": per_chunk if self._dim else 0,
+                "memory_bytes": per_chunk * self._size if self._dim else 0,
+            }
+
+
+class CompactChroma(Chroma):
+    """
+    Chroma wrapper for compact collections: records keep their documents and metadata in Chroma
+    (so get, delete and metadata filters work unchanged) but a one-dimensional placeholder
+    vector, and similarity search runs on a CompactVectorIndex instead of Chroma's HNSW index.
+    """
+
+    def __init__(self, index: CompactVectorIndex, **kwargs: Any):
+        kwargs.setdefault("collection_metadata", {COMPACT_COLLECTION_KEY: COMPACT_COLLECTION_VALUE})
+        super().__init__(**kwargs)
+        self.index = index
+
+    def upsert_vectors(
+        self,
+        ids: List[str],
+        embeddings: Any,
+        documents: List[str],
+        metadatas: Optional[List[Optional[Dict[str, Any]]]] = None,
+    ) -> None:
+        """Writes records with precomputed embeddings (used by add_texts and the migration scripts)."""
+        if not ids:
+            return
+        # The index first: a vector without its Chroma record is never returned by a search.
+        self.index.upsert(ids, embeddings)
+        self._collection.upsert(
+            ids=ids,
+            embeddings=[_PLACEHOLDER] * len(ids),
+            documents=documents,
+            metadatas=[m or None for m in metadatas] if metadatas else None,
+        )
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+        if metadatas is not None and len(metadatas) < len(texts):
+            metadatas = list(metadatas) + [{}] * (len(texts) - len(metadatas))
+        embeddings = self._embedding_function.embed_documents(texts)
+        self.upsert_vectors(list(ids), embeddings, texts, metadatas)
+        return list(ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        super().delete(ids=ids, **kwargs)
+        if ids:
+            self.index.remove(list(ids))
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, str]] = None,
+        where_document: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter, where_document)
+
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, str]] = None,
+        where_document: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter, where_document)]
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, str]] = None,
+        where_document: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        allowed = None
+        if filter or where_document:
+            # Metadata filtering stays in Chroma; only the matching ids are scored.
+            allowed = (self._collection.get(where=filter, where_document=where_document, include=[]) or {}).get("ids") or []
+            if not allowed:
+                return []
+        hits = self.index.search(embedding, k, ids=allowed)
+        if not hits:
+            return []
+        found = self._collection.get(ids=[chunk_id for chunk_id, _ in hits], include=["documents", "metadatas"]) or {}
+        records = {
+            chunk_id: (text, meta)
+            for chunk_id, text, meta in zip(found.get("ids") or [], found.get("documents") or [], found.get("metadatas") or [])
+        }
+        return [
+            (Document(id=chunk_id, page_content=records[chunk_id][0] or "", metadata=records[chunk_id][1] or {}), distance)
+            for chunk_id, distance in hits
+            if chunk_id in records
+        ]
@@ -1,3 +1,4 @@
+import asyncio
 import sqlite3
 import threading
 from datetime import datetime
@@ -50,6 +51,10 @@ class ConversationService:
                     (course_id, student_id, role, content, timestamp),
                 )
 
+    async def aadd_message(self, course_id: int, student_id: int, role: str, content: str) -> None:
+        """add_message for async handlers; the SQLite write runs in a worker thread."""
+        await asyncio.to_thread(self.add_message, course_id, student_id, role, content)
+
     def get_history(self, course_id: int, student_id: int, limit: int = 50) -> List[Dict[str, Any]]:
         with self._lock:
             with self._get_connection() as conn:
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List
+from langchain_core.embeddings import Embeddings
+from app.core.config import settings
+
+EMBEDDING_CACHE_PATH = os.path.join(settings.APP_DATA_DIR, "embedding_cache.db")
+
+# SQLite's default limit on bound parameters is 999 on older builds.
+_LOOKUP_BATCH = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Persistent embedding cache in front of any LangChain Embeddings implementation.
+
+    Vectors are stored in SQLite as float32 blobs keyed by (model_id, sha256(text)), so
+    re-ingesting unchanged chunks or cloned courses skips the embedding model / paid API.
+    Query embeddings are passed straight through.
+    """
+
+    def __init__(self, underlying: Embeddings, model_id: str, db_path: str = EMBEDDING_CACHE_PATH):
+        self.underlying = underlying
+        self.model_id = model_id
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._init_db()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def _init_db(self) -> None:
+        with self._lock:
+            with self._get_connection() as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS embeddings (
+                        model_id TEXT NOT NULL,
+                        text_hash TEXT NOT NULL,
+                        vector BLOB NOT NULL,
+                        PRIMARY KEY (model_id, text_hash)
+                    )
+                    """
+                )
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256((text or "").encode("utf-8", errors="ignore")).hexdigest()
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            with self._get_connection() as conn:
+                for start in range(0, len(hashes), _LOOKUP_BATCH):
+                    batch = hashes[start:start + _LOOKUP_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    cursor = conn.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model_id = ? AND text_hash IN ({placeholders})",
+                        (self.model_id, *batch),
+                    )
+                    for text_hash, blob in cursor.fetchall():
+                        vec = array("f")
+                        vec.frombytes(blob)
+                        found[text_hash] = vec.tolist()
+        return found
+
+    def _store(self, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        rows = [(self.model_id, h, array("f", vec).tobytes()) for h, vec in items.items()]
+        with self._lock:
+            with self._get_connection() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model_id, text_hash, vector) VALUES (?, ?, ?)",
+                    rows,
+                )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [self._hash(t) for t in texts]
+        unique_hashes = list(dict.fromkeys(hashes))
+        try:
+            cached = self._lookup(unique_hashes)
+        except Exception as e:
+            print(f"Warning: embedding cache lookup failed: {e}")
+            cached = {}
+
+        missing: Dict[str, str] = {}
+        for text, h in zip(texts, hashes):
+            if h not in cached and h not in missing:
+                missing[h] = text or ""
+
+        computed: Dict[str, List[float]] = {}
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = {h: list(vec) for h, vec in zip(missing.keys(), vectors)}
+            try:
+                self._store(computed)
+            except Exception as e:
+                print(f"Warning: embedding cache write failed: {e}")
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return [cached[h] if h in cached else computed[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_id": self.model_id,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class QueryEmbeddingMemo(Embeddings):
+    """
+    Keeps the last `max_entries` query embeddings in memory, so one chat question is embedded
+    once for the semantic answer cache and the retrieval. Document embeddings are passed
+    straight through.
+    """
+
+    def __init__(self, underlying: Embeddings, max_entries: int = 256):
+        self.underlying = underlying
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            vector = self._vectors.get(text)
+            if vector is not None:
+                self._vectors.move_to_end(text)
+                self.hits += 1
+                return list(vector)
+            self.misses += 1
+        vector = list(self.underlying.embed_query(text))
+        with self._lock:
+            self._vectors[text] = vector
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+        return list(vector)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._vectors),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
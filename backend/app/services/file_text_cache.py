@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+from app.core.config import settings
+
+FILE_TEXT_CACHE_DIR = os.path.join(settings.APP_DATA_DIR, "file_text_cache")
+
+
+class FileTextCache:
+    """
+    On-disk cache of text extracted from Moodle attachments.
+
+    Text is stored content-addressed (sha256 of the downloaded bytes) in `<hash>.txt` files.
+    A small `<key>.ref` alias keyed by the file URL (without token) plus Moodle's
+    timemodified/filesize/contenthash points at the text, so unchanged files can be served
+    without downloading them at all. Eviction is LRU by file mtime (bumped on every hit)
+    once the total size of cached text exceeds `max_bytes`, and removes the aliases of the
+    evicted texts too.
+
+    Both keys include a `variant` naming the extraction settings (page cap, time budget), and
+    entries can carry a small `<hash>.meta` JSON sidecar (truncation reasons). Lookups
+    return (text, meta).
+    """
+
+    def __init__(self, cache_dir: str = FILE_TEXT_CACHE_DIR, max_bytes: int = 256_000_000):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def source_key(
+        fileurl: str,
+        timemodified: Any = None,
+        filesize: Any = None,
+        contenthash: Any = None,
+        variant: str = "",
+    ) -> Optional[str]:
+        """
+        Key derived from Moodle file metadata. Returns None when Moodle gave us nothing that
+        changes with the file, since the URL alone is not a safe cache key.
+        """
+        if not fileurl or (timemodified is None and contenthash is None):
+            return None
+        payload = json.dumps(
+            [str(fileurl).split("?", 1)[0], timemodified, filesize, contenthash, variant],
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def content_key(data: bytes, variant: str = "") -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        if not variant:
+            return digest
+        return hashlib.sha256(f"{digest}:{variant}".encode("utf-8")).hexdigest()
+
+    def _text_path(self, content_key: str) -> str:
+        return os.path.join(self.cache_dir, f"{content_key}.txt")
+
+    def _ref_path(self, source_key: str) -> str:
+        return os.path.join(self.cache_dir, f"{source_key}.ref")
+
+    def _meta_path(self, content_key: str) -> str:
+        return os.path.join(self.cache_dir, f"{content_key}.meta")
+
+    def _read_text(self, content_key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        path = self._text_path(content_key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: failed to read cached text {path}: {e}")
+            return None
+        meta: Dict[str, Any] = {}
+        try:
+            with open(self._meta_path(content_key), "r") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Warning: failed to read cached text metadata {path}: {e}")
+        return text, meta if isinstance(meta, dict) else {}
+
+    def _record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_by_source(self, source_key: Optional[str]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Looks up text by Moodle metadata key. Misses are not counted here; see get_by_content."""
+        if not self.enabled or not source_key:
+            return None
+        try:
+            with open(self._ref_path(source_key), "r") as f:
+                content_key = f.read().strip()
+        except Exception:
+            return None
+        entry = self._read_text(content_key) if content_key else None
+        if entry is not None:
+            self._record(True)
+        return entry
+
+    def get_by_content(self, content_key: str, source_key: Optional[str] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+        if not self.enabled:
+            return None
+        entry = self._read_text(content_key)
+        self._record(entry is not None)
+        if entry is not None and source_key:
+            self._write_ref(source_key, content_key)
+        return entry
+
+    def _write_ref(self, source_key: str, content_key: str) -> None:
+        try:
+            with open(self._ref_path(source_key), "w") as f:
+                f.write(content_key)
+        except Exception as e:
+            print(f"Warning: failed to write file text cache alias: {e}")
+
+    def put(
+        self,
+        content_key: str,
+        text: str,
+        source_key: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        path = self._text_path(content_key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            # The sidecar goes first so a reader never sees the text without its metadata.
+            meta_path = self._meta_path(content_key)
+            if meta:
+                meta_tmp_path = f"{meta_path}.{threading.get_ident()}.tmp"
+                with open(meta_tmp_path, "w") as f:
+                    json.dump(meta, f)
+                os.replace(meta_tmp_path, meta_path)
+            elif os.path.exists(meta_path):
+                os.remove(meta_path)
+            data = text.encode("utf-8")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Warning: failed to write file text cache entry: {e}")
+            return
+        if source_key:
+            self._write_ref(source_key, content_key)
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += len(data)
+            else:
+                self._total_bytes = self._scan_total_bytes()
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan_total_bytes(self) -> int:
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".txt"):
+                total += entry.stat().st_size
+        return total
+
+    def _evict(self) -> None:
+        # Caller holds self._lock.
+        entries = []
+        ref_paths = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".txt"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+            elif entry.name.endswith(".ref"):
+                ref_paths.append(entry.path)
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        evicted = set()
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                total -= size
+            except Exception as e:
+                print(f"Warning: failed to evict cached text {path}: {e}")
+                continue
+            content_key = os.path.basename(path)[:-len(".txt")]
+            evicted.add(content_key)
+            meta_path = self._meta_path(content_key)
+            if os.path.exists(meta_path):
+                try:
+                    os.remove(meta_path)
+                except Exception:
+                    pass
+        # Aliases of evicted texts would only ever miss; drop them with their targets.
+        if evicted:
+            for ref_path in ref_paths:
+                try:
+                    with open(ref_path, "r") as f:
+                        if f.read().strip() in evicted:
+                            os.remove(ref_path)
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    print(f"Warning: failed to evict file text cache alias {ref_path}: {e}")
+        self._total_bytes = total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "max_bytes": self.max_bytes,
+            }
+
+
+file_text_cache = FileTextCache(max_bytes=settings.FILE_TEXT_CACHE_MAX_BYTES)
@@ -0,0 +1,58 @@
+import re
+from html import unescape
+
+# Elements whose content is never text for the reader; dropped together with their bodies.
+_SKIP_TAGS = ("script", "style", "noscript", "template", "head", "svg")
+_SKIP_RE = re.compile(
+    rf"<({'|'.join(_SKIP_TAGS)})\b[^>]*>.*?(?:</\1\s*>|\Z)|<!--.*?(?:-->|\Z)",
+    re.S | re.I,
+)
+
+_BLOCK_TAGS = (
+    "address|article|aside|blockquote|br|caption|dd|details|div|dl|dt|figcaption|figure|footer|"
+    "form|h[1-6]|header|hr|li|main|nav|ol|p|pre|section|summary|table|tbody|td|tfoot|th|thead|tr|ul"
+)
+# Case-insensitive matching makes this pattern several times slower, so it is only used when
+# the HTML actually contains upper-case tags.
+_BLOCK_RE = re.compile(rf"</?(?:{_BLOCK_TAGS})\b[^>]*>")
+_BLOCK_RE_ANY_CASE = re.compile(rf"</?(?:{_BLOCK_TAGS})\b[^>]*>", re.I)
+_UPPER_TAG_RE = re.compile(r"</?[A-Z]")
+
+# Any remaining tag, doctype or processing instruction. A "<" that does not start a tag
+# (e.g. "a < b") is left in the text.
+_TAG_RE = re.compile(r"<[a-zA-Z/!?][^>]*>")
+
+# Marks block boundaries while tags are stripped; never survives into the output.
+_LINE_BREAK = "\x00"
+
+
+def html_to_text(raw_html: str) -> str:
+    """
+    Converts Moodle HTML (descriptions, page content) to plain text.
+
+    Script/style (and similar) bodies and comments are dropped, block-level elements become
+    line breaks, remaining tags are removed, entities are decoded, and whitespace is collapsed
+    to single spaces with no blank lines. Each step is one precompiled regex pass (or a str
+    method), so the work stays in C regardless of how many tags a page has.
+    """
+    if not raw_html:
+        return ""
+
+    text = raw_html
+    # In HTML, source newlines are plain whitespace and only block elements break lines; text
+    # without any markup keeps its own line breaks.
+    line_break = "\n"
+    if "<" in text:
+        lowered = text.lower()
+        if "<!--" in text or any(f"<{tag}" in lowered for tag in _SKIP_TAGS):
+            text = _SKIP_RE.sub("", text)
+        line_break = _LINE_BREAK
+        text = text.replace(_LINE_BREAK, "")
+        block_re = _BLOCK_RE_ANY_CASE if _UPPER_TAG_RE.search(text) else _BLOCK_RE
+        text = block_re.sub(_LINE_BREAK, text)
+        text = _TAG_RE.sub("", text)
+    if "&" in text:
+        text = unescape(text)
+
+    lines = (" ".join(line.split()) for line in text.split(line_break))
+    return "\n".join(line for line in lines if line)
@@ -0,0 +1,243 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.services.rag_service import rag_service, IngestCancelled
+
+INGEST_JOBS_DB_PATH = os.path.join(settings.APP_DATA_DIR, "ingest_jobs.db")
+
+ACTIVE_STATUSES = ("queued", "running")
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled", "interrupted")
+
+
+class IngestJobConflict(Exception):
+    """The course already has an active job with different options (incremental/rebuild)."""
+
+    def __init__(self, job: Dict[str, Any]):
+        self.job = job
+        mode = "rebuild" if job["rebuild"] else ("incremental" if job["incremental"] else "full")
+        super().__init__(
+            f"Course {job['course_id']} already has a {job['status']} {mode} ingest job ({job['job_id']}); "
+            f"wait for it to finish or cancel it"
+        )
+
+
+class IngestJobService:
+    """
+    Runs course ingestion as background jobs on an in-process worker pool.
+
+    Jobs are persisted in SQLite so their status survives restarts; jobs that were still
+    queued/running when the process died are reported as "interrupted". Submitting the same
+    request (incremental/rebuild) for a course that already has it queued/running returns that
+    job instead of starting a second one; a different request raises IngestJobConflict.
+    """
+
+    # Minimum seconds between progress writes to SQLite for a running job.
+    PROGRESS_FLUSH_INTERVAL_S = 1.0
+
+    def __init__(self, db_path: str = INGEST_JOBS_DB_PATH, max_workers: int = 1):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="ingest-job")
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._last_flush: Dict[str, float] = {}
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._init_db()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self) -> None:
+        with self._lock:
+            with self._get_connection() as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS ingest_jobs (
+                        id TEXT PRIMARY KEY,
+                        course_id INTEGER NOT NULL,
+                        incremental INTEGER NOT NULL,
+                        status TEXT NOT NULL,
+                        progress TEXT,
+                        result TEXT,
+                        error TEXT,
+                        created_at TEXT NOT NULL,
+                        started_at TEXT,
+                        finished_at TEXT
+                    )
+                    """
+                )
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(ingest_jobs)").fetchall()}
+                if "rebuild" not in columns:
+                    conn.execute("ALTER TABLE ingest_jobs ADD COLUMN rebuild INTEGER NOT NULL DEFAULT 0")
+                conn.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS idx_ingest_jobs_course_status
+                    ON ingest_jobs(course_id, status)
+                    """
+                )
+                conn.execute(
+                    """
+                    UPDATE ingest_jobs
+                    SET status = 'interrupted', finished_at = ?, error = 'Server restarted before the job finished'
+                    WHERE status IN ('queued', 'running')
+                    """,
+                    (datetime.utcnow().isoformat(),),
+                )
+
+    def _row_to_job(self, row: sqlite3.Row) -> Dict[str, Any]:
+        def _load(raw: Optional[str]) -> Any:
+            if not raw:
+                return None
+            try:
+                return json.loads(raw)
+            except Exception:
+                return None
+
+        return {
+            "job_id": row["id"],
+            "course_id": row["course_id"],
+            "incremental": bool(row["incremental"]),
+            "rebuild": bool(row["rebuild"]),
+            "status": row["status"],
+            "progress": _load(row["progress"]) or {},
+            "result": _load(row["result"]),
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        if not fields:
+            return
+        for key in ("progress", "result"):
+            if key in fields and fields[key] is not None:
+                fields[key] = json.dumps(fields[key])
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            with self._get_connection() as conn:
+                conn.execute(f"UPDATE ingest_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            with self._get_connection() as conn:
+                row = conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(self, course_id: Optional[int] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM ingest_jobs"
+        params: List[Any] = []
+        if course_id is not None:
+            query += " WHERE course_id = ?"
+            params.append(course_id)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            with self._get_connection() as conn:
+                rows = conn.execute(query, params).fetchall()
+        return [self._row_to_job(r) for r in rows]
+
+    def submit(self, course_id: int, incremental: bool = False, rebuild: bool = False) -> Dict[str, Any]:
+        """
+        Queues an ingestion job for a course, or returns the course's active job if it was submitted
+        with the same options. Raises IngestJobConflict if the active job has other options.
+        """
+        with self._lock:
+            with self._get_connection() as conn:
+                row = conn.execute(
+                    """
+                    SELECT * FROM ingest_jobs
+                    WHERE course_id = ? AND status IN ('queued', 'running')
+                    ORDER BY created_at DESC LIMIT 1
+                    """,
+                    (course_id,),
+                ).fetchone()
+                if row:
+                    job = self._row_to_job(row)
+                    if job["incremental"] != bool(incremental) or job["rebuild"] != bool(rebuild):
+                        raise IngestJobConflict(job)
+                    job["coalesced"] = True
+                    return job
+
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    """
+                    INSERT INTO ingest_jobs (id, course_id, incremental, rebuild, status, progress, created_at)
+                    VALUES (?, ?, ?, ?, 'queued', ?, ?)
+                    """,
+                    (
+                        job_id, course_id, int(bool(incremental)), int(bool(rebuild)),
+                        json.dumps({"stage": "queued"}), datetime.utcnow().isoformat(),
+                    ),
+                )
+            self._cancel_events[job_id] = threading.Event()
+
+        self._executor.submit(self._run, job_id, course_id, incremental, rebuild)
+        job = self.get(job_id) or {"job_id": job_id}
+        job["coalesced"] = False
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.get(job_id)
+        if not job:
+            return None
+        if job["status"] in ACTIVE_STATUSES:
+            event = self._cancel_events.get(job_id)
+            if event is not None:
+                event.set()
+            if job["status"] == "queued":
+                self._update(job_id, status="cancelled", finished_at=datetime.utcnow().isoformat())
+        return self.get(job_id)
+
+    def _run(self, job_id: str, course_id: int, incremental: bool, rebuild: bool = False) -> None:
+        cancel_event = self._cancel_events.get(job_id) or threading.Event()
+        try:
+            current = self.get(job_id)
+            if not current or current["status"] != "queued" or cancel_event.is_set():
+                return
+
+            self._update(job_id, status="running", started_at=datetime.utcnow().isoformat())
+
+            def _on_progress(progress: Dict[str, Any]) -> None:
+                now = time.monotonic()
+                if now - self._last_flush.get(job_id, 0.0) < self.PROGRESS_FLUSH_INTERVAL_S:
+                    return
+                self._last_flush[job_id] = now
+                self._update(job_id, progress=progress)
+
+            try:
+                result = rag_service.ingest_course_content(
+                    course_id,
+                    incremental=incremental,
+                    progress=_on_progress,
+                    should_cancel=cancel_event.is_set,
+                    rebuild=rebuild,
+                )
+                progress = (result or {}).get("progress") or {}
+                self._update(
+                    job_id,
+                    status="succeeded",
+                    progress={**progress, "stage": "done"},
+                    result=result,
+                    finished_at=datetime.utcnow().isoformat(),
+                )
+            except IngestCancelled as e:
+                self._update(job_id, status="cancelled", error=str(e), finished_at=datetime.utcnow().isoformat())
+            except Exception as e:
+                print(f"Ingest job {job_id} for course {course_id} failed: {e}")
+                self._update(job_id, status="failed", error=str(e), finished_at=datetime.utcnow().isoformat())
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+                self._last_flush.pop(job_id, None)
+
+
+ingest_job_service = IngestJobService(max_workers=settings.INGEST_JOB_WORKERS)
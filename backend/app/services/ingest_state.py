@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+from typing import Dict, Any, FrozenSet, List, Optional, Tuple
+from app.core.config import settings
+
+INGEST_STATE_DIR = os.path.join(settings.APP_DATA_DIR, "ingest_state")
+os.makedirs(INGEST_STATE_DIR, exist_ok=True)
+
+
+class IngestStateStore:
+    """
+    Persists per-module fingerprints for each ingested course so re-ingestion can
+    skip modules that did not change in Moodle.
+
+    The state also records the course's active knowledge base generation. A rebuild writes a
+    new generation next to the active one and flips to it by saving the state, which is an
+    atomic file replace; "history" keeps the states of older generations still in the vector
+    store (newest first) so a rebuild can be rolled back.
+
+    State layout (one JSON file per course):
+    {
+        "course_id": 2,
+        "generation": 3,
+        "last_generation": 3,
+        "history": [{"generation": 2, "activated_at": "...", "modules": {...}}],
+        "modules": {
+            "<cmid>": {
+                "cmid": 123,
+                "timemodified": 1700000000,
+                "files": [{"filename": ..., "timemodified": ..., "filesize": ..., "contenthash": ...}],
+                "source_hash": "<sha256 of the Moodle module payload we read>",
+                "content_hash": "<sha256 of the assembled module text>",
+                "complete": true,
+                "chunks": 4,
+                "section_ordinal": 3,
+                "week": 2
+            }
+        }
+    }
+    """
+
+    def __init__(self):
+        # course_id -> ((inode, mtime) of the state file, summary); the active generation and the
+        # week index are read on every retrieval, so the state file is only re-parsed when it
+        # was replaced.
+        self._summary_cache: Dict[int, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+        self._summary_lock = threading.Lock()
+
+    def _get_file_path(self, course_id: int) -> str:
+        return os.path.join(INGEST_STATE_DIR, f"course_{course_id}.json")
+
+    def load(self, course_id: int) -> Dict[str, Any]:
+        file_path = self._get_file_path(course_id)
+        if not os.path.exists(file_path):
+            return {}
+        try:
+            with open(file_path, "r") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            print(f"Error loading ingest state {file_path}: {e}")
+            return {}
+
+    def save(self, course_id: int, state: Dict[str, Any]) -> bool:
+        file_path = self._get_file_path(course_id)
+        tmp_path = f"{file_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, file_path)
+            return True
+        except Exception as e:
+            print(f"Error saving ingest state {file_path}: {e}")
+            return False
+
+    def active_generation(self, course_id: int) -> int:
+        """The knowledge base generation queries of a course should read (0 if never rebuilt)."""
+        return self.generations(course_id)[0]
+
+    def _file_version(self, course_id: int) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self._get_file_path(course_id))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def version(self, course_id: int) -> str:
+        """
+        Changes whenever the course's knowledge base does: every ingest, rebuild and rollback
+        saves the state (an atomic replace) and clear removes it.
+        """
+        version = self._file_version(course_id)
+        if version is None:
+            return "none"
+        return f"{self.active_generation(course_id)}:{version[0]}:{version[1]}"
+
+    def _summary(self, course_id: int) -> Dict[str, Any]:
+        version = self._file_version(course_id)
+        if version is None:
+            return {"generations": (0, 0), "weeks": frozenset()}
+        with self._summary_lock:
+            cached = self._summary_cache.get(course_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        state = self.load(course_id)
+        try:
+            generations = (int(state.get("generation") or 0), int(state.get("last_generation") or 0))
+        except (TypeError, ValueError):
+            generations = (0, 0)
+        weeks = set()
+        for module in (state.get("modules") or {}).values():
+            if isinstance(module, dict) and isinstance(module.get("week"), int) and module.get("chunks"):
+                weeks.add(module["week"])
+        summary = {"generations": generations, "weeks": frozenset(weeks)}
+        with self._summary_lock:
+            self._summary_cache[course_id] = (version, summary)
+        return summary
+
+    def generations(self, course_id: int) -> Tuple[int, int]:
+        """(active generation, highest generation ever activated) of a course."""
+        return self._summary(course_id)["generations"]
+
+    def weeks(self, course_id: int) -> FrozenSet[int]:
+        """
+        Week numbers that have chunks in the course's active generation (from the "week" recorded
+        per module at ingest; modules ingested before weeks were recorded are not counted).
+        """
+        return self._summary(course_id)["weeks"]
+
+    def course_ids(self) -> List[int]:
+        """Courses with an ingest state, most recently ingested first."""
+        courses = []
+        for name in os.listdir(INGEST_STATE_DIR):
+            if not (name.startswith("course_") and name.endswith(".json")):
+                continue
+            try:
+                course_id = int(name[len("course_"):-len(".json")])
+                courses.append((os.path.getmtime(os.path.join(INGEST_STATE_DIR, name)), course_id))
+            except (ValueError, OSError):
+                continue
+        return [course_id for _, course_id in sorted(courses, reverse=True)]
+
+    def clear(self, course_id: int) -> None:
+        file_path = self._get_file_path(course_id)
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except Exception as e:
+            print(f"Error clearing ingest state {file_path}: {e}")
+
+
+ingest_state_store = IngestStateStore()
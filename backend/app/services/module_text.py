@@ -0,0 +1,61 @@
+import hashlib
+from typing import Iterator, List
+
+
+class ModuleTextBuilder:
+    """
+    Assembles the text of one Moodle module from parts in linear time.
+
+    Parts are collected in lists and only joined on demand, instead of growing a single string
+    with `+=`. The text is grouped into sections (module header, each extracted attachment) so
+    the splitter can consume it one section at a time via `iter_sections()`, and the total size
+    is capped at `max_chars` (0 = no cap): once the cap is reached the rest is dropped and
+    `truncated` is set.
+    """
+
+    def __init__(self, max_chars: int = 0):
+        self.max_chars = max(0, int(max_chars or 0))
+        self.length = 0
+        self.truncated = False
+        self._sections: List[List[str]] = [[]]
+
+    def new_section(self) -> None:
+        """Starts a new section; following parts are split separately from the previous ones."""
+        if self._sections[-1]:
+            self._sections.append([])
+
+    def append(self, text: str) -> bool:
+        """Appends text, cutting it at the cap. Returns False once the builder is full."""
+        if self.truncated:
+            return False
+        if not text:
+            return True
+        if self.max_chars and self.length + len(text) > self.max_chars:
+            text = text[: self.max_chars - self.length]
+            self.truncated = True
+        if text:
+            self._sections[-1].append(text)
+            self.length += len(text)
+        return not self.truncated
+
+    def line(self, text: str) -> bool:
+        """Appends text followed by a newline (kept as separate parts to avoid copying `text`)."""
+        if not self.append(text):
+            return False
+        return self.append("\n")
+
+    def iter_sections(self) -> Iterator[str]:
+        for parts in self._sections:
+            if parts:
+                yield "".join(parts)
+
+    def build(self) -> str:
+        return "".join(part for parts in self._sections for part in parts)
+
+    def content_hash(self) -> str:
+        """sha256 of build(), computed without materializing the joined text."""
+        digest = hashlib.sha256()
+        for parts in self._sections:
+            for part in parts:
+                digest.update(part.encode("utf-8", errors="ignore"))
+        return digest.hexdigest()
@@ -1,68 +1,153 @@
+import asyncio
+import httpx
 import requests
+import threading
 import time
 import random
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set, Tuple
 from app.core.config import settings
 
+class RateLimiter:
+    """
+    Thread-safe token bucket: `rate_per_s` requests per second on average with bursts of up to
+    `burst`. A rate of 0 disables limiting.
+    """
+    def __init__(self, rate_per_s: float, burst: int = 1):
+        self.rate_per_s = max(0.0, float(rate_per_s or 0))
+        self.capacity = max(1.0, float(burst or 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Takes a token and returns 0, or returns how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_s)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate_per_s
+
+    def acquire(self) -> None:
+        if self.rate_per_s <= 0:
+            return
+        while True:
+            wait_s = self._take()
+            if wait_s <= 0:
+                return
+            time.sleep(wait_s)
+
+    async def aacquire(self) -> None:
+        """Same budget as acquire(), but waits without blocking the event loop."""
+        if self.rate_per_s <= 0:
+            return
+        while True:
+            wait_s = self._take()
+            if wait_s <= 0:
+                return
+            await asyncio.sleep(wait_s)
+
+
+def _flatten_params(params: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """
+    Moodle's REST server expects nested arguments as form keys like criteria[0][key]; plain form
+    encoding would send the str() of nested lists/dicts instead.
+    """
+    flat: Dict[str, Any] = {}
+    for key, value in params.items():
+        name = f"{prefix}[{key}]" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(_flatten_params(value, name))
+        elif isinstance(value, (list, tuple)):
+            flat.update(_flatten_params({i: v for i, v in enumerate(value)}, name))
+        else:
+            flat[name] = value
+    return flat
+
 class MoodleClient:
     def __init__(self):
         self.url = settings.MOODLE_URL
         self.token = settings.MOODLE_TOKEN
         self.rest_endpoint = f"{self.url}/webservice/rest/server.php"
+        # Shared cap on in-flight requests to Moodle across all threads (ingest jobs, forum
+        # prefetch, attachment downloads). Held only while a request is on the wire, not
+        # during retry backoff.
+        self.max_concurrency = max(1, int(settings.MOODLE_MAX_CONCURRENCY))
+        self._request_slots = threading.BoundedSemaphore(self.max_concurrency)
+        # Shared request-rate budget, so bulk/concurrent ingestion cannot flood Moodle.
+        self.rate_limiter = RateLimiter(settings.MOODLE_RATE_LIMIT_PER_S, settings.MOODLE_RATE_LIMIT_BURST)
+        # The async request path (chat endpoints) gets its own HTTP connection pool and in-flight
+        # cap, created on first use inside the running event loop.
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_http: Optional[httpx.AsyncClient] = None
+        self._async_request_slots: Optional[asyncio.Semaphore] = None
+        self._async_closing: Set[asyncio.Task] = set()
         print(f"MoodleClient initialized with URL: {self.url}")
         print("MoodleClient initialized with Token: [REDACTED]")
 
-    def _call_moodle(self, function_name: str, params: Dict[str, Any] = None, method: str = "POST") -> Any:
-        """
-        Generic method to call Moodle Web Service API.
-        """
-        if params is None:
-            params = {}
+    _headers = {
+        "User-Agent": "TeacherTutorAI/1.0",
+        "Accept": "application/json"
+    }
 
+    def _payload(self, function_name: str, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         token = settings.MOODLE_TOKEN
         if not token:
             raise RuntimeError("MOODLE_TOKEN is not configured. Set MOODLE_TOKEN in the backend environment to enable Moodle sync.")
-            
-        payload = {
+
+        return {
             "wstoken": token,
             "wsfunction": function_name,
             "moodlewsrestformat": "json",
-            **params
-        }
-        
-        headers = {
-            "User-Agent": "TeacherTutorAI/1.0",
-            "Accept": "application/json"
+            **_flatten_params(params or {})
         }
 
+    @staticmethod
+    def _check_response_data(data: Any) -> Any:
+        if isinstance(data, dict) and data.get("exception"):
+            errorcode = data.get("errorcode") or "moodle_exception"
+            message = data.get("message") or data.get("exception") or "Moodle API error"
+            raise RuntimeError(f"Moodle API error ({errorcode}): {message}")
+        return data
+
+    @staticmethod
+    def _retry_after_s(response: Any, attempt: int, base_delay_s: float) -> float:
+        retry_after = response.headers.get("Retry-After")
+        try:
+            wait_s = float(retry_after) if retry_after is not None else None
+        except Exception:
+            wait_s = None
+        if wait_s is None:
+            wait_s = (base_delay_s * (2 ** attempt)) + random.uniform(0, 0.35)
+        return max(0.2, min(wait_s, 20.0))
+
+    def _call_moodle(self, function_name: str, params: Dict[str, Any] = None, method: str = "POST") -> Any:
+        """
+        Generic method to call Moodle Web Service API.
+        """
+        payload = self._payload(function_name, params)
+        headers = self._headers
+
         max_retries = 4
         base_delay_s = 1.2
 
         for attempt in range(max_retries):
             try:
-                if method.upper() == "GET":
-                    response = requests.get(self.rest_endpoint, params=payload, headers=headers)
-                else:
-                    response = requests.post(self.rest_endpoint, data=payload, headers=headers)
+                self.rate_limiter.acquire()
+                with self._request_slots:
+                    if method.upper() == "GET":
+                        response = requests.get(self.rest_endpoint, params=payload, headers=headers)
+                    else:
+                        response = requests.post(self.rest_endpoint, data=payload, headers=headers)
 
                 if response.status_code == 429:
-                    retry_after = response.headers.get("Retry-After")
-                    try:
-                        wait_s = float(retry_after) if retry_after is not None else None
-                    except Exception:
-                        wait_s = None
-                    if wait_s is None:
-                        wait_s = (base_delay_s * (2 ** attempt)) + random.uniform(0, 0.35)
-                    time.sleep(max(0.2, min(wait_s, 20.0)))
+                    time.sleep(self._retry_after_s(response, attempt, base_delay_s))
                     continue
 
                 response.raise_for_status()
-                data = response.json()
-                if isinstance(data, dict) and data.get("exception"):
-                    errorcode = data.get("errorcode") or "moodle_exception"
-                    message = data.get("message") or data.get("exception") or "Moodle API error"
-                    raise RuntimeError(f"Moodle API error ({errorcode}): {message}")
-                return data
+                return self._check_response_data(response.json())
             except requests.RequestException as e:
                 status = getattr(getattr(e, "response", None), "status_code", None)
                 if attempt < (max_retries - 1) and status in (429, 502, 503, 504):
@@ -71,6 +156,75 @@ class MoodleClient:
                 print(f"Error calling Moodle API ({method}): {e}")
                 raise
 
+    def _async_state(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            stale_loop, stale_http = self._async_loop, self._async_http
+            self._async_loop = loop
+            self._async_http = httpx.AsyncClient(timeout=30.0, headers=self._headers)
+            self._async_request_slots = asyncio.Semaphore(self.max_concurrency)
+            if stale_http is not None:
+                # The previous loop's pool is closed in the background instead of leaking its sockets.
+                task = loop.create_task(self._aclose_http(stale_http, stale_loop))
+                self._async_closing.add(task)
+                task.add_done_callback(self._async_closing.discard)
+        return self._async_http, self._async_request_slots
+
+    @staticmethod
+    async def _aclose_http(client: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        # A pool whose loop still runs (in another thread) is closed on that loop; once the loop
+        # has stopped, it can be closed from any loop.
+        try:
+            if loop is not None and loop.is_running() and loop is not asyncio.get_running_loop():
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.aclose(), loop))
+            else:
+                await client.aclose()
+        except Exception as e:
+            print(f"Warning: closing Moodle async HTTP client failed: {e}")
+
+    async def aclose(self) -> None:
+        """Closes the async connection pool (app shutdown); a later async call opens a new one."""
+        client, loop = self._async_http, self._async_loop
+        self._async_loop = self._async_http = self._async_request_slots = None
+        if client is not None:
+            await self._aclose_http(client, loop)
+        if self._async_closing:
+            await asyncio.gather(*self._async_closing, return_exceptions=True)
+
+    async def _acall_moodle(self, function_name: str, params: Dict[str, Any] = None, method: str = "POST") -> Any:
+        """
+        Async variant of _call_moodle for request handlers: same payload, rate budget and retry
+        policy, but waits on the network and on backoff without holding a worker thread.
+        """
+        payload = self._payload(function_name, params)
+        client, request_slots = self._async_state()
+
+        max_retries = 4
+        base_delay_s = 1.2
+
+        for attempt in range(max_retries):
+            try:
+                await self.rate_limiter.aacquire()
+                async with request_slots:
+                    if method.upper() == "GET":
+                        response = await client.get(self.rest_endpoint, params=payload)
+                    else:
+                        response = await client.post(self.rest_endpoint, data=payload)
+
+                if response.status_code == 429:
+                    await asyncio.sleep(self._retry_after_s(response, attempt, base_delay_s))
+                    continue
+
+                response.raise_for_status()
+                return self._check_response_data(response.json())
+            except httpx.HTTPError as e:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                if attempt < (max_retries - 1) and status in (429, 502, 503, 504):
+                    await asyncio.sleep((base_delay_s * (2 ** attempt)) + random.uniform(0, 0.35))
+                    continue
+                print(f"Error calling Moodle API ({method}): {e}")
+                raise
+
     def get_site_info(self) -> Dict[str, Any]:
         """
         Get Moodle site information.
@@ -300,20 +454,30 @@ class MoodleClient:
             
         try:
             print(f"Downloading file from Moodle: {file_url}")
-            response = requests.get(url_with_token, stream=True, timeout=30)
-            response.raise_for_status()
-            if max_bytes is None:
-                return response.content
-
-            data = bytearray()
-            for chunk in response.iter_content(chunk_size=64 * 1024):
-                if not chunk:
-                    continue
-                data.extend(chunk)
-                if len(data) > max_bytes:
+            self.rate_limiter.acquire()
+            with self._request_slots, requests.get(url_with_token, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                if max_bytes is None:
+                    return response.content
+
+                # Reject early when the server announces a size over the limit.
+                try:
+                    declared = int(response.headers.get("Content-Length") or 0)
+                except (TypeError, ValueError):
+                    declared = 0
+                if declared > max_bytes:
                     print(f"Skipped file download (over {max_bytes} bytes): {file_url}")
                     return None
-            return bytes(data)
+
+                data = bytearray()
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    if not chunk:
+                        continue
+                    data.extend(chunk)
+                    if len(data) > max_bytes:
+                        print(f"Skipped file download (over {max_bytes} bytes): {file_url}")
+                        return None
+                return bytes(data)
         except requests.RequestException as e:
             print(f"Error downloading file {file_url}: {e}")
             return None
@@ -360,5 +524,8 @@ class MockMoodleClient(MoodleClient):
             ]
         return {}
 
+    async def _acall_moodle(self, function_name: str, params: Dict[str, Any] = None, method: str = "POST") -> Any:
+        return self._call_moodle(function_name, params, method)
+
 # Use Mock client if connection fails or explicitly requested
 moodle_client = MoodleClient() if not settings.ENABLE_MOCK_MOODLE else MockMoodleClient()
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import re
@@ -125,13 +126,7 @@ class QuizService:
             
         return updated_quiz
 
-    def get_student_quiz(self, course_id: int, topic: str) -> Dict[str, Any]:
-        """
-        Tries to find an APPROVED quiz for the topic.
-        If none found, generates one on the fly (and marks it as auto-approved or transient).
-        For this implementation, we will generate on fly if no approved quiz exists, 
-        but we won't save it to the bank to avoid cluttering with unreviewed content.
-        """
+    def _approved_quiz(self, course_id: int, topic: str) -> Optional[Dict[str, Any]]:
         # 1. Try to find an approved quiz matching the topic (fuzzy match or exact?)
         # For simplicity, we filter by topic substring or just pick a random approved one if topic is "General"
         approved = self.get_quizzes(course_id, status="approved")
@@ -153,27 +148,54 @@ class QuizService:
                 if requested in qt or qt in requested:
                     candidates.append(q)
 
-        if candidates:
-            import random
-            selected = random.choice(candidates)
-            return {
-                "question": selected["question"],
-                "options": selected["options"],
-                "correct_answer": selected["correct_answer"],
-                "explanation": selected["explanation"],
-                "hint": selected["hint"],
-                "origin": "approved",
-                "requested_topic": topic,
-                "matched_topic": selected.get("topic"),
-            }
-            
-        # 2. Fallback: Generate on the fly
-        print(f"No approved quiz found for topic '{topic}', generating on the fly...")
-        quiz = rag_service.generate_quiz(course_id, topic, diversity_token=str(uuid.uuid4()))
+        if not candidates:
+            return None
+        import random
+        selected = random.choice(candidates)
+        return {
+            "question": selected["question"],
+            "options": selected["options"],
+            "correct_answer": selected["correct_answer"],
+            "explanation": selected["explanation"],
+            "hint": selected["hint"],
+            "origin": "approved",
+            "requested_topic": topic,
+            "matched_topic": selected.get("topic"),
+        }
+
+    @staticmethod
+    def _on_the_fly_quiz(quiz: Any, topic: str) -> Any:
         if isinstance(quiz, dict):
             quiz["origin"] = "rag"
             quiz["requested_topic"] = topic
             quiz["matched_topic"] = None
         return quiz
 
+    def get_student_quiz(self, course_id: int, topic: str) -> Dict[str, Any]:
+        """
+        Tries to find an APPROVED quiz for the topic.
+        If none found, generates one on the fly (and marks it as auto-approved or transient).
+        For this implementation, we will generate on fly if no approved quiz exists, 
+        but we won't save it to the bank to avoid cluttering with unreviewed content.
+        """
+        approved = self._approved_quiz(course_id, topic)
+        if approved is not None:
+            return approved
+
+        # Fallback: Generate on the fly
+        print(f"No approved quiz found for topic '{topic}', generating on the fly...")
+        quiz = rag_service.generate_quiz(course_id, topic, diversity_token=str(uuid.uuid4()))
+        return self._on_the_fly_quiz(quiz, topic)
+
+    async def aget_student_quiz(self, course_id: int, topic: str) -> Dict[str, Any]:
+        """Async variant of get_student_quiz."""
+        approved = await asyncio.to_thread(self._approved_quiz, course_id, topic)
+        if approved is not None:
+            return approved
+
+        print(f"No approved quiz found for topic '{topic}', generating on the fly...")
+        service = await rag_service.aget()
+        quiz = await service.agenerate_quiz(course_id, topic, diversity_token=str(uuid.uuid4()))
+        return self._on_the_fly_quiz(quiz, topic)
+
 quiz_service = QuizService()
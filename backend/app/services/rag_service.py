@@ -1,83 +1,133 @@
 import re
-import io
+import asyncio
+import json
+import importlib.util
 from urllib.parse import urlparse
 from datetime import datetime
 import hashlib
-import math
-try:
-    from pypdf import PdfReader
-except ImportError:
-    PdfReader = None
+import threading
+import time
+# Attachments are parsed in worker processes (see attachment_extractor); here we only need to
+# know whether the parsers are installed, which does not require importing them.
+PDF_SUPPORT = importlib.util.find_spec("pypdf") is not None
+if not PDF_SUPPORT:
     print("Warning: pypdf not installed. PDF parsing will be disabled.")
-
-try:
-    import docx
-except ImportError:
-    docx = None
+DOCX_SUPPORT = importlib.util.find_spec("docx") is not None
+if not DOCX_SUPPORT:
     print("Warning: python-docx not installed. DOCX parsing will be disabled.")
 
-from typing import List, Dict, Any, Optional
-from langchain_community.vectorstores import Chroma
-from langchain_ollama import OllamaEmbeddings, ChatOllama
-from langchain_community.embeddings import FastEmbedEmbeddings # Lightweight CPU embeddings
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple, Callable, AsyncIterator, TYPE_CHECKING
 from langchain_core.embeddings import Embeddings
-try:
-    from langchain_mistralai import MistralAIEmbeddings, ChatMistralAI
-except ImportError:
-    print("Warning: langchain-mistralai not installed. Mistral API mode will fail if selected.")
-
-try:
-    from langchain_groq import ChatGroq
-    # Groq doesn't have native embeddings yet, usually uses HuggingFace or others.
-    # We will use OllamaEmbeddings or fallback to a lightweight one if needed.
-except ImportError:
-    print("Warning: langchain-groq not installed. Groq mode will fail if selected.")
-
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import RetrievalQA
-from langchain.schema import Document
-from langchain.prompts import PromptTemplate
+from langchain_core.documents import Document
+from langchain_core.prompts import PromptTemplate
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+# Provider SDKs (Ollama, Mistral, Groq, FastEmbed), the text splitter, Chroma and the QA chain
+# are imported where they are first used, so importing this module (and starting the API)
+# does not pay for them.
 from app.core.config import settings
-from app.services.moodle_client import moodle_client
+from app.services.moodle_client import MoodleClient, moodle_client
 from app.services.student_service import student_service
+from app.services.ingest_state import ingest_state_store
+from app.services.attachment_extractor import AttachmentExtractor, AttachmentJob, AttachmentResult, attachment_kind
+from app.services.file_text_cache import file_text_cache
+from app.services.answer_cache import answer_cache, student_fingerprint
+from app.services.semantic_cache import semantic_cache
+from app.services.retrieval_cache import retrieval_cache
+from app.services.embedding_cache import CachedEmbeddings, QueryEmbeddingMemo
+from app.services.module_text import ModuleTextBuilder
+from app.services.html_text import html_to_text
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import Chroma
 
 class HashEmbeddings(Embeddings):
+    """
+    Deterministic offline embeddings (no model): each text maps to a unit vector built from
+    chained SHA-256 digests of the text, scaled from bytes to [-1, 1]. Used when no embedding
+    model is available and by tests/benchmarks.
+
+    Texts are embedded in bulk: the digests of a batch are joined into one buffer, and scaling
+    and normalization run as NumPy array operations. The values are identical to the original
+    per-value Python loop (the norm is accumulated left to right like sum()).
+    """
     def __init__(self, dim: int = 384):
         self.dim = dim
+        self._counters = [i.to_bytes(4, "little") for i in range(-(-dim // 32))]
+
+    def _vectors(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) float64 unit vectors."""
+        sha256 = hashlib.sha256
+        counters = self._counters
+        digests = b"".join(
+            sha256(base + counter).digest()
+            for base in (sha256((t or "").encode("utf-8", errors="ignore")).digest() for t in texts)
+            for counter in counters
+        )
+        values = np.frombuffer(digests, dtype=np.uint8).reshape(len(texts), len(counters) * 32)[:, :self.dim]
+        values = values / 127.5 - 1.0
+        # cumsum adds left to right, matching the rounding of sum() over the same values.
+        norms = np.sqrt(np.cumsum(values * values, axis=1)[:, -1]) if len(texts) else np.zeros(0)
+        norms[norms == 0] = 1.0
+        return values / norms[:, None]
 
-    def _embed(self, text: str) -> List[float]:
-        base = hashlib.sha256(text.encode("utf-8", errors="ignore")).digest()
-        vec: List[float] = []
-        counter = 0
-        while len(vec) < self.dim:
-            h = hashlib.sha256(base + counter.to_bytes(4, "little")).digest()
-            for b in h:
-                vec.append((b / 127.5) - 1.0)
-                if len(vec) >= self.dim:
-                    break
-            counter += 1
-        norm = math.sqrt(sum(x * x for x in vec)) or 1.0
-        return [x / norm for x in vec]
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embeds texts into a C-contiguous (len(texts), dim) float32 array."""
+        return np.ascontiguousarray(self._vectors(texts), dtype=np.float32)
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return [self._embed(t or "") for t in texts]
+        return self._vectors(texts).tolist()
 
     def embed_query(self, text: str) -> List[float]:
-        return self._embed(text or "")
+        return self._vectors([text])[0].tolist()
+
+class CachedRetriever(BaseRetriever):
+    """Retriever for RetrievalQA that searches through RAGService._search (the shared retrieval cache)."""
+
+    service: Any
+    course_id: int
+    filter_where: Dict[str, Any]
+    k: int = 6
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.service._search(self.course_id, query, self.k, self.filter_where)
+
+
+class IngestCancelled(Exception):
+    """Raised by ingest_course_content when its should_cancel callback returns True."""
+
 
 class RAGService:
-    def __init__(self):
+    def __init__(
+        self,
+        embeddings: Optional[Embeddings] = None,
+        llm: Optional[Any] = None,
+        persist_directory: Optional[str] = None,
+        moodle: Optional[MoodleClient] = None,
+    ):
+        """
+        Builds the LLM and embeddings for settings.LLM_PROVIDER. `embeddings`, `llm`,
+        `persist_directory` and `moodle` replace the configured embeddings, LLM, Chroma directory
+        and Moodle client (used by benchmarks and scripts that run against a synthetic course).
+        """
+        self.moodle = moodle or moodle_client
+        injected_embeddings = embeddings
         # Initialize LLM and Embeddings based on Provider
         if settings.LLM_PROVIDER == "mistral_api":
             if not settings.MISTRAL_API_KEY:
                 raise ValueError("MISTRAL_API_KEY is required when using 'mistral_api' provider.")
             
             print("Initializing RAG with Mistral AI API...")
-            self.embeddings = MistralAIEmbeddings(
-                mistral_api_key=settings.MISTRAL_API_KEY,
-                model="mistral-embed"
-            )
-            self.llm = ChatMistralAI(
+            from langchain_mistralai import MistralAIEmbeddings, ChatMistralAI
+            if injected_embeddings is None:
+                self.embeddings = MistralAIEmbeddings(
+                    mistral_api_key=settings.MISTRAL_API_KEY,
+                    model="mistral-embed"
+                )
+                embedding_model_id = "mistral:mistral-embed"
+            self.llm = llm or ChatMistralAI(
                 mistral_api_key=settings.MISTRAL_API_KEY,
                 model=settings.MODEL_NAME, # e.g., "mistral-small-latest"
                 temperature=0.7
@@ -91,20 +141,28 @@ class RAGService:
             # We use FastEmbedEmbeddings which is extremely lightweight and faster than HuggingFace/PyTorch.
             # This allows deployment on 512MB RAM instances (like Render Free Tier).
             
-            try:
-                self.embeddings = FastEmbedEmbeddings(model_name="BAAI/bge-small-en-v1.5")
-            except Exception as e:
-                print(f"Warning: FastEmbedEmbeddings unavailable: {e}")
+            if injected_embeddings is None:
                 try:
-                    self.embeddings = OllamaEmbeddings(
-                        base_url=settings.OLLAMA_BASE_URL,
-                        model=settings.MODEL_NAME
-                    )
-                except Exception as e2:
-                    print(f"Warning: OllamaEmbeddings unavailable: {e2}")
-                    self.embeddings = HashEmbeddings()
+                    from langchain_community.embeddings import FastEmbedEmbeddings
+                    self.embeddings = FastEmbedEmbeddings(model_name="BAAI/bge-small-en-v1.5")
+                    embedding_model_id = "fastembed:BAAI/bge-small-en-v1.5"
+                except Exception as e:
+                    print(f"Warning: FastEmbedEmbeddings unavailable: {e}")
+                    try:
+                        from langchain_ollama import OllamaEmbeddings
+                        self.embeddings = OllamaEmbeddings(
+                            base_url=settings.OLLAMA_BASE_URL,
+                            model=settings.MODEL_NAME
+                        )
+                        embedding_model_id = f"ollama:{settings.MODEL_NAME}"
+                    except Exception as e2:
+                        print(f"Warning: OllamaEmbeddings unavailable: {e2}")
+                        self.embeddings = HashEmbeddings()
+                        embedding_model_id = f"hash:{self.embeddings.dim}"
             
-            self.llm = ChatGroq(
+            if llm is None:
+                from langchain_groq import ChatGroq
+            self.llm = llm or ChatGroq(
                 groq_api_key=settings.GROQ_API_KEY,
                 model_name=settings.MODEL_NAME, # e.g., "llama3-8b-8192"
                 temperature=0.7
@@ -112,65 +170,654 @@ class RAGService:
         else:
             # Default to Ollama (Local)
             print("Initializing RAG with Local Ollama...")
-            self.embeddings = OllamaEmbeddings(
-                base_url=settings.OLLAMA_BASE_URL,
-                model=settings.MODEL_NAME
-            )
-            self.llm = ChatOllama(
+            from langchain_ollama import OllamaEmbeddings, ChatOllama
+            if injected_embeddings is None:
+                self.embeddings = OllamaEmbeddings(
+                    base_url=settings.OLLAMA_BASE_URL,
+                    model=settings.MODEL_NAME
+                )
+                embedding_model_id = f"ollama:{settings.MODEL_NAME}"
+            self.llm = llm or ChatOllama(
                 base_url=settings.OLLAMA_BASE_URL,
                 model=settings.MODEL_NAME,
                 temperature=0.7
             )
+
+        if injected_embeddings is not None:
+            self.embeddings = injected_embeddings
+            if isinstance(injected_embeddings, HashEmbeddings):
+                embedding_model_id = f"hash:{injected_embeddings.dim}"
+            else:
+                embedding_model_id = f"custom:{type(injected_embeddings).__name__}"
+
+        # Persistent embedding cache keyed by (model id, chunk text hash), so repeat ingests and
+        # cloned courses don't re-embed identical chunks.
+        self.embedding_cache: Optional[CachedEmbeddings] = None
+        if settings.EMBEDDING_CACHE_ENABLED:
+            try:
+                self.embedding_cache = CachedEmbeddings(self.embeddings, embedding_model_id)
+                self.embeddings = self.embedding_cache
+            except Exception as e:
+                print(f"Warning: embedding cache unavailable: {e}")
+        # A chat question is embedded by the semantic answer cache and by the retrieval; the memo
+        # makes that one model call.
+        self.embeddings = QueryEmbeddingMemo(self.embeddings)
         
         # Initialize Vector Store (ChromaDB)
-        # Persistent storage directory is configurable for deployments (e.g., Render disk mount)
-        self.vector_store = Chroma(
-            persist_directory=settings.CHROMA_PERSIST_DIR,
-            embedding_function=self.embeddings,
-            collection_name="moodle_content"
+        # Persistent storage directory is configurable for deployments (e.g., Render disk mount).
+        # Course chunks are read and written through self._store(course_id), which resolves the
+        # course's collection for VECTOR_STORE_LAYOUT; self.vector_store is the shared collection.
+        from app.services.vector_store_registry import VectorStoreRegistry
+        self.vector_stores = VectorStoreRegistry(
+            self.embeddings,
+            persist_directory or settings.CHROMA_PERSIST_DIR,
+            layout=settings.VECTOR_STORE_LAYOUT,
+            shards=settings.VECTOR_STORE_COURSE_SHARDS,
+            compact_mode=settings.VECTOR_COMPACT_MODE,
+            rerank_factor=settings.VECTOR_COMPACT_RERANK_FACTOR,
         )
+        self.vector_store = self.vector_stores.shared()
         
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200
         )
 
+        self._course_locks: Dict[int, threading.Lock] = {}
+        self._course_locks_guard = threading.Lock()
+
+    def _store(self, course_id: int, write: bool = False) -> "Chroma":
+        """The vector store (collection) holding a course's chunks; write=True before adding any."""
+        return self.vector_stores.for_course(course_id, write=write)
+
+    def _course_lock(self, course_id: int) -> threading.Lock:
+        with self._course_locks_guard:
+            return self._course_locks.setdefault(course_id, threading.Lock())
+
     def _clean_html(self, raw_html: str) -> str:
-        """Helper to strip HTML tags from Moodle content."""
-        if not raw_html:
-            return ""
-        cleanr = re.compile('<.*?>')
-        cleantext = re.sub(cleanr, '', raw_html)
-        return cleantext.strip()
+        """Helper to convert Moodle HTML content to plain text."""
+        return html_to_text(raw_html)
 
-    def ingest_course_content(self, course_id: int) -> Dict[str, Any]:
+    def _module_fingerprint(self, section_name: str, module: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Fetches content from Moodle (or Mock), chunks it, and stores in Vector DB.
+        Builds a cheap fingerprint of a module from core_course_get_contents metadata,
+        used to decide whether a module must be re-downloaded and re-embedded.
         """
-        print(f"Ingesting content for course {course_id}...")
+        files = []
+        for item in module.get("contents") or []:
+            if not isinstance(item, dict):
+                continue
+            fileurl = str(item.get("fileurl") or "")
+            files.append(
+                {
+                    "filename": item.get("filename"),
+                    "fileurl": fileurl.split("?", 1)[0],
+                    "timemodified": item.get("timemodified"),
+                    "filesize": item.get("filesize"),
+                    "contenthash": item.get("contenthash"),
+                    "content_sha256": hashlib.sha256(str(item.get("content") or "").encode("utf-8", errors="ignore")).hexdigest(),
+                }
+            )
+        source = {
+            "section": section_name,
+            "name": module.get("name"),
+            "modname": module.get("modname"),
+            "url": module.get("url"),
+            "description": module.get("description"),
+            "dates": module.get("dates"),
+            "timemodified": module.get("timemodified"),
+            "files": files,
+        }
+        source_hash = hashlib.sha256(json.dumps(source, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return {
+            "cmid": module.get("id"),
+            "timemodified": module.get("timemodified"),
+            "files": [
+                {k: f[k] for k in ("filename", "timemodified", "filesize", "contenthash")}
+                for f in files
+                if f.get("filename")
+            ],
+            "source_hash": source_hash,
+        }
+
+    @staticmethod
+    def _section_metadata(section: Dict[str, Any], section_index: int) -> Dict[str, Any]:
+        """
+        Section ordinal (Moodle's section number, else its position) and the week number parsed
+        from the section name ("Week 3", "Week 3: Sorting", "Weeks 3-4" -> 3; None if there is none).
+        """
+        ordinal = section.get("section")
+        if not isinstance(ordinal, int):
+            ordinal = section_index
+        match = re.search(r"\bweeks?\s*(\d+)\b", str(section.get("name") or ""), flags=re.IGNORECASE)
+        return {"section_ordinal": ordinal, "week": int(match.group(1)) if match else None}
+
+    @staticmethod
+    def _same_section(previous: Dict[str, Any], section_meta: Dict[str, Any]) -> bool:
+        return all(k in previous and previous[k] == section_meta[k] for k in ("section_ordinal", "week"))
+
+    def _build_module_text(
+        self,
+        course_id: int,
+        section_name: str,
+        module: Dict[str, Any],
+        attachments: Optional[Dict[int, AttachmentResult]] = None,
+        forum_discussions: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[ModuleTextBuilder, Dict[str, Any], bool]:
+        """
+        Assembles the text of a single Moodle module (description, page content, forum titles,
+        extracted PDF/DOCX attachments), capped at MAX_MODULE_TEXT_CHARS.
+        `attachments` maps the index of each file entry in module["contents"] to its extraction result,
+        and `forum_discussions` holds prefetched discussions for forum modules (fetched here if None).
+        Returns the text builder (one section for the module itself plus one per extracted attachment),
+        the chunk metadata, and whether every attachment was read successfully. Attachments that
+        were truncated or skipped by the extraction limits count as read; their filenames and
+        reasons are listed in the `truncated_files`/`skipped_files` metadata.
+        """
+        complete = True
+        attachments = attachments or {}
+        truncated_files: List[str] = []
+        skipped_files: List[str] = []
+        mod_name = module.get("name", "Unnamed Module")
+        mod_type = module.get("modname", "unknown")
         
-        # 0. Clear existing content for this course to prevent duplicates
-        try:
-            # Note: Chroma's delete might throw if collection is empty or other issues, so we wrap in try/except
-            print(f"Clearing existing vector data for course {course_id}...")
-            # We need to get ids to delete, or use where clause if supported by the wrapper
-            # LangChain's Chroma wrapper .delete() expects IDs. 
-            # So we first get all IDs for this course.
-            
-            # Using the underlying client to get IDs
-            existing_docs = self.vector_store.get(where={"course_id": course_id})
-            if existing_docs and existing_docs['ids']:
-                print(f"Deleting {len(existing_docs['ids'])} existing documents...")
-                self.vector_store.delete(ids=existing_docs['ids'])
-                print("Deletion complete.")
-            else:
-                print("No existing documents found for this course.")
+        # Start building text content
+        text = ModuleTextBuilder(max_chars=settings.MAX_MODULE_TEXT_CHARS)
+        text.append(f"Course ID: {course_id}\nSection: {section_name}\nModule: {mod_name}\nType: {mod_type}\n")
+        
+        # 1. Get Description (common for all modules)
+        if "description" in module and module["description"]:
+            desc_clean = self._clean_html(module["description"])
+            if desc_clean:
+                text.append("Description: ")
+                text.line(desc_clean)
+        
+        # Check for Quiz-specific data if available in course contents (usually limited)
+        if mod_type == "quiz":
+            # In standard core_course_get_contents, quiz details are minimal (just intro/dates).
+            # Deep quiz question extraction requires mod_quiz_get_quizzes_by_courses, 
+            # but that's a separate API call we might add later if needed.
+            # For now, we rely on the description and any attached files.
+            if "dates" in module:
+                text.line(f"Dates: {module['dates']}")
+
+        # Forum provenance (discussion titles + dates) without ingesting post bodies
+        forum_latest_discussion = None
+        forum_latest_discussion_ts = None
+        if mod_type == "forum":
+            forum_id_int = self._forum_instance_id(module)
+            if forum_id_int:
+                discussions = forum_discussions
+                if discussions is None:
+                    discussions = self.moodle.get_forum_discussions(forum_id_int, per_page=3)
+                if discussions:
+                    lines = []
+                    for d in discussions:
+                        if not isinstance(d, dict):
+                            continue
+                        title = str(d.get("name", "")).strip()
+                        ts = d.get("timemodified") or d.get("created")
+                        try:
+                            ts_int = int(ts) if ts is not None else None
+                        except Exception:
+                            ts_int = None
+                        date_str = datetime.utcfromtimestamp(ts_int).strftime("%Y-%m-%d") if ts_int else ""
+                        if title and date_str:
+                            lines.append(f"- {title} ({date_str})")
+                        elif title:
+                            lines.append(f"- {title}")
+                        if forum_latest_discussion is None and title:
+                            forum_latest_discussion = title
+                            forum_latest_discussion_ts = ts_int
+                    if lines:
+                        text.append("Forum discussions (titles):\n")
+                        text.line("\n".join(lines))
+        
+        # 2. Get Page Content (specific to 'page' modname) or generic 'contents'
+        # Moodle returns a list 'contents' for resources/pages
+        if "contents" in module:
+            for item_index, item in enumerate(module["contents"]):
+                # 'content' field usually holds the HTML for Pages
+                if "content" in item:
+                    page_clean = self._clean_html(item["content"])
+                    if page_clean:
+                        text.append("Content: ")
+                        text.line(page_clean)
                 
-        except Exception as e:
-            print(f"Warning during cleanup: {e}")
+                # 'filename' is useful for Resources (PDFs, etc.)
+                if "filename" in item:
+                     # PDF / DOCX Extraction Logic (downloaded and parsed ahead of time by the attachment pipeline)
+                     kind = attachment_kind(item) if "fileurl" in item else None
+                     result = attachments.get(item_index) if kind else None
+                     if result is not None and result.text and not result.error and not result.skipped:
+                         # Extracted bodies get their own section so chunks do not straddle files.
+                         text.new_section()
+                     text.line(f"File Attachment: {item['filename']}")
+
+                     if kind:
+                         label = kind.upper()
+                         if kind == "pdf" and not PDF_SUPPORT:
+                             text.line("[PDF content not extracted: pypdf library missing]")
+                         elif kind == "docx" and not DOCX_SUPPORT:
+                             text.line("[DOCX content not extracted: python-docx library missing]")
+                         else:
+                             if result is None or (result.error and result.error.startswith("download failed")):
+                                 complete = False
+                             elif result.error:
+                                 print(f"Error parsing {label} {item['filename']}: {result.error}")
+                                 text.line(f"[Error reading {label} content: {result.error}]")
+                                 complete = False
+                             elif result.skipped:
+                                 print(f"Skipped {label} {item['filename']}: {result.skipped}")
+                                 text.line(f"[{label} content skipped: {result.skipped}]")
+                                 skipped_files.append(f"{item['filename']} ({result.skipped})")
+                                 # Timeouts and crashed parsers can be transient; retry next ingest.
+                                 complete = False
+                             elif result.text:
+                                 text.line(f"--- {label} CONTENT START ({item['filename']}) ---")
+                                 text.line(result.text)
+                                 text.line(f"--- {label} CONTENT END ---")
+                                 print(f"Extracted {len(result.text)} chars from {label}.")
+                             else:
+                                 print(f"{label} was empty or unreadable.")
+                             if result is not None and result.truncated:
+                                 print(f"Truncated {label} {item['filename']}: {result.truncated}")
+                                 text.line(f"[{label} content truncated: {result.truncated}]")
+                                 truncated_files.append(f"{item['filename']} ({result.truncated})")
+                     
+                     # DOC Extraction Logic (Warning)
+                     if item['filename'].lower().endswith(".doc"):
+                         text.line(f"[WARNING: .doc file ({item['filename']}) skipped. Please convert to .docx or PDF for AI ingestion.]")
+
+        if text.truncated:
+            print(f"Module {mod_name} truncated at {settings.MAX_MODULE_TEXT_CHARS} characters.")
+
+        moodle_path = None
+        module_url = module.get("url")
+        if isinstance(module_url, str) and module_url.strip():
+            parsed = urlparse(module_url)
+            if parsed.scheme and parsed.netloc:
+                moodle_path = parsed.path
+                if parsed.query:
+                    moodle_path += f"?{parsed.query}"
+                if parsed.fragment:
+                    moodle_path += f"#{parsed.fragment}"
+            elif module_url.startswith("/"):
+                moodle_path = module_url
+
+        metadata = {
+            "course_id": course_id,
+            "source": mod_name,
+            "type": mod_type,
+            "module": mod_name,
+            "section": section_name,
+            "cmid": module.get("id"),
+            "moodle_path": moodle_path,
+            "moodle_section_title": section_name,
+            "moodle_activity_title": mod_name,
+            "forum_latest_discussion": forum_latest_discussion,
+            "forum_latest_discussion_ts": forum_latest_discussion_ts,
+            "truncated_files": "; ".join(truncated_files) or None,
+            "skipped_files": "; ".join(skipped_files) or None,
+            "module_text_truncated": text.truncated,
+        }
+        return text, metadata, complete
+
+    @staticmethod
+    def _forum_instance_id(module: Dict[str, Any]) -> Optional[int]:
+        if module.get("modname") != "forum":
+            return None
+        forum_id = module.get("instance") or module.get("instanceid")
+        try:
+            return int(forum_id) if forum_id is not None else None
+        except Exception:
+            return None
+
+    def _prefetch_forum_discussions(self, executor: ThreadPoolExecutor, modules: List[Dict[str, Any]]) -> Dict[int, Future]:
+        """
+        Starts fetching the latest discussions of every forum in `modules` concurrently and
+        returns the futures keyed by forum instance id. Concurrency towards Moodle is capped by
+        the executor size and by the client's shared MOODLE_MAX_CONCURRENCY limit.
+        """
+        futures: Dict[int, Future] = {}
+        for module in modules:
+            forum_id = self._forum_instance_id(module)
+            if forum_id and forum_id not in futures:
+                futures[forum_id] = executor.submit(self.moodle.get_forum_discussions, forum_id, per_page=3)
+        return futures
+
+    def _split_module_text(self, text: ModuleTextBuilder, metadata: Dict[str, Any]):
+        """
+        Lazily splits a module section by section into chunk Documents, each carrying its
+        deterministic chunk id (see _chunk_id) in Document.id.
+        """
+        for section_index, section in enumerate(text.iter_sections()):
+            for chunk_index, chunk in enumerate(self.text_splitter.split_text(section)):
+                doc = Document(page_content=chunk, metadata=dict(metadata))
+                doc.id = self._chunk_id(metadata.get("course_id"), metadata.get("cmid"), section_index, chunk_index, doc)
+                yield doc
+
+    @staticmethod
+    def _chunk_id(course_id: Any, cmid: Any, section_index: int, chunk_index: int, doc: Document) -> str:
+        """
+        Deterministic vector store id of a chunk: course, module, section of the module text (0 is
+        the module itself, then one per extracted attachment), chunk index within the section, and
+        a hash of the chunk text and metadata. Identical chunks map to the same id across ingests,
+        and an id that is already stored holds exactly this chunk.
+        """
+        digest = hashlib.sha256(
+            json.dumps([doc.page_content, doc.metadata], sort_keys=True, default=str).encode("utf-8", errors="ignore")
+        ).hexdigest()[:24]
+        return f"{course_id}:{cmid}:{section_index}:{chunk_index}:{digest}"
+
+    def _upsert_chunks(self, course_id: int, documents: List[Document]) -> int:
+        """
+        Writes chunks under their deterministic ids, skipping ids that are already stored (their
+        content is identical by construction), so unchanged chunks are not re-embedded.
+        Returns the number of chunks actually written.
+        """
+        store = self._store(course_id, write=True)
+        ids = [doc.id for doc in documents]
+        existing = set((store.get(ids=ids, include=[]) or {}).get("ids") or [])
+        fresh = [doc for doc in documents if doc.id not in existing]
+        if fresh:
+            store.add_documents(fresh, ids=[doc.id for doc in fresh])
+        return len(fresh)
+
+    def _delete_stale_chunks(
+        self, course_id: int, where: Dict[str, Any], keep_ids: set, generation: Optional[int] = None
+    ) -> int:
+        """
+        Deletes the chunks of a course matching `where` whose ids are not in `keep_ids`, limited
+        to one knowledge base generation when `generation` is given.
+        """
+        store = self._store(course_id)
+        if generation is None:
+            existing = store.get(where=where, include=[]) or {}
+            candidates = existing.get("ids") or []
+        else:
+            existing = store.get(where=where, include=["metadatas"]) or {}
+            candidates = [
+                chunk_id
+                for chunk_id, meta in zip(existing.get("ids") or [], existing.get("metadatas") or [])
+                if self._chunk_generation(meta) == generation
+            ]
+        stale = [i for i in candidates if i not in keep_ids]
+        if stale:
+            store.delete(ids=stale)
+        return len(stale)
+
+    @staticmethod
+    def _chunk_generation(metadata: Optional[Dict[str, Any]]) -> int:
+        # Chunks written before generations existed (and generation 0) carry no tag.
+        try:
+            return int((metadata or {}).get("generation") or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def _module_where(course_id: int, cmid: Any) -> Dict[str, Any]:
+        return {"$and": [{"course_id": {"$eq": course_id}}, {"cmid": {"$eq": cmid}}]}
+
+    def _course_filter(self, course_id: int, *clauses: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Chroma filter for the chunks of a course that queries should read: the course's active
+        knowledge base generation, plus any extra `clauses`. Generation 0 chunks are untagged, so
+        it is matched by excluding every other generation that may exist, including the one an
+        in-progress rebuild is writing ($nin also matches chunks without the key).
+        """
+        conditions: List[Dict[str, Any]] = [{"course_id": {"$eq": course_id}}]
+        generation, last_generation = ingest_state_store.generations(course_id)
+        if generation:
+            conditions.append({"generation": {"$eq": generation}})
+        else:
+            conditions.append({"generation": {"$nin": list(range(1, last_generation + 2))}})
+        conditions.extend(clauses)
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def _iter_module_texts(
+        self,
+        course_id: int,
+        to_build: List[Tuple[str, Dict[str, Any], Any, Any]],
+        cache_stats: Dict[str, int],
+        progress: Optional[Dict[str, Any]] = None,
+        file_report: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    ):
+        """
+        Yields (entry, text builder, metadata, complete) for each entry of `to_build` in order. Attachments of all
+        modules are fed through a single bounded download/parse pipeline so network round trips and
+        PDF/DOCX parsing overlap across modules, and the discussions of all forums are prefetched
+        concurrently up front and joined back by forum instance id. Extracted-text cache hits/misses are counted into
+        `cache_stats`, `files_total`/`files_parsed` into `progress`, and attachments cut short by the
+        extraction limits are appended to file_report["truncated_files"/"skipped_files"] (modules cut at
+        MAX_MODULE_TEXT_CHARS to file_report["truncated_modules"]).
+        """
+        extractor = AttachmentExtractor(
+            download=lambda url: self.moodle.download_file(url, max_bytes=settings.MAX_INGEST_FILE_BYTES),
+            download_workers=settings.INGEST_DOWNLOAD_WORKERS,
+            parse_workers=settings.INGEST_PARSE_WORKERS,
+            cache=file_text_cache,
+            max_pdf_pages=settings.MAX_PDF_PAGES,
+            max_docx_chars=settings.MAX_DOCX_CHARS,
+            parse_timeout_s=settings.ATTACHMENT_PARSE_TIMEOUT_S,
+        )
+        jobs = []
+        job_counts = []
+        for module_index, (_, module, _, _) in enumerate(to_build):
+            count = 0
+            for item_index, item in enumerate(module.get("contents") or []):
+                if not isinstance(item, dict) or "filename" not in item or "fileurl" not in item:
+                    continue
+                kind = attachment_kind(item)
+                if kind is None or (kind == "pdf" and not PDF_SUPPORT) or (kind == "docx" and not DOCX_SUPPORT):
+                    continue
+                source_key = file_text_cache.source_key(
+                    item["fileurl"],
+                    item.get("timemodified"),
+                    item.get("filesize"),
+                    item.get("contenthash"),
+                    variant=extractor.cache_variant(kind),
+                )
+                jobs.append(
+                    AttachmentJob(
+                        key=(module_index, item_index),
+                        filename=item["filename"],
+                        fileurl=item["fileurl"],
+                        kind=kind,
+                        source_key=source_key,
+                    )
+                )
+                count += 1
+            job_counts.append(count)
+        if progress is not None:
+            progress["files_total"] = len(jobs)
+
+        forum_executor = ThreadPoolExecutor(
+            max_workers=max(1, int(settings.MOODLE_MAX_CONCURRENCY)), thread_name_prefix="forum-prefetch"
+        )
+        forum_futures = self._prefetch_forum_discussions(forum_executor, [module for _, module, _, _ in to_build])
+        results = extractor.iter_extract(jobs)
+        try:
+            yield from self._assemble_module_texts(
+                course_id, to_build, job_counts, results, forum_futures, cache_stats, progress, file_report
+            )
+        finally:
+            results.close()
+            forum_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _assemble_module_texts(
+        self,
+        course_id: int,
+        to_build: List[Tuple[str, Dict[str, Any], Any, Any]],
+        job_counts: List[int],
+        results,
+        forum_futures: Dict[int, Future],
+        cache_stats: Dict[str, int],
+        progress: Optional[Dict[str, Any]],
+        file_report: Optional[Dict[str, List[Dict[str, Any]]]],
+    ):
+        for entry, count in zip(to_build, job_counts):
+            section_name, module, _, _ = entry
+            attachments = {}
+            for _ in range(count):
+                result = next(results)
+                attachments[result.job.key[1]] = result
+                if file_text_cache.enabled:
+                    cache_stats["hits" if result.cached else "misses"] += 1
+                if progress is not None:
+                    progress["files_parsed"] += 1
+                if file_report is not None and (result.truncated or result.skipped):
+                    file_report["skipped_files" if result.skipped else "truncated_files"].append({
+                        "cmid": module.get("id"),
+                        "module": module.get("name"),
+                        "filename": result.job.filename,
+                        "reason": result.skipped or result.truncated,
+                    })
+            forum_discussions = None
+            forum_id = self._forum_instance_id(module)
+            if forum_id in forum_futures:
+                forum_discussions = forum_futures[forum_id].result()
+            text, metadata, complete = self._build_module_text(
+                course_id, section_name, module, attachments, forum_discussions
+            )
+            if file_report is not None and text.truncated:
+                file_report["truncated_modules"].append({
+                    "cmid": module.get("id"),
+                    "module": module.get("name"),
+                    "reason": f"module text limit of {settings.MAX_MODULE_TEXT_CHARS} characters",
+                })
+            yield entry, text, metadata, complete
+
+    def _delete_module_chunks(self, course_id: int, cmid: Any, generation: Optional[int] = None) -> int:
+        """Deletes the stored chunks of a single module of a course (of one generation when given)."""
+        return self._delete_stale_chunks(course_id, self._module_where(course_id, cmid), set(), generation)
+
+    def _embedding_cache_delta(self, before: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not self.embedding_cache or before is None:
+            return None
+        after = self.embedding_cache.stats()
+        hits = after["hits"] - before["hits"]
+        misses = after["misses"] - before["misses"]
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if (hits + misses) else 0.0,
+        }
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Cumulative hit-rate stats of the ingest, answer and retrieval caches since process start, and the memory held by compact vector indexes."""
+        return {
+            "embeddings": self.embedding_cache.stats() if self.embedding_cache else None,
+            "file_text": file_text_cache.stats(),
+            "compact_vectors": self.vector_stores.compact_stats(),
+            "answers": answer_cache.stats(),
+            "semantic_answers": semantic_cache.stats(),
+            "query_embeddings": self.embeddings.stats(),
+            "retrieval": retrieval_cache.stats(),
+        }
+
+    def ingest_course_content(
+        self,
+        course_id: int,
+        incremental: bool = False,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        rebuild: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Fetches content from Moodle (or Mock), chunks it, and stores in Vector DB.
+
+        With incremental=True, only modules that were added or changed since the last ingest
+        (per the stored module fingerprints) are re-chunked and re-embedded, and the chunks of
+        modules removed from Moodle are deleted. Falls back to a full ingest when no previous
+        state exists for the course.
+
+        With rebuild=True, the whole course is written as a new knowledge base generation while
+        queries keep reading the active one; on success the active generation is flipped to the
+        new one atomically and generations beyond KB_RETAINED_GENERATIONS are garbage-collected
+        in the background. A failed or cancelled rebuild leaves the active generation untouched,
+        and rollback_knowledge_base() returns to the previous generation.
+
+        `progress` is called with a snapshot of the per-stage counters as work advances, and
+        `should_cancel` is polled between modules and embedding batches; when it returns True
+        the ingest stops with IngestCancelled.
+
+        Ingests of the same course are serialized, so a bulk run and a single-course job never
+        write the same course concurrently.
+        """
+        with self._course_lock(course_id):
+            result = self._ingest_course_content(course_id, incremental, progress, should_cancel, rebuild)
+        if result.get("previous_generation") is not None:
+            self._collect_generations_async(course_id)
+        return result
+
+    def _ingest_course_content(
+        self,
+        course_id: int,
+        incremental: bool = False,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        rebuild: bool = False,
+    ) -> Dict[str, Any]:
+        print(f"Ingesting content for course {course_id}...")
+
+        progress_state: Dict[str, Any] = {
+            "stage": "fetching",
+            "modules_total": 0,
+            "modules_processed": 0,
+            "files_total": 0,
+            "files_parsed": 0,
+            "chunks_embedded": 0,
+        }
+
+        def _report(stage: Optional[str] = None) -> None:
+            if stage:
+                progress_state["stage"] = stage
+            if progress:
+                try:
+                    progress(dict(progress_state))
+                except Exception as e:
+                    print(f"Warning: ingest progress callback failed: {e}")
+
+        def _check_cancelled() -> None:
+            if should_cancel and should_cancel():
+                raise IngestCancelled(f"Ingestion of course {course_id} was cancelled")
+
+        # Wall-clock seconds per stage; "store" is embedding plus the vector store write, and
+        # "assemble" is the rest of the module loop (downloads, parsing, text assembly, splitting).
+        timings = {"fetch_s": 0.0, "assemble_s": 0.0, "store_s": 0.0, "cleanup_s": 0.0, "persist_s": 0.0}
+        started = time.perf_counter()
+        write_stats = {"chunks_written": 0, "chunks_deleted": 0}
+
+        def _store(documents: List[Document]) -> None:
+            t0 = time.perf_counter()
+            write_stats["chunks_written"] += self._upsert_chunks(course_id, documents)
+            timings["store_s"] += time.perf_counter() - t0
+
+        _check_cancelled()
+
+        course_state = ingest_state_store.load(course_id)
+        active_generation = int(course_state.get("generation") or 0)
+        if rebuild:
+            incremental = False
+            # Numbers are never reused while older chunks may still be awaiting GC; a failed
+            # rebuild leaves last_generation as is, so its retry resumes the same generation.
+            generation = max(active_generation, int(course_state.get("last_generation") or 0)) + 1
+            print(f"Rebuilding course {course_id} as generation {generation} (active: {active_generation})")
+        else:
+            generation = active_generation
+        previous_modules: Dict[str, Any] = (course_state.get("modules") or {}) if incremental else {}
+        if incremental and not previous_modules:
+            print(f"No previous ingest state for course {course_id}; running a full ingest.")
+            incremental = False
 
         # 1. Fetch content
-        contents = moodle_client.get_course_contents(course_id)
+        _report("fetching")
+        t0 = time.perf_counter()
+        contents = self.moodle.get_course_contents(course_id)
+        timings["fetch_s"] = time.perf_counter() - t0
+        _check_cancelled()
         
         # 1.5 Fetch User Activities (Grades & Completion) - NEW FEATURE
         # Note: In a real multi-user RAG, you might not want to ingest specific student grades into the GLOBAL vector store 
@@ -181,199 +828,213 @@ class RAGService:
         # For now, we will fetch generic activity structure, not individual student grades for the RAG.
         # If the user wants to ingest *aggregated* stats, that's safer.
         
-        documents = []
+        module_states: Dict[str, Dict[str, Any]] = {}
+        stats = {"modules_added": 0, "modules_changed": 0, "modules_unchanged": 0, "modules_removed": 0}
         
-        # 2. Process content into Documents
-        for section in contents:
+        # 2. Decide which modules need (re)building, then download/parse their attachments
+        #    concurrently and assemble Documents in module order.
+        to_build = []
+        for section_index, section in enumerate(contents):
             section_name = section.get("name", "Unnamed Section")
+            section_meta = self._section_metadata(section, section_index)
             for module in section.get("modules", []):
-                mod_name = module.get("name", "Unnamed Module")
-                mod_type = module.get("modname", "unknown")
-                
-                # Start building text content
-                content_text = f"Course ID: {course_id}\nSection: {section_name}\nModule: {mod_name}\nType: {mod_type}\n"
-                
-                # 1. Get Description (common for all modules)
-                if "description" in module and module["description"]:
-                    desc_clean = self._clean_html(module["description"])
-                    if desc_clean:
-                        content_text += f"Description: {desc_clean}\n"
-                
-                # Check for Quiz-specific data if available in course contents (usually limited)
-                if mod_type == "quiz":
-                    # In standard core_course_get_contents, quiz details are minimal (just intro/dates).
-                    # Deep quiz question extraction requires mod_quiz_get_quizzes_by_courses, 
-                    # but that's a separate API call we might add later if needed.
-                    # For now, we rely on the description and any attached files.
-                    if "dates" in module:
-                        content_text += f"Dates: {module['dates']}\n"
-
-                # Forum provenance (discussion titles + dates) without ingesting post bodies
-                forum_latest_discussion = None
-                forum_latest_discussion_ts = None
-                if mod_type == "forum":
-                    forum_id = module.get("instance") or module.get("instanceid")
-                    try:
-                        forum_id_int = int(forum_id) if forum_id is not None else None
-                    except Exception:
-                        forum_id_int = None
-                    if forum_id_int:
-                        discussions = moodle_client.get_forum_discussions(forum_id_int, per_page=3)
-                        if discussions:
-                            lines = []
-                            for d in discussions:
-                                if not isinstance(d, dict):
-                                    continue
-                                title = str(d.get("name", "")).strip()
-                                ts = d.get("timemodified") or d.get("created")
-                                try:
-                                    ts_int = int(ts) if ts is not None else None
-                                except Exception:
-                                    ts_int = None
-                                date_str = datetime.utcfromtimestamp(ts_int).strftime("%Y-%m-%d") if ts_int else ""
-                                if title and date_str:
-                                    lines.append(f"- {title} ({date_str})")
-                                elif title:
-                                    lines.append(f"- {title}")
-                                if forum_latest_discussion is None and title:
-                                    forum_latest_discussion = title
-                                    forum_latest_discussion_ts = ts_int
-                            if lines:
-                                content_text += "Forum discussions (titles):\n" + "\n".join(lines) + "\n"
-                
-                # 2. Get Page Content (specific to 'page' modname) or generic 'contents'
-                # Moodle returns a list 'contents' for resources/pages
-                if "contents" in module:
-                    for item in module["contents"]:
-                        # 'content' field usually holds the HTML for Pages
-                        if "content" in item:
-                            page_clean = self._clean_html(item["content"])
-                            if page_clean:
-                                content_text += f"Content: {page_clean}\n"
-                        
-                        # 'filename' is useful for Resources (PDFs, etc.)
-                        if "filename" in item:
-                             content_text += f"File Attachment: {item['filename']}\n"
-                             
-                             # PDF Extraction Logic
-                             is_pdf = False
-                             if "mimetype" in item and item["mimetype"] == "application/pdf":
-                                 is_pdf = True
-                             elif item['filename'].lower().endswith(".pdf"):
-                                 is_pdf = True
-                                 
-                             if is_pdf and "fileurl" in item:
-                                 if PdfReader:
-                                     try:
-                                         print(f"Downloading PDF: {item['filename']}")
-                                         file_bytes = moodle_client.download_file(item["fileurl"])
-                                         if file_bytes:
-                                             file_obj = io.BytesIO(file_bytes)
-                                             reader = PdfReader(file_obj)
-                                             pdf_text = ""
-                                             for page in reader.pages:
-                                                 extracted = page.extract_text()
-                                                 if extracted:
-                                                     pdf_text += extracted + "\n"
-                                             
-                                             if pdf_text:
-                                                 content_text += f"--- PDF CONTENT START ({item['filename']}) ---\n{pdf_text}\n--- PDF CONTENT END ---\n"
-                                                 print(f"Extracted {len(pdf_text)} chars from PDF.")
-                                             else:
-                                                 print("PDF was empty or unreadable.")
-                                     except Exception as e:
-                                         print(f"Error parsing PDF {item['filename']}: {e}")
-                                         content_text += f"[Error reading PDF content: {str(e)}]\n"
-                                 else:
-                                     content_text += "[PDF content not extracted: pypdf library missing]\n"
-                             
-                             # DOCX Extraction Logic
-                             is_docx = False
-                             if "mimetype" in item and item["mimetype"] == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                                 is_docx = True
-                             elif item['filename'].lower().endswith(".docx"):
-                                 is_docx = True
-                                 
-                             if is_docx and "fileurl" in item:
-                                 if docx:
-                                     try:
-                                         print(f"Downloading DOCX: {item['filename']}")
-                                         file_bytes = moodle_client.download_file(item["fileurl"])
-                                         if file_bytes:
-                                             file_obj = io.BytesIO(file_bytes)
-                                             doc_file = docx.Document(file_obj)
-                                             docx_text = "\n".join([para.text for para in doc_file.paragraphs])
-                                             
-                                             if docx_text:
-                                                 content_text += f"--- DOCX CONTENT START ({item['filename']}) ---\n{docx_text}\n--- DOCX CONTENT END ---\n"
-                                                 print(f"Extracted {len(docx_text)} chars from DOCX.")
-                                             else:
-                                                 print("DOCX was empty or unreadable.")
-                                     except Exception as e:
-                                         print(f"Error parsing DOCX {item['filename']}: {e}")
-                                         content_text += f"[Error reading DOCX content: {str(e)}]\n"
-                                 else:
-                                     content_text += "[DOCX content not extracted: python-docx library missing]\n"
-                             
-                             # DOC Extraction Logic (Warning)
-                             if item['filename'].lower().endswith(".doc"):
-                                 content_text += f"[WARNING: .doc file ({item['filename']}) skipped. Please convert to .docx or PDF for AI ingestion.]\n"
-
-                moodle_path = None
-                module_url = module.get("url")
-                if isinstance(module_url, str) and module_url.strip():
-                    parsed = urlparse(module_url)
-                    if parsed.scheme and parsed.netloc:
-                        moodle_path = parsed.path
-                        if parsed.query:
-                            moodle_path += f"?{parsed.query}"
-                        if parsed.fragment:
-                            moodle_path += f"#{parsed.fragment}"
-                    elif module_url.startswith("/"):
-                        moodle_path = module_url
-
-                doc = Document(
-                    page_content=content_text,
-                    metadata={
-                        "course_id": course_id,
-                        "source": mod_name,
-                        "type": mod_type,
-                        "module": mod_name,
-                        "section": section_name,
-                        "cmid": module.get("id"),
-                        "moodle_path": moodle_path,
-                        "moodle_section_title": section_name,
-                        "moodle_activity_title": mod_name,
-                        "forum_latest_discussion": forum_latest_discussion,
-                        "forum_latest_discussion_ts": forum_latest_discussion_ts,
-                    }
-                )
-                documents.append(doc)
-        
-        if not documents:
-            print("No documents found to ingest.")
-            return {"status": "warning", "message": "No content found"}
-
-        # 3. Split and Store
+                # The section fields are recorded in the module state, which feeds the week index.
+                fingerprint = {**self._module_fingerprint(section_name, module), **section_meta}
+                cmid = fingerprint.get("cmid")
+                key = str(cmid) if cmid is not None else None
+                previous = previous_modules.get(key) if key is not None else None
+
+                # Forum discussions can change without the module itself changing, so forums are
+                # always re-assembled and compared by content hash instead of source hash. Modules
+                # whose chunks lack the current section fields (e.g. ingested before they were
+                # recorded) are rewritten.
+                if (
+                    incremental
+                    and previous
+                    and self._same_section(previous, section_meta)
+                    and previous.get("complete", True)
+                    and previous.get("source_hash") == fingerprint["source_hash"]
+                    and module.get("modname") != "forum"
+                ):
+                    module_states[key] = previous
+                    stats["modules_unchanged"] += 1
+                    continue
+                to_build.append((section_name, module, fingerprint, previous))
+
+        progress_state["modules_total"] = stats["modules_unchanged"] + len(to_build)
+        progress_state["modules_processed"] = stats["modules_unchanged"]
+        _report("processing")
+
+        # 3. Split and Store, streaming: each module is split as soon as it is assembled and chunks
+        #    are embedded/upserted in batches of INGEST_EMBED_BATCH_SIZE, so peak memory is bounded
+        #    by one module plus one batch regardless of course size. Chunks have deterministic ids,
+        #    so chunks already stored are neither re-embedded nor duplicated, and only the
+        #    superseded chunks of a changed module are deleted.
+        file_cache_stats = {"hits": 0, "misses": 0}
+        file_report: Dict[str, List[Dict[str, Any]]] = {"truncated_files": [], "skipped_files": [], "truncated_modules": []}
+        embedding_stats_before = self.embedding_cache.stats() if self.embedding_cache else None
+        batch_size = max(1, int(settings.INGEST_EMBED_BATCH_SIZE))
+        batch: List[Document] = []
+        chunks_count = 0
+        modules_written = 0
+        kept_ids: set = set()
+        module_texts = self._iter_module_texts(
+            course_id, to_build, file_cache_stats, progress_state, file_report
+        )
+        loop_started = time.perf_counter()
         try:
-            chunks = self.text_splitter.split_documents(documents)
-            self.vector_store.add_documents(chunks)
-            self.vector_store.persist()
+            for (section_name, module, fingerprint, previous), text, metadata, complete in module_texts:
+                _check_cancelled()
+                progress_state["modules_processed"] += 1
+                cmid = fingerprint.get("cmid")
+                key = str(cmid) if cmid is not None else None
+                content_hash = text.content_hash()
+                if generation:
+                    metadata["generation"] = generation
+                metadata["section_ordinal"] = fingerprint["section_ordinal"]
+                if fingerprint["week"] is not None:
+                    metadata["week"] = fingerprint["week"]
+                state = {**fingerprint, "content_hash": content_hash, "complete": complete}
+
+                if (
+                    incremental
+                    and previous
+                    and self._same_section(previous, fingerprint)
+                    and previous.get("content_hash") == content_hash
+                ):
+                    state["chunks"] = previous.get("chunks", 0)
+                    module_states[key] = state
+                    stats["modules_unchanged"] += 1
+                    _report()
+                    continue
+
+                if previous:
+                    stats["modules_changed"] += 1
+                else:
+                    stats["modules_added"] += 1
+
+                chunks = list(self._split_module_text(text, metadata))
+                module_ids = {chunk.id for chunk in chunks}
+                kept_ids.update(module_ids)
+                # Drop this module's superseded chunks before queueing the new ones, so a failure
+                # in between can leave a module partly missing until the next ingest but never
+                # with two versions of its content. Also covers "added" modules that a failed
+                # earlier run wrote before saving its state.
+                if cmid is not None:
+                    try:
+                        write_stats["chunks_deleted"] += self._delete_stale_chunks(
+                            course_id, self._module_where(course_id, cmid), module_ids, generation
+                        )
+                    except Exception as e:
+                        print(f"Warning: failed to delete chunks for module {cmid} of course {course_id}: {e}")
+
+                for chunk in chunks:
+                    batch.append(chunk)
+                    if len(batch) >= batch_size:
+                        _check_cancelled()
+                        _store(batch)
+                        chunks_count += len(batch)
+                        progress_state["chunks_embedded"] = chunks_count
+                        batch = []
+                state["chunks"] = len(chunks)
+                if key is not None:
+                    module_states[key] = state
+                modules_written += 1
+                _report()
+
+            if batch:
+                _check_cancelled()
+                _store(batch)
+                chunks_count += len(batch)
+                progress_state["chunks_embedded"] = chunks_count
+                batch = []
+            timings["assemble_s"] = time.perf_counter() - loop_started - timings["store_s"]
+
+            _report("cleanup")
+            t0 = time.perf_counter()
+            removed_cmids = [v.get("cmid") for k, v in previous_modules.items() if k not in module_states]
+            stats["modules_removed"] = len(removed_cmids)
+            for cmid in removed_cmids:
+                try:
+                    write_stats["chunks_deleted"] += self._delete_module_chunks(course_id, cmid, generation)
+                except Exception as e:
+                    print(f"Warning: failed to delete chunks for module {cmid} of course {course_id}: {e}")
+            if not incremental and modules_written:
+                # A full ingest replaces the whole generation: anything in it not written by this
+                # run (removed modules, chunks from older id schemes, analytics summaries) goes.
+                try:
+                    write_stats["chunks_deleted"] += self._delete_stale_chunks(
+                        course_id, {"course_id": course_id}, kept_ids, generation
+                    )
+                except Exception as e:
+                    print(f"Warning: failed to delete stale chunks of course {course_id}: {e}")
+            timings["cleanup_s"] = time.perf_counter() - t0
+
+            if not incremental and not modules_written:
+                print("No documents found to ingest.")
+                return {"status": "warning", "message": "No content found"}
+
+            _report("persisting")
+            t0 = time.perf_counter()
+            self._store(course_id).persist()
+            timings["persist_s"] = time.perf_counter() - t0
         except Exception as e:
-            print(f"Error during vector store ingestion for course {course_id}: {e}")
+            if isinstance(e, IngestCancelled):
+                print(f"Ingestion of course {course_id} cancelled after {chunks_count} chunks")
+            else:
+                print(f"Error during vector store ingestion for course {course_id}: {e}")
             raise
-        
-        print(f"Ingested {len(chunks)} chunks for course {course_id}")
-        return {"status": "success", "chunks_count": len(chunks)}
+        finally:
+            module_texts.close()
+
+        new_state = {
+            **course_state,
+            "course_id": course_id,
+            "generation": generation,
+            "last_generation": max(generation, int(course_state.get("last_generation") or 0)),
+            "modules": module_states,
+        }
+        if rebuild:
+            # The atomic state save below is the cut-over: queries read the generation recorded
+            # in the state file, so they switch from the old generation to the new one at once.
+            retained = max(1, int(settings.KB_RETAINED_GENERATIONS)) - 1
+            history = [{
+                "generation": active_generation,
+                "activated_at": course_state.get("activated_at"),
+                "modules": course_state.get("modules") or {},
+            }] if course_state.get("modules") else []
+            new_state["history"] = (history + (course_state.get("history") or []))[:retained]
+            new_state["activated_at"] = datetime.utcnow().isoformat()
+        if not ingest_state_store.save(course_id, new_state):
+            raise RuntimeError(f"Failed to save the ingest state of course {course_id}")
+        self._invalidate_course_caches(course_id)
+
+        print(
+            f"Ingested {chunks_count} chunks for course {course_id} "
+            f"({write_stats['chunks_written']} written, {write_stats['chunks_deleted']} deleted)"
+        )
+        _report("done")
+        return {
+            "status": "success",
+            "mode": "rebuild" if rebuild else ("incremental" if incremental else "full"),
+            "generation": generation,
+            "previous_generation": active_generation if rebuild else None,
+            "chunks_count": chunks_count,
+            **write_stats,
+            **stats,
+            **file_report,
+            "file_cache": file_cache_stats,
+            "embedding_cache": self._embedding_cache_delta(embedding_stats_before),
+            "progress": dict(progress_state),
+            "timings": {
+                **{k: round(v, 3) for k, v in timings.items()},
+                "total_s": round(time.perf_counter() - started, 3),
+            },
+        }
 
-    def ask_question(self, course_id: int, question: str, student_id: int = 1):
-        """
-        RAG Pipeline: Retrieve relevant docs -> Generate Answer
-        """
-        # 1. Get Student Context
-        profile = student_service.get_student_profile(student_id)
-        progress = student_service.get_student_progress(student_id, course_id)
-        
+    def _qa_prompt(self, profile: Dict[str, Any], progress: Dict[str, Any]) -> PromptTemplate:
+        """Tutor prompt with the student's profile and progress; expects {context} and {question}."""
+        # 1. Student Context
         # Format quiz scores safely to avoid curly braces in PromptTemplate
         quiz_scores_str = ", ".join([f"{k}: {v}" for k, v in progress['quiz_scores'].items()]) if progress['quiz_scores'] else "None"
         
@@ -420,36 +1081,36 @@ class RAGService:
         Helpful Answer:
         """
         
-        QA_CHAIN_PROMPT = PromptTemplate.from_template(template)
-
-        # 3. Create Retriever with optional week filtering
-        # Chroma metadata filters require a single top-level operator. We use $and/$or when filtering by week.
-        filter_where: Dict[str, Any] = {"course_id": course_id}
-        week_nums = sorted({int(n) for n in re.findall(r"\bweek\s*(\d+)\b", question, flags=re.IGNORECASE) if n.isdigit()})
-        if week_nums:
-            week_contains = [{"section": {"$contains": f"Week {n}"}} for n in week_nums]
-            filter_where = {"$and": [{"course_id": {"$eq": course_id}}, {"$or": week_contains}]}
-            try:
-                test_docs = self.vector_store.similarity_search(question, k=1, filter=filter_where)
-                if not test_docs:
-                    filter_where = {"course_id": course_id}
-            except Exception:
-                filter_where = {"course_id": course_id}
-
-        retriever = self.vector_store.as_retriever(search_kwargs={"k": 6, "filter": filter_where})
-        
-        # 4. Create QA Chain
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=retriever,
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": QA_CHAIN_PROMPT}
-        )
-        
-        # 5. Execute
-        result = qa_chain.invoke({"query": question})
-
+        return PromptTemplate.from_template(template)
+
+    def _question_filter(self, course_id: int, question: str) -> Dict[str, Any]:
+        # Course filter, narrowed to the weeks the question mentions that have chunks in the course.
+        # The ingest state records each module's week, so this needs no probe search.
+        week_nums = {int(n) for n in re.findall(r"\bweek\s*(\d+)\b", question, flags=re.IGNORECASE)}
+        weeks = sorted(week_nums & ingest_state_store.weeks(course_id)) if week_nums else []
+        if weeks:
+            return self._course_filter(course_id, {"week": {"$in": weeks}})
+        return self._course_filter(course_id)
+
+    def _query_vector(self, query: str) -> List[float]:
+        vector = retrieval_cache.query_vector(query)
+        return vector if vector is not None else self.embeddings.embed_query(query)
+
+    def _search(self, course_id: int, query: str, k: int, filter_where: Dict[str, Any]) -> List[Document]:
+        """
+        Similarity search shared across students: results are cached per course, normalized
+        query, filter, k and knowledge base version (see app.services.retrieval_cache).
+        """
+        key = retrieval_cache.key(course_id, query, filter_where, k, ingest_state_store.version(course_id))
+        docs = retrieval_cache.get(key)
+        if docs is not None:
+            return docs
+        vector = self._query_vector(query)
+        docs = self._store(course_id).similarity_search_by_vector(vector, k=k, filter=filter_where)
+        retrieval_cache.put(key, course_id, query, vector, docs)
+        return docs
+
+    def _format_sources(self, course_id: int, docs: List[Document]) -> List[Dict[str, Any]]:
         sources = []
         def _safe_scalar(v: Any) -> Any:
             if v is None:
@@ -466,7 +1127,7 @@ class RAGService:
                     pass
             return str(v)
 
-        for doc in result.get("source_documents", []) or []:
+        for doc in docs or []:
             meta = getattr(doc, "metadata", None) or {}
             if not isinstance(meta, dict):
                 meta = {}
@@ -494,49 +1155,196 @@ class RAGService:
                 }
             )
 
-        return {"answer": result["result"], "sources": sources}
+        return sources
 
-    def generate_quiz(
+    def _qa_chain(self, prompt: PromptTemplate, course_id: int, filter_where: Dict[str, Any]):
+        retriever = CachedRetriever(service=self, course_id=course_id, filter_where=filter_where, k=6)
+        from langchain.chains import RetrievalQA
+        return RetrievalQA.from_chain_type(
+            llm=self.llm,
+            chain_type="stuff",
+            retriever=retriever,
+            return_source_documents=True,
+            chain_type_kwargs={"prompt": prompt}
+        )
+
+    @staticmethod
+    def _invalidate_course_caches(course_id: int) -> None:
+        answer_cache.invalidate_course(course_id)
+        semantic_cache.invalidate_course(course_id)
+        retrieval_cache.invalidate_course(course_id)
+
+    def _question_vector(self, question: str) -> Optional[List[float]]:
+        try:
+            return self._query_vector(question)
+        except Exception as e:
+            print(f"Warning: semantic answer cache skipped, embedding the question failed: {e}")
+            return None
+
+    def _answer_lookup(
         self,
         course_id: int,
-        topic: str,
-        diversity_token: Optional[str] = None,
-        avoid_questions: Optional[List[str]] = None,
-    ):
+        question: str,
+        profile: Dict[str, Any],
+        progress: Dict[str, Any],
+        use_cache: bool,
+    ) -> Tuple[Optional[Dict[str, Any]], Callable[[Dict[str, Any]], None]]:
         """
-        Generates a multiple choice question based on the topic and course content.
+        Looks the question up in the exact answer cache, then in the semantic one. Returns the
+        cached answer (or None) and a function storing a freshly generated answer in both; a
+        bypassed lookup (use_cache=False) still stores the fresh answer.
         """
-        # 1. Retrieve content
-        filter_where: Dict[str, Any] = {"course_id": course_id}
-        week_nums = sorted({int(n) for n in re.findall(r"\bweek\s*(\d+)\b", topic, flags=re.IGNORECASE) if n.isdigit()})
-        if week_nums:
-            week_contains = [{"section": {"$contains": f"Week {n}"}} for n in week_nums]
-            filter_where = {"$and": [{"course_id": {"$eq": course_id}}, {"$or": week_contains}]}
-            try:
-                test_docs = self.vector_store.similarity_search(topic, k=1, filter=filter_where)
-                if not test_docs:
-                    filter_where = {"course_id": course_id}
-            except Exception:
-                filter_where = {"course_id": course_id}
-        retriever = self.vector_store.as_retriever(search_kwargs={"k": 3, "filter": filter_where})
-        docs = retriever.invoke(topic)
+        kb_version = ingest_state_store.version(course_id)
+        fingerprint = student_fingerprint(profile, progress)
+        key = answer_cache.key(course_id, question, kb_version, fingerprint)
+        cached = None
+        if use_cache:
+            cached = answer_cache.get(key)
+        else:
+            answer_cache.record_bypass()
+        if cached is not None:
+            return cached, lambda answer: None
+
+        vector = self._question_vector(question) if semantic_cache.enabled else None
+        if vector is not None:
+            if use_cache:
+                cached = semantic_cache.get(course_id, kb_version, fingerprint, vector)
+            else:
+                semantic_cache.record_bypass()
+        if cached is not None:
+            # Exact repeats of this paraphrase are then served without embedding it again.
+            answer_cache.put(key, course_id, cached)
+
+        def _store(answer: Dict[str, Any]) -> None:
+            answer_cache.put(key, course_id, answer)
+            if vector is not None:
+                semantic_cache.put(course_id, kb_version, fingerprint, question, vector, answer)
+
+        return cached, _store
+
+    def ask_question(self, course_id: int, question: str, student_id: int = 1, use_cache: bool = True):
+        """
+        RAG Pipeline: Retrieve relevant docs -> Generate Answer
+
+        Answers are served from the answer caches when the same question (or, with the semantic
+        cache, a paraphrase of it) was asked with the same student context over the same knowledge
+        base; use_cache=False forces a fresh answer.
+        """
+        profile = student_service.get_student_profile(student_id)
+        progress = student_service.get_student_progress(student_id, course_id)
+        cached, store_answer = self._answer_lookup(course_id, question, profile, progress, use_cache)
+        if cached is not None:
+            return cached
+
+        prompt = self._qa_prompt(profile, progress)
+        filter_where = self._question_filter(course_id, question)
+
+        result = self._qa_chain(prompt, course_id, filter_where).invoke({"query": question})
+        sources = self._format_sources(course_id, result.get("source_documents", []))
+        answer = {"answer": result["result"], "sources": sources}
+        store_answer(answer)
+        return answer
+
+    async def aask_question(self, course_id: int, question: str, student_id: int = 1, use_cache: bool = True):
+        """
+        Async variant of ask_question. The Moodle lookups and the LLM call are awaited; the
+        vector searches (local CPU work) run in worker threads.
+        """
+        profile, progress = await asyncio.gather(
+            student_service.aget_student_profile(student_id),
+            student_service.aget_student_progress(student_id, course_id),
+        )
+        cached, store_answer = await asyncio.to_thread(
+            self._answer_lookup, course_id, question, profile, progress, use_cache
+        )
+        if cached is not None:
+            return cached
+
+        prompt = self._qa_prompt(profile, progress)
+        filter_where = self._question_filter(course_id, question)
+
+        result = await self._qa_chain(prompt, course_id, filter_where).ainvoke({"query": question})
+        sources = self._format_sources(course_id, result.get("source_documents", []))
+        answer = {"answer": result["result"], "sources": sources}
+        store_answer(answer)
+        return answer
+
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        # Chat models stream message chunks, completion LLMs stream plain strings.
+        text = getattr(chunk, "content", chunk)
+        return text if isinstance(text, str) else ""
+
+    async def astream_answer(
+        self, course_id: int, question: str, student_id: int = 1, use_cache: bool = True
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming variant of aask_question: yields ("sources", [...]) as soon as retrieval is done,
+        then ("token", text) for every chunk the provider streams. Same retrieval and prompt as
+        the RetrievalQA "stuff" chain, so the final answer matches a non-streamed one. A cached
+        answer is yielded as a single token.
+        """
+        profile, progress = await asyncio.gather(
+            student_service.aget_student_profile(student_id),
+            student_service.aget_student_progress(student_id, course_id),
+        )
+        cached, store_answer = await asyncio.to_thread(
+            self._answer_lookup, course_id, question, profile, progress, use_cache
+        )
+        if cached is not None:
+            yield "sources", cached["sources"]
+            yield "token", cached["answer"]
+            return
+
+        prompt = self._qa_prompt(profile, progress)
+
+        def _retrieve() -> List[Document]:
+            filter_where = self._question_filter(course_id, question)
+            return self._search(course_id, question, 6, filter_where)
+
+        docs = await asyncio.to_thread(_retrieve)
+        sources = self._format_sources(course_id, docs)
+        yield "sources", sources
+
+        context = "\n\n".join(doc.page_content for doc in docs)
+        parts: List[str] = []
+        async for chunk in self.llm.astream(prompt.format(context=context, question=question)):
+            text = self._chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield "token", text
+        # Only a stream that ran to the end is cached.
+        store_answer({"answer": "".join(parts), "sources": sources})
+
+    def _quiz_context(self, course_id: int, topic: str) -> str:
+        filter_where = self._question_filter(course_id, topic)
+        docs = self._search(course_id, topic, 3, filter_where)
         context_text = "\n\n".join([doc.page_content for doc in docs])
-        context_text = context_text.strip()
-        if not context_text:
-            return {
-                "question": f"Unable to generate a quiz for '{topic}' because no matching course content was retrieved.",
-                "options": [
-                    "Ingest the course content first",
-                    "Try a topic that appears in the course materials",
-                    "Ask the teacher to add resources for this topic",
-                    "Retry after content synchronization"
-                ],
-                "correct_answer": "Ingest the course content first",
-                "explanation": "Quiz generation is grounded in Moodle course materials. The system did not retrieve any relevant chunks for this topic, which usually means the course was not ingested or the topic is not present in the uploaded resources.",
-                "hint": "Use the Teacher Dashboard “Ingest Course” action, then retry with a topic from the course."
-            }
-        
-        # 2. Prompt for Quiz Generation
+        return context_text.strip()
+
+    @staticmethod
+    def _no_context_quiz(topic: str) -> Dict[str, Any]:
+        return {
+            "question": f"Unable to generate a quiz for '{topic}' because no matching course content was retrieved.",
+            "options": [
+                "Ingest the course content first",
+                "Try a topic that appears in the course materials",
+                "Ask the teacher to add resources for this topic",
+                "Retry after content synchronization"
+            ],
+            "correct_answer": "Ingest the course content first",
+            "explanation": "Quiz generation is grounded in Moodle course materials. The system did not retrieve any relevant chunks for this topic, which usually means the course was not ingested or the topic is not present in the uploaded resources.",
+            "hint": "Use the Teacher Dashboard “Ingest Course” action, then retry with a topic from the course."
+        }
+
+    def _quiz_request(
+        self,
+        topic: str,
+        context_text: str,
+        diversity_token: Optional[str],
+        avoid_questions: Optional[List[str]],
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """Quiz generation chain and its inputs (shared by generate_quiz and agenerate_quiz)."""
         template = """
         You are an AI Tutor. Based on the following course content, generate a multiple-choice question to test the student's understanding of "{topic}".
 
@@ -567,25 +1375,51 @@ class RAGService:
             template=template,
             input_variables=["topic", "context", "diversity_token", "avoid_questions"]
         )
-        
-        chain = prompt | self.llm
-        
-        # 3. Execute
         quiz_llm = self.llm.bind(temperature=0.2) if hasattr(self.llm, "bind") else self.llm
         avoid_text = "\n".join([f"- {q}" for q in (avoid_questions or [])]) if avoid_questions else "- (none)"
-        response = (prompt | quiz_llm).invoke(
-            {
-                "topic": topic,
-                "context": context_text,
-                "diversity_token": str(diversity_token or ""),
-                "avoid_questions": avoid_text,
-            }
+        return prompt | quiz_llm, {
+            "topic": topic,
+            "context": context_text,
+            "diversity_token": str(diversity_token or ""),
+            "avoid_questions": avoid_text,
+        }
+
+    def _quiz_fix_request(self, topic: str, context_text: str, raw: str) -> Tuple[Any, Dict[str, Any]]:
+        """Chain that asks the LLM to repair an unparseable quiz payload, and its inputs."""
+        fix_template = """
+You are fixing a quiz payload to be valid JSON for an automated parser.
+
+Return ONLY a raw JSON object (no markdown, no commentary) with this exact structure:
+{
+  "question": "string",
+  "options": ["string", "string", "string", "string"],
+  "correct_answer": "string (must match one of the options exactly)",
+  "explanation": "string",
+  "hint": "string"
+}
+
+Topic: {topic}
+
+Course Content (must ground the quiz):
+{context}
+
+Bad/Unstructured Output To Fix:
+{bad_output}
+"""
+        fix_prompt = PromptTemplate(
+            template=fix_template,
+            input_variables=["topic", "context", "bad_output"]
         )
-        
-        # 4. Parse JSON
-        import json
-        raw = response.content if hasattr(response, "content") else str(response)
+        fixer_llm = self.llm.bind(temperature=0) if hasattr(self.llm, "bind") else self.llm
+        return fix_prompt | fixer_llm, {"topic": topic, "context": context_text, "bad_output": raw}
+
+    @staticmethod
+    def _response_text(response: Any) -> str:
+        return response.content if hasattr(response, "content") else str(response)
 
+    @staticmethod
+    def _parse_quiz(raw: str) -> Optional[Dict[str, Any]]:
+        """Normalized quiz from the LLM output, or None when it is not a valid quiz payload."""
         def _strip_fences(text: str) -> str:
             t = (text or "").strip()
             t = re.sub(r"^```(?:json)?\s*", "", t, flags=re.IGNORECASE)
@@ -649,63 +1483,19 @@ class RAGService:
                 return False
             return True
 
-        parsed: Optional[Dict[str, Any]] = None
-        parse_candidates = [_strip_fences(raw), _extract_json_object(raw)]
-        for cand in parse_candidates:
+        for cand in [_strip_fences(raw), _extract_json_object(raw)]:
             try:
                 obj = json.loads(cand)
                 if isinstance(obj, dict):
                     normalized = _normalize_quiz_payload(obj)
                     if _is_valid_quiz(normalized):
-                        parsed = normalized
-                        break
+                        return normalized
             except Exception:
                 continue
+        return None
 
-        if parsed is None:
-            fix_template = """
-You are fixing a quiz payload to be valid JSON for an automated parser.
-
-Return ONLY a raw JSON object (no markdown, no commentary) with this exact structure:
-{
-  "question": "string",
-  "options": ["string", "string", "string", "string"],
-  "correct_answer": "string (must match one of the options exactly)",
-  "explanation": "string",
-  "hint": "string"
-}
-
-Topic: {topic}
-
-Course Content (must ground the quiz):
-{context}
-
-Bad/Unstructured Output To Fix:
-{bad_output}
-"""
-            fix_prompt = PromptTemplate(
-                template=fix_template,
-                input_variables=["topic", "context", "bad_output"]
-            )
-            fixer_llm = self.llm.bind(temperature=0) if hasattr(self.llm, "bind") else self.llm
-            fixed_response = (fix_prompt | fixer_llm).invoke(
-                {"topic": topic, "context": context_text, "bad_output": raw}
-            )
-            fixed_raw = fixed_response.content if hasattr(fixed_response, "content") else str(fixed_response)
-            for cand in [_strip_fences(fixed_raw), _extract_json_object(fixed_raw)]:
-                try:
-                    obj = json.loads(cand)
-                    if isinstance(obj, dict):
-                        normalized = _normalize_quiz_payload(obj)
-                        if _is_valid_quiz(normalized):
-                            parsed = normalized
-                            break
-                except Exception:
-                    continue
-
-        if parsed is not None:
-            return parsed
-
+    @staticmethod
+    def _quiz_fallback(topic: str, raw: str) -> Dict[str, Any]:
         print("Quiz generation failed to produce valid JSON. First 300 chars:", (raw or "")[:300])
         return {
             "question": f"Could not generate a structured quiz for {topic}. Please try again.",
@@ -715,17 +1505,57 @@ Bad/Unstructured Output To Fix:
             "hint": "Ingest the course and retry with a topic present in the course materials."
         }
 
-    def generate_study_plan(self, course_id: int, weaknesses: List[str], weakness_details: Optional[List[Dict[str, Any]]] = None):
-        if not weaknesses:
-            return "Great job! You seem to be doing well in all topics. Keep reviewing the latest materials."
+    def generate_quiz(
+        self,
+        course_id: int,
+        topic: str,
+        diversity_token: Optional[str] = None,
+        avoid_questions: Optional[List[str]] = None,
+    ):
+        """
+        Generates a multiple choice question based on the topic and course content.
+        """
+        # 1. Retrieve content
+        context_text = self._quiz_context(course_id, topic)
+        if not context_text:
+            return self._no_context_quiz(topic)
+
+        # 2. Prompt for Quiz Generation and execute
+        chain, inputs = self._quiz_request(topic, context_text, diversity_token, avoid_questions)
+        raw = self._response_text(chain.invoke(inputs))
+
+        # 3. Parse JSON, asking the model to repair its output once if needed
+        parsed = self._parse_quiz(raw)
+        if parsed is None:
+            fix_chain, fix_inputs = self._quiz_fix_request(topic, context_text, raw)
+            parsed = self._parse_quiz(self._response_text(fix_chain.invoke(fix_inputs)))
+        return parsed if parsed is not None else self._quiz_fallback(topic, raw)
+
+    async def agenerate_quiz(
+        self,
+        course_id: int,
+        topic: str,
+        diversity_token: Optional[str] = None,
+        avoid_questions: Optional[List[str]] = None,
+    ):
+        """Async variant of generate_quiz."""
+        context_text = await asyncio.to_thread(self._quiz_context, course_id, topic)
+        if not context_text:
+            return self._no_context_quiz(topic)
+
+        chain, inputs = self._quiz_request(topic, context_text, diversity_token, avoid_questions)
+        raw = self._response_text(await chain.ainvoke(inputs))
 
+        parsed = self._parse_quiz(raw)
+        if parsed is None:
+            fix_chain, fix_inputs = self._quiz_fix_request(topic, context_text, raw)
+            parsed = self._parse_quiz(self._response_text(await fix_chain.ainvoke(fix_inputs)))
+        return parsed if parsed is not None else self._quiz_fallback(topic, raw)
+
+    def _study_plan_prompt(self, course_id: int, weaknesses: List[str], weakness_details: Optional[List[Dict[str, Any]]] = None) -> str:
         context_docs = []
         for topic in weaknesses:
-            docs = self.vector_store.similarity_search(
-                topic, 
-                k=2,
-                filter={"course_id": course_id}
-            )
+            docs = self._search(course_id, topic, 2, self._course_filter(course_id))
             context_docs.extend(docs)
 
         seen = set()
@@ -766,20 +1596,26 @@ Course Material:
 
 Your Personalized Study Plan:
 """
+        return prompt
 
-        response = self.llm.invoke(prompt)
-        
-        if hasattr(response, 'content'):
-            return response.content
-        return str(response)
+    def generate_study_plan(self, course_id: int, weaknesses: List[str], weakness_details: Optional[List[Dict[str, Any]]] = None):
+        if not weaknesses:
+            return "Great job! You seem to be doing well in all topics. Keep reviewing the latest materials."
 
-    def generate_learning_path(self, course_id: int, student_id: int):
-        """
-        Analyzes student performance and generates a personalized study path.
-        """
-        progress = student_service.get_student_progress(student_id, course_id)
-        quiz_scores = progress.get('quiz_scores', {})
+        prompt = self._study_plan_prompt(course_id, weaknesses, weakness_details)
+        return self._response_text(self.llm.invoke(prompt))
+
+    async def agenerate_study_plan(self, course_id: int, weaknesses: List[str], weakness_details: Optional[List[Dict[str, Any]]] = None):
+        """Async variant of generate_study_plan."""
+        if not weaknesses:
+            return "Great job! You seem to be doing well in all topics. Keep reviewing the latest materials."
+
+        prompt = await asyncio.to_thread(self._study_plan_prompt, course_id, weaknesses, weakness_details)
+        return self._response_text(await self.llm.ainvoke(prompt))
 
+    @staticmethod
+    def _weakness_details(quiz_scores: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Topics averaging under 75%, weakest first."""
         topic_scores: Dict[str, List[Tuple[str, float]]] = {}
         for quiz_name, score in quiz_scores.items():
             name = quiz_name
@@ -793,7 +1629,6 @@ Your Personalized Study Plan:
                 topic_scores[base] = []
             topic_scores[base].append((quiz_name, float(score)))
 
-        weaknesses: List[str] = []
         weakness_details: List[Dict[str, Any]] = []
 
         for topic, entries in topic_scores.items():
@@ -801,7 +1636,6 @@ Your Personalized Study Plan:
             avg_score = sum(scores_for_topic) / len(scores_for_topic) if scores_for_topic else 0.0
             if avg_score < 75.0:
                 severity = "high" if avg_score < 50.0 else "medium"
-                weaknesses.append(topic)
                 weakness_details.append(
                     {
                         "topic": topic,
@@ -811,26 +1645,27 @@ Your Personalized Study Plan:
                     }
                 )
 
-        if not weaknesses:
-            if not quiz_scores:
-                return {
-                    "status": "start",
-                    "message": "Welcome! Start by exploring the Course Introduction.",
-                    "recommendations": ["Review Course Introduction"]
-                }
-            else:
-                return {
-                    "status": "on_track",
-                    "message": "Excellent work! You are performing well in all assessed topics.",
-                    "recommendations": ["Continue to the next module."]
-                }
+        return sorted(weakness_details, key=lambda w: w["average_score"])
 
-        weakness_details_sorted = sorted(weakness_details, key=lambda w: w["average_score"])
+    @staticmethod
+    def _learning_path_without_plan(quiz_scores: Dict[str, Any]) -> Dict[str, Any]:
+        if not quiz_scores:
+            return {
+                "status": "start",
+                "message": "Welcome! Start by exploring the Course Introduction.",
+                "recommendations": ["Review Course Introduction"]
+            }
+        return {
+            "status": "on_track",
+            "message": "Excellent work! You are performing well in all assessed topics.",
+            "recommendations": ["Continue to the next module."]
+        }
+
+    @staticmethod
+    def _learning_path_result(weakness_details_sorted: List[Dict[str, Any]], plan_text: str) -> Dict[str, Any]:
         top_weaknesses = weakness_details_sorted[:3]
         top_topics = [w["topic"] for w in top_weaknesses]
 
-        plan_text = self.generate_study_plan(course_id, top_topics, weakness_details=top_weaknesses)
-
         recommendations: List[str] = []
         for w in top_weaknesses:
             topic = w["topic"]
@@ -849,6 +1684,32 @@ Your Personalized Study Plan:
             "recommendations": recommendations,
         }
 
+    def generate_learning_path(self, course_id: int, student_id: int):
+        """
+        Analyzes student performance and generates a personalized study path.
+        """
+        progress = student_service.get_student_progress(student_id, course_id)
+        quiz_scores = progress.get('quiz_scores', {})
+        weakness_details = self._weakness_details(quiz_scores)
+        if not weakness_details:
+            return self._learning_path_without_plan(quiz_scores)
+
+        top_weaknesses = weakness_details[:3]
+        plan_text = self.generate_study_plan(course_id, [w["topic"] for w in top_weaknesses], weakness_details=top_weaknesses)
+        return self._learning_path_result(weakness_details, plan_text)
+
+    async def agenerate_learning_path(self, course_id: int, student_id: int):
+        """Async variant of generate_learning_path."""
+        progress = await student_service.aget_student_progress(student_id, course_id)
+        quiz_scores = progress.get('quiz_scores', {})
+        weakness_details = self._weakness_details(quiz_scores)
+        if not weakness_details:
+            return self._learning_path_without_plan(quiz_scores)
+
+        top_weaknesses = weakness_details[:3]
+        plan_text = await self.agenerate_study_plan(course_id, [w["topic"] for w in top_weaknesses], weakness_details=top_weaknesses)
+        return self._learning_path_result(weakness_details, plan_text)
+
     def ingest_analytics_summary(self, course_id: int, analytics: Dict[str, Any]):
         """
         Ingests a summary of course analytics into the vector store.
@@ -881,9 +1742,15 @@ Your Personalized Study Plan:
                     "section": "Dashboard"
                 }
             )
+            generation = ingest_state_store.active_generation(course_id)
+            if generation:
+                doc.metadata["generation"] = generation
             
-            self.vector_store.add_documents([doc])
-            self.vector_store.persist()
+            # Fixed id, so a new summary replaces the previous one instead of accumulating.
+            self._store(course_id, write=True).add_documents([doc], ids=[f"{course_id}:analytics"])
+            self._store(course_id).persist()
+            # The summary does not touch the ingest state, so the cache keys would not change.
+            self._invalidate_course_caches(course_id)
             print(f"Ingested analytics summary for course {course_id}")
             return {"status": "success"}
         except Exception as e:
@@ -919,10 +1786,10 @@ Your Personalized Study Plan:
             # without fetching content.
             
             # Using the underlying Chroma client if available, or just the wrapper
-            # The wrapper self.vector_store is a Chroma object.
+            # The wrapper returned by self._store() is a Chroma object.
             
             # Use get() method of the underlying collection
-            result = self.vector_store.get(where={"course_id": course_id})
+            result = self._store(course_id).get(where=self._course_filter(course_id))
             
             if not result or not result['ids']:
                 return {"course_id": course_id, "document_count": 0, "sources": []}
@@ -952,6 +1819,7 @@ Your Personalized Study Plan:
                 
             return {
                 "course_id": course_id,
+                "generation": ingest_state_store.active_generation(course_id),
                 "document_count": len(result['ids']),
                 "sources": list(sources.values())
             }
@@ -960,20 +1828,123 @@ Your Personalized Study Plan:
             print(f"Error getting knowledge base: {e}")
             return {"error": str(e)}
 
+    def _collect_generations_async(self, course_id: int) -> None:
+        threading.Thread(
+            target=self.collect_generations, args=(course_id,), name=f"kb-gc-{course_id}", daemon=True
+        ).start()
+
+    def collect_generations(self, course_id: int) -> int:
+        """
+        Deletes the chunks of a course that belong to neither its active generation nor the
+        generations retained for rollback. Runs under the course lock so it never races an
+        ingest that is writing a new generation.
+        """
+        try:
+            with self._course_lock(course_id):
+                state = ingest_state_store.load(course_id)
+                keep = {int(state.get("generation") or 0)}
+                keep.update(int(h.get("generation") or 0) for h in state.get("history") or [])
+                store = self._store(course_id)
+                existing = store.get(where={"course_id": course_id}, include=["metadatas"]) or {}
+                garbage = [
+                    chunk_id
+                    for chunk_id, meta in zip(existing.get("ids") or [], existing.get("metadatas") or [])
+                    if self._chunk_generation(meta) not in keep
+                ]
+                if garbage:
+                    store.delete(ids=garbage)
+                    store.persist()
+            print(f"Collected {len(garbage)} chunks of old generations for course {course_id}")
+            return len(garbage)
+        except Exception as e:
+            print(f"Warning: generation GC failed for course {course_id}: {e}")
+            return 0
+
+    def rollback_knowledge_base(self, course_id: int) -> Dict[str, Any]:
+        """
+        Makes the previous retained generation of a course active again (atomic state flip);
+        the generation rolled back from is garbage-collected in the background.
+        """
+        with self._course_lock(course_id):
+            state = ingest_state_store.load(course_id)
+            history = state.get("history") or []
+            if not history:
+                return {"status": "error", "message": f"No previous generation to roll back to for course {course_id}"}
+            current = int(state.get("generation") or 0)
+            target = history[0]
+            new_state = {
+                **state,
+                "generation": int(target.get("generation") or 0),
+                "activated_at": datetime.utcnow().isoformat(),
+                "modules": target.get("modules") or {},
+                "history": history[1:],
+            }
+            if not ingest_state_store.save(course_id, new_state):
+                return {"status": "error", "message": f"Failed to save the ingest state of course {course_id}"}
+        self._invalidate_course_caches(course_id)
+        self._collect_generations_async(course_id)
+        print(f"Rolled back course {course_id} from generation {current} to {new_state['generation']}")
+        return {"status": "success", "generation": new_state["generation"], "rolled_back_from": current}
+
     def clear_knowledge_base(self, course_id: int) -> Dict[str, Any]:
         """
-        Deletes all ingested documents for a specific course from the vector store.
+        Deletes all ingested documents for a specific course from the vector store. Runs under
+        the course lock, so an ingest in progress cannot write chunks or save its state after
+        the clear.
         """
         try:
-            existing_docs = self.vector_store.get(where={"course_id": course_id})
-            if not existing_docs or not existing_docs["ids"]:
-                return {"status": "success", "deleted": 0}
-            ids = existing_docs["ids"]
-            self.vector_store.delete(ids=ids)
-            self.vector_store.persist()
-            return {"status": "success", "deleted": len(ids)}
+            with self._course_lock(course_id):
+                deleted = self._delete_stale_chunks(course_id, {"course_id": course_id}, set())
+                if deleted:
+                    self._store(course_id).persist()
+                ingest_state_store.clear(course_id)
+                self._invalidate_course_caches(course_id)
+            return {"status": "success", "deleted": deleted}
         except Exception as e:
             print(f"Error clearing knowledge base: {e}")
             return {"status": "error", "message": str(e)}
 
-rag_service = RAGService()
+
+class LazyRAGService:
+    """
+    Stand-in for the module-level RAGService. Building the service loads the embedding model,
+    the LLM client and Chroma, so it is deferred to the first attribute access, or to the startup
+    warmup (see app.services.warmup), instead of happening at import time (which used to delay
+    uvicorn answering /health by the whole model load).
+    """
+
+    def __init__(self, factory: Callable[[], RAGService] = RAGService):
+        self._factory = factory
+        self._instance: Optional[RAGService] = None
+        self._lock = threading.Lock()
+        self.init_seconds: Optional[float] = None
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> RAGService:
+        """The RAGService, built on first call (concurrent callers wait for the same build)."""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    self._instance = self._factory()
+                    self.init_seconds = round(time.perf_counter() - started, 3)
+                    print(f"RAG service initialized in {self.init_seconds:.1f}s")
+                instance = self._instance
+        return instance
+
+    async def aget(self) -> RAGService:
+        """get() for async handlers: a pending build is waited for in a worker thread."""
+        instance = self._instance
+        if instance is None:
+            instance = await asyncio.to_thread(self.get)
+        return instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+rag_service = LazyRAGService()
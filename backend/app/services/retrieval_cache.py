@@ -0,0 +1,143 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from app.core.config import settings
+from app.services.answer_cache import normalize_question
+
+# Rough per-entry and per-document bookkeeping cost on top of the texts and vectors.
+_ENTRY_OVERHEAD = 512
+_DOC_OVERHEAD = 256
+
+
+class _Entry:
+    __slots__ = ("course_id", "query", "vector", "docs", "size")
+
+    def __init__(self, course_id: int, query: str, vector: np.ndarray, docs: Tuple[Tuple[Any, str, Dict[str, Any]], ...], size: int):
+        self.course_id = course_id
+        self.query = query
+        self.vector = vector
+        self.docs = docs
+        self.size = size
+
+
+class RetrievalCache:
+    """
+    Vector search results shared by every student: retrieval depends on the course, the query,
+    the metadata filter and k, never on who asks. An entry holds the query embedding and the
+    top-k chunks (id, text, metadata) and is keyed on those inputs plus the course's knowledge
+    base version, so a new ingest, rebuild, rollback or clear stops old results from matching.
+
+    Eviction is LRU, bounded by an estimate of the memory the entries hold (texts, metadata and
+    vectors) rather than by their number, since entries for k=2 study-plan and k=6 chat searches differ a lot.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2**20, enabled: bool = True):
+        self.max_bytes = max(0, int(max_bytes))
+        self._enabled = enabled
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # normalized query -> key of the most recent entry holding its embedding
+        self._vector_keys: Dict[str, str] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled and self.max_bytes > 0
+
+    @staticmethod
+    def key(course_id: int, query: str, filter_where: Optional[Dict[str, Any]], k: int, kb_version: str) -> str:
+        payload = json.dumps(
+            [int(course_id), normalize_question(query), filter_where or {}, int(k), kb_version],
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _drop(self, key: str) -> None:
+        # Caller holds the lock.
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        if self._vector_keys.get(entry.query) == key:
+            del self._vector_keys[entry.query]
+
+    def get(self, key: str) -> Optional[List[Document]]:
+        """The cached chunks (fresh Document objects), or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            docs = entry.docs
+        return [Document(page_content=text, metadata=dict(metadata), id=doc_id) for doc_id, text, metadata in docs]
+
+    def query_vector(self, query: str) -> Optional[List[float]]:
+        """Embedding of the query (normalized as in the key) if any entry holds it."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            key = self._vector_keys.get(normalize_question(query))
+            entry = self._entries.get(key) if key else None
+            return entry.vector.tolist() if entry is not None else None
+
+    def put(self, key: str, course_id: int, query: str, vector: List[float], docs: List[Document]) -> None:
+        if not self.enabled:
+            return
+        stored = tuple((getattr(doc, "id", None), doc.page_content, dict(doc.metadata or {})) for doc in docs)
+        array = np.asarray(vector, dtype=np.float32)
+        size = _ENTRY_OVERHEAD + array.nbytes + sum(
+            _DOC_OVERHEAD + len(text.encode("utf-8")) + len(json.dumps(metadata, default=str))
+            for _, text, metadata in stored
+        )
+        if size > self.max_bytes:
+            return
+        normalized = normalize_question(query)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = _Entry(int(course_id), normalized, array, stored, size)
+            self._vector_keys[normalized] = key
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_course(self, course_id: int) -> int:
+        """Drops the cached results of a course; returns how many there were."""
+        with self._lock:
+            keys = [k for k, entry in self._entries.items() if entry.course_id == int(course_id)]
+            for k in keys:
+                self._drop(k)
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "approx_mb": round(self._bytes / 2**20, 2),
+                "max_mb": round(self.max_bytes / 2**20, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+retrieval_cache = RetrievalCache(
+    max_bytes=int(settings.RETRIEVAL_CACHE_MAX_MB * 2**20),
+    enabled=settings.RETRIEVAL_CACHE_ENABLED,
+)
@@ -0,0 +1,188 @@
+import copy
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from app.core.config import settings
+
+
+class _CourseIndex:
+    """Recent answered questions of one course: a row-normalized embedding matrix plus entries."""
+
+    def __init__(self):
+        self.kb_version: Optional[str] = None
+        self.vectors: Optional[np.ndarray] = None
+        # Parallel to the rows of self.vectors: {"expires_at", "fingerprint", "question", "value"}
+        self.entries: List[Dict[str, Any]] = []
+
+    def clear(self, kb_version: Optional[str] = None) -> int:
+        dropped = len(self.entries)
+        self.kb_version = kb_version
+        self.vectors = None
+        self.entries = []
+        return dropped
+
+    def keep(self, mask: np.ndarray) -> None:
+        self.vectors = self.vectors[mask] if mask.any() else None
+        self.entries = [entry for entry, kept in zip(self.entries, mask) if kept]
+
+
+class SemanticAnswerCache:
+    """
+    Per-course cache of recent chat answers looked up by question embedding, so paraphrases of an
+    answered question ("explain recursion" / "what is recursion?") reuse its answer and sources.
+
+    A lookup only considers entries with the same student-context fingerprint (see
+    app.services.answer_cache.student_fingerprint) and knowledge base version, and serves the most
+    similar one if its cosine similarity reaches `threshold`. A course's index is emptied when its
+    knowledge base version changes; entries also expire after `ttl_s`, and the oldest are dropped
+    beyond `max_entries_per_course`.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries_per_course: int = 500,
+        ttl_s: float = 3600.0,
+        enabled: bool = False,
+    ):
+        self.threshold = float(threshold)
+        self.max_entries_per_course = max(0, int(max_entries_per_course))
+        self.ttl_s = float(ttl_s)
+        self._enabled = enabled
+        self._lock = threading.Lock()
+        self._courses: Dict[int, _CourseIndex] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled and self.max_entries_per_course > 0
+
+    @staticmethod
+    def _normalized(vector: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def _index(self, course_id: int, kb_version: str) -> _CourseIndex:
+        # Caller holds the lock. A new knowledge base version empties the course's index.
+        index = self._courses.setdefault(int(course_id), _CourseIndex())
+        if index.kb_version != kb_version:
+            self.invalidations += index.clear(kb_version)
+        return index
+
+    def _expire(self, index: _CourseIndex) -> None:
+        if not index.entries:
+            return
+        now = time.monotonic()
+        mask = np.array([entry["expires_at"] >= now for entry in index.entries])
+        if not mask.all():
+            self.evictions += int((~mask).sum())
+            index.keep(mask)
+
+    def match(
+        self, course_id: int, kb_version: str, fingerprint: str, vector: Sequence[float]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        The most similar cached entry at or above the threshold, as
+        {"question", "similarity", "value"}, or None. Does not touch the hit counters.
+        """
+        query = self._normalized(vector)
+        with self._lock:
+            index = self._index(course_id, kb_version)
+            self._expire(index)
+            if index.vectors is None or index.vectors.shape[1] != query.shape[0]:
+                return None
+            scores = index.vectors @ query
+            mask = np.array([entry["fingerprint"] == fingerprint for entry in index.entries])
+            scores = np.where(mask, scores, -np.inf)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            entry = index.entries[best]
+            return {"question": entry["question"], "similarity": float(scores[best]), "value": copy.deepcopy(entry["value"])}
+
+    def get(
+        self, course_id: int, kb_version: str, fingerprint: str, vector: Sequence[float]
+    ) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        found = self.match(course_id, kb_version, fingerprint, vector)
+        with self._lock:
+            if found is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return found["value"]
+
+    def put(
+        self,
+        course_id: int,
+        kb_version: str,
+        fingerprint: str,
+        question: str,
+        vector: Sequence[float],
+        value: Dict[str, Any],
+    ) -> None:
+        if not self.enabled:
+            return
+        row = self._normalized(vector)[None, :]
+        entry = {
+            "expires_at": time.monotonic() + self.ttl_s,
+            "fingerprint": fingerprint,
+            "question": question,
+            "value": copy.deepcopy(value),
+        }
+        with self._lock:
+            index = self._index(course_id, kb_version)
+            self._expire(index)
+            if index.vectors is not None and index.vectors.shape[1] != row.shape[1]:
+                index.clear(kb_version)
+            index.vectors = row if index.vectors is None else np.vstack([index.vectors, row])
+            index.entries.append(entry)
+            overflow = len(index.entries) - self.max_entries_per_course
+            if overflow > 0:
+                mask = np.arange(len(index.entries)) >= overflow
+                index.keep(mask)
+                self.evictions += overflow
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def invalidate_course(self, course_id: int) -> int:
+        """Empties a course's index; returns how many entries it held."""
+        with self._lock:
+            index = self._courses.pop(int(course_id), None)
+            dropped = index.clear() if index else 0
+            self.invalidations += dropped
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "entries": sum(len(index.entries) for index in self._courses.values()),
+                "courses": len(self._courses),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "llm_calls_saved": self.hits,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+semantic_cache = SemanticAnswerCache(
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    max_entries_per_course=settings.SEMANTIC_CACHE_MAX_ENTRIES_PER_COURSE,
+    ttl_s=settings.SEMANTIC_CACHE_TTL_S,
+    enabled=settings.SEMANTIC_CACHE_ENABLED,
+)
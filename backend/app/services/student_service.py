@@ -1,4 +1,4 @@
-from typing import Dict, Any
+import asyncio
 import json
 import os
 import re
@@ -131,10 +131,7 @@ class StudentService:
         self._save_student_profiles()
         return profile
         
-    def get_student_profile(self, student_id: int) -> Dict[str, Any]:
-        """
-        Fetches student profile, combining persisted AI attributes with Moodle identity data.
-        """
+    def _stored_profile(self, student_id: int) -> Dict[str, Any]:
         s_id = str(student_id)
         profile = self.student_profiles.get(s_id)
         if not profile:
@@ -146,24 +143,23 @@ class StudentService:
             }
             self.student_profiles[s_id] = profile
             self._save_student_profiles()
+        return profile
+
+    @staticmethod
+    def _user_criteria(student_id: int) -> Dict[str, Any]:
+        return {"criteria": [{"key": "id", "value": str(student_id)}]}
 
+    @staticmethod
+    def _merge_profile(student_id: int, profile: Dict[str, Any], users: Any) -> Dict[str, Any]:
         name = "Unknown"
         email = None
         moodle_id = student_id
 
-        try:
-            users = moodle_client._call_moodle(
-                "core_user_get_users",
-                {"criteria": [{"key": "id", "value": str(student_id)}]}
-            )
-
-            if users and "users" in users and users["users"]:
-                user = users["users"][0]
-                name = f"{user.get('firstname', '')} {user.get('lastname', '')}".strip() or name
-                email = user.get("email", email)
-                moodle_id = user.get("id", moodle_id)
-        except Exception as e:
-            print(f"Error fetching Moodle user for profile {student_id}: {e}")
+        if users and "users" in users and users["users"]:
+            user = users["users"][0]
+            name = f"{user.get('firstname', '')} {user.get('lastname', '')}".strip() or name
+            email = user.get("email", email)
+            moodle_id = user.get("id", moodle_id)
 
         return {
             "id": moodle_id,
@@ -175,11 +171,32 @@ class StudentService:
             "interests": profile.get("interests", [])
         }
 
-    def get_student_progress(self, student_id: int, course_id: int, allow_sync: bool = True) -> Dict[str, Any]:
+    def get_student_profile(self, student_id: int) -> Dict[str, Any]:
         """
-        Fetches student grades and completion status.
-        Tries to read from cache first, unless it's stale (not implemented here) or missing.
+        Fetches student profile, combining persisted AI attributes with Moodle identity data.
         """
+        profile = self._stored_profile(student_id)
+        users = None
+        try:
+            users = moodle_client._call_moodle("core_user_get_users", self._user_criteria(student_id))
+        except Exception as e:
+            print(f"Error fetching Moodle user for profile {student_id}: {e}")
+        return self._merge_profile(student_id, profile, users)
+
+    async def aget_student_profile(self, student_id: int) -> Dict[str, Any]:
+        """
+        Async variant of get_student_profile for request handlers (Moodle call on the event loop,
+        file writes in a worker thread).
+        """
+        profile = await asyncio.to_thread(self._stored_profile, student_id)
+        users = None
+        try:
+            users = await moodle_client._acall_moodle("core_user_get_users", self._user_criteria(student_id))
+        except Exception as e:
+            print(f"Error fetching Moodle user for profile {student_id}: {e}")
+        return self._merge_profile(student_id, profile, users)
+
+    def _cached_progress(self, student_id: int, course_id: int) -> Dict[str, Any]:
         cache_file = os.path.join(PROGRESS_DIR, f"progress_{student_id}_{course_id}.json")
         cached_data = self._load_json_file(cache_file)
         if cached_data:
@@ -192,6 +209,15 @@ class StudentService:
                 max_age_s = 15 * 60
                 if (time.time() - last_synced_ts) <= max_age_s:
                     return cached_data
+        return cached_data
+
+    def get_student_progress(self, student_id: int, course_id: int, allow_sync: bool = True) -> Dict[str, Any]:
+        """
+        Fetches student grades and completion status.
+        Tries to read from cache first, unless it's stale (not implemented here) or missing.
+        """
+        cached_data = self._cached_progress(student_id, course_id)
+        if cached_data:
             return cached_data
 
         if not allow_sync:
@@ -199,6 +225,70 @@ class StudentService:
 
         return self.sync_student_progress(student_id, course_id)
 
+    async def aget_student_progress(self, student_id: int, course_id: int, allow_sync: bool = True) -> Dict[str, Any]:
+        """Async variant of get_student_progress."""
+        cached_data = await asyncio.to_thread(self._cached_progress, student_id, course_id)
+        if cached_data:
+            return cached_data
+
+        if not allow_sync:
+            return {"completed_modules": [], "quiz_scores": {}, "last_synced": None}
+
+        return await self.async_student_progress(student_id, course_id)
+
+    def _progress_from_grades(self, student_id: int, course_id: int, grades_data: Any) -> Dict[str, Any]:
+        """Builds and caches the progress record from a gradereport_user_get_grade_items response."""
+        # DEBUG LOGGING
+        # print(f"DEBUG: Grades response for user {student_id}: {grades_data}")
+        
+        quiz_scores = {}
+        if "usergrades" in grades_data and grades_data["usergrades"]:
+            for item in grades_data["usergrades"][0]["gradeitems"]:
+                if item["itemtype"] == "mod" and item["itemmodule"] == "quiz":
+                    name = item.get("itemname", "Unknown Quiz")
+                    raw = item.get("percentageformatted") or item.get("gradeformatted") or "0"
+                    score = 0.0
+                    if isinstance(raw, (int, float)):
+                        score = float(raw)
+                    elif isinstance(raw, str):
+                        m_pct = re.search(r"(-?\d+(?:\.\d+)?)", raw)
+                        if m_pct:
+                            score = float(m_pct.group(1))
+                        else:
+                            m_frac = re.search(r"(-?\d+(?:\.\d+)?)\s*/\s*(-?\d+(?:\.\d+)?)", raw)
+                            if m_frac:
+                                num = float(m_frac.group(1))
+                                denom = float(m_frac.group(2)) or 1.0
+                                score = (num / denom) * 100.0
+                    if score < 0:
+                        score = 0.0
+                    if score > 100:
+                        score = 100.0
+                    quiz_scores[name] = score
+
+        # 2. Merge with AI Quiz Grades
+        # Structure: self.ai_grades[str(student_id)][str(course_id)] = { "Quiz Name": score }
+        s_id = str(student_id)
+        c_id = str(course_id)
+        if s_id in self.ai_grades and c_id in self.ai_grades[s_id]:
+            ai_scores = self.ai_grades[s_id][c_id]
+            # Merge, AI scores might overwrite if same name (unlikely for "Pop Quiz")
+            # But we want to distinguish them, maybe prepend [AI]
+            for q_name, q_score in ai_scores.items():
+                quiz_scores[f"[AI] {q_name}"] = q_score
+
+        progress_data = {
+            "completed_modules": [], # TODO: Use core_completion_get_course_completion_status
+            "quiz_scores": quiz_scores,
+            "last_synced": time.time()
+        }
+        
+        # Save to cache
+        cache_file = os.path.join(PROGRESS_DIR, f"progress_{student_id}_{course_id}.json")
+        self._save_json_file(cache_file, progress_data)
+        
+        return progress_data
+
     def sync_student_progress(self, student_id: int, course_id: int) -> Dict[str, Any]:
         """
         Fetches fresh progress from Moodle and updates cache.
@@ -206,58 +296,16 @@ class StudentService:
         try:
             # 1. Fetch Grades
             grades_data = moodle_client._call_moodle("gradereport_user_get_grade_items", {"courseid": course_id, "userid": student_id})
-            
-            # DEBUG LOGGING
-            # print(f"DEBUG: Grades response for user {student_id}: {grades_data}")
-            
-            quiz_scores = {}
-            if "usergrades" in grades_data and grades_data["usergrades"]:
-                for item in grades_data["usergrades"][0]["gradeitems"]:
-                    if item["itemtype"] == "mod" and item["itemmodule"] == "quiz":
-                        name = item.get("itemname", "Unknown Quiz")
-                        raw = item.get("percentageformatted") or item.get("gradeformatted") or "0"
-                        score = 0.0
-                        if isinstance(raw, (int, float)):
-                            score = float(raw)
-                        elif isinstance(raw, str):
-                            m_pct = re.search(r"(-?\d+(?:\.\d+)?)", raw)
-                            if m_pct:
-                                score = float(m_pct.group(1))
-                            else:
-                                m_frac = re.search(r"(-?\d+(?:\.\d+)?)\s*/\s*(-?\d+(?:\.\d+)?)", raw)
-                                if m_frac:
-                                    num = float(m_frac.group(1))
-                                    denom = float(m_frac.group(2)) or 1.0
-                                    score = (num / denom) * 100.0
-                        if score < 0:
-                            score = 0.0
-                        if score > 100:
-                            score = 100.0
-                        quiz_scores[name] = score
-
-            # 2. Merge with AI Quiz Grades
-            # Structure: self.ai_grades[str(student_id)][str(course_id)] = { "Quiz Name": score }
-            s_id = str(student_id)
-            c_id = str(course_id)
-            if s_id in self.ai_grades and c_id in self.ai_grades[s_id]:
-                ai_scores = self.ai_grades[s_id][c_id]
-                # Merge, AI scores might overwrite if same name (unlikely for "Pop Quiz")
-                # But we want to distinguish them, maybe prepend [AI]
-                for q_name, q_score in ai_scores.items():
-                    quiz_scores[f"[AI] {q_name}"] = q_score
-
-            progress_data = {
-                "completed_modules": [], # TODO: Use core_completion_get_course_completion_status
-                "quiz_scores": quiz_scores,
-                "last_synced": time.time()
-            }
-            
-            # Save to cache
-            cache_file = os.path.join(PROGRESS_DIR, f"progress_{student_id}_{course_id}.json")
-            self._save_json_file(cache_file, progress_data)
-            
-            return progress_data
-            
+            return self._progress_from_grades(student_id, course_id, grades_data)
+        except Exception as e:
+            print(f"Error fetching progress: {e}")
+            return {"completed_modules": [], "quiz_scores": {}}
+
+    async def async_student_progress(self, student_id: int, course_id: int) -> Dict[str, Any]:
+        """Async variant of sync_student_progress."""
+        try:
+            grades_data = await moodle_client._acall_moodle("gradereport_user_get_grade_items", {"courseid": course_id, "userid": student_id})
+            return await asyncio.to_thread(self._progress_from_grades, student_id, course_id, grades_data)
         except Exception as e:
             print(f"Error fetching progress: {e}")
             return {"completed_modules": [], "quiz_scores": {}}
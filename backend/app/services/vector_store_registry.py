@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
+from app.core.config import settings
+from app.services.compact_vectors import (
+    CompactChroma, CompactVectorIndex, COMPACT_OFF, COMPACT_QUANTIZATIONS,
+    COMPACT_COLLECTION_KEY, COMPACT_COLLECTION_VALUE,
+)
+
+SHARED_COLLECTION = "moodle_content"
+VECTOR_REGISTRY_PATH = os.path.join(settings.APP_DATA_DIR, "vector_collections.json")
+
+LAYOUT_SINGLE = "single"
+LAYOUT_PER_COURSE = "per_course"
+
+
+class VectorStoreRegistry:
+    """
+    Resolves the Chroma collection that holds a course's chunks.
+
+    With the "single" layout every course lives in the shared `moodle_content` collection and
+    queries filter on course_id. With "per_course", each course gets its own collection
+    (`moodle_course_<id>`), or, when `shards` > 0, one of `shards` collections
+    (`moodle_shard_<id % shards>`), so HNSW search and metadata scans only touch that course's
+    (or shard's) chunks.
+
+    The course -> collection assignment is recorded in a small JSON registry the first time
+    chunks are written for a course (reads of other courses do not touch it), so changing the shard count later does not orphan existing courses
+    (use scripts/migrate_vector_layout.py to move data between layouts).
+
+    With `compact_mode` "int8" or "float16", new collections are created compact (see
+    CompactChroma): Chroma keeps documents and metadata, and the vectors live in a quantized
+    CompactVectorIndex stored under <persist_directory>/compact_vectors. Whether an existing
+    collection is compact is read from its metadata, so a collection keeps working when the
+    mode changes (use scripts/compact_vectors.py to convert existing collections).
+
+    Registry layout:
+    {"layout": "per_course", "courses": {"12": "moodle_course_12", "15": "moodle_shard_3"}}
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        persist_directory: str,
+        layout: str = LAYOUT_SINGLE,
+        shards: int = 0,
+        registry_path: str = VECTOR_REGISTRY_PATH,
+        compact_mode: str = COMPACT_OFF,
+        rerank_factor: int = 4,
+    ):
+        if layout not in (LAYOUT_SINGLE, LAYOUT_PER_COURSE):
+            raise ValueError(f"Unknown VECTOR_STORE_LAYOUT '{layout}' (expected '{LAYOUT_SINGLE}' or '{LAYOUT_PER_COURSE}')")
+        if compact_mode not in (COMPACT_OFF,) + COMPACT_QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown VECTOR_COMPACT_MODE '{compact_mode}' (expected one of {', '.join((COMPACT_OFF,) + COMPACT_QUANTIZATIONS)})"
+            )
+        self.embeddings = embeddings
+        self.persist_directory = persist_directory
+        self.layout = layout
+        self.shards = max(0, int(shards or 0))
+        self.registry_path = registry_path
+        self.compact_mode = compact_mode
+        self.rerank_factor = rerank_factor
+        self._lock = threading.Lock()
+        self._stores: Dict[str, Chroma] = {}
+        self._client: Optional[Any] = None
+        self._assignments: Dict[str, str] = self._load_registry()
+
+    def _load_registry(self) -> Dict[str, str]:
+        if not os.path.exists(self.registry_path):
+            return {}
+        try:
+            with open(self.registry_path, "r") as f:
+                data = json.load(f)
+            courses = data.get("courses") if isinstance(data, dict) else None
+            return {str(k): str(v) for k, v in (courses or {}).items()}
+        except Exception as e:
+            print(f"Error loading vector collection registry {self.registry_path}: {e}")
+            return {}
+
+    def _save_registry(self) -> None:
+        # Caller holds self._lock.
+        tmp_path = f"{self.registry_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.registry_path)), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"layout": self.layout, "courses": self._assignments}, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.registry_path)
+        except Exception as e:
+            print(f"Error saving vector collection registry {self.registry_path}: {e}")
+
+    def _default_name(self, course_id: int) -> str:
+        return f"moodle_shard_{int(course_id) % self.shards}" if self.shards else f"moodle_course_{int(course_id)}"
+
+    def collection_name_for(self, course_id: int) -> str:
+        """
+        The collection a course's chunks live in under the configured layout. A course that was
+        never written gets the layout's default name, which is not recorded (see register()).
+        """
+        if self.layout == LAYOUT_SINGLE:
+            return SHARED_COLLECTION
+        with self._lock:
+            return self._assignments.get(str(int(course_id))) or self._default_name(course_id)
+
+    def register(self, course_id: int) -> str:
+        """Like collection_name_for(), but records the assignment; called before writing chunks."""
+        if self.layout == LAYOUT_SINGLE:
+            return SHARED_COLLECTION
+        key = str(int(course_id))
+        with self._lock:
+            name = self._assignments.get(key)
+            if name is None:
+                name = self._assignments[key] = self._default_name(course_id)
+                self._save_registry()
+            return name
+
+    def assign(self, course_id: int, collection_name: str) -> None:
+        """Records the collection of a course explicitly (used by the layout migration)."""
+        with self._lock:
+            self._assignments[str(int(course_id))] = collection_name
+            self._save_registry()
+
+    def _get_client(self) -> Any:
+        # One PersistentClient shared by every collection wrapper.
+        if self._client is None:
+            import chromadb
+            self._client = chromadb.PersistentClient(path=self.persist_directory)
+        return self._client
+
+    def _existing_metadata(self, collection_name: str) -> Optional[Dict[str, Any]]:
+        # Metadata of an existing collection, None when it does not exist yet.
+        try:
+            return self._get_client().get_collection(collection_name).metadata or {}
+        except Exception:
+            return None
+
+    def compact_index_path(self, collection_name: str) -> str:
+        return os.path.join(self.persist_directory, "compact_vectors", f"{collection_name}.sqlite3")
+
+    def compact_index(self, collection_name: str) -> CompactVectorIndex:
+        quantization = self.compact_mode if self.compact_mode != COMPACT_OFF else COMPACT_QUANTIZATIONS[0]
+        return CompactVectorIndex(self.compact_index_path(collection_name), quantization, self.rerank_factor)
+
+    def store(self, collection_name: str) -> Chroma:
+        """The LangChain wrapper of a collection (created on first use)."""
+        with self._lock:
+            store = self._stores.get(collection_name)
+            if store is None:
+                metadata = self._existing_metadata(collection_name)
+                if metadata is None:
+                    compact = self.compact_mode != COMPACT_OFF
+                else:
+                    compact = metadata.get(COMPACT_COLLECTION_KEY) == COMPACT_COLLECTION_VALUE
+                    if compact and self.compact_mode == COMPACT_OFF:
+                        print(f"Collection '{collection_name}' is compact; searching its int8 index "
+                              f"(scripts/compact_vectors.py --to full converts it back)")
+                    elif not compact and self.compact_mode != COMPACT_OFF:
+                        print(f"Collection '{collection_name}' stores full float32 vectors "
+                              f"(scripts/compact_vectors.py --to compact converts it)")
+                options = dict(
+                    client=self._get_client(),
+                    persist_directory=self.persist_directory,
+                    embedding_function=self.embeddings,
+                    collection_name=collection_name,
+                )
+                if compact:
+                    store = CompactChroma(self.compact_index(collection_name), **options)
+                else:
+                    store = Chroma(**options)
+                self._stores[collection_name] = store
+            return store
+
+    def for_course(self, course_id: int, write: bool = False) -> Chroma:
+        """The collection of a course; pass write=True on paths that add chunks to it."""
+        return self.store(self.register(course_id) if write else self.collection_name_for(course_id))
+
+    def shared(self) -> Chroma:
+        return self.store(SHARED_COLLECTION)
+
+    def course_collections(self) -> Dict[str, str]:
+        """Registered course id -> collection name."""
+        with self._lock:
+            return dict(self._assignments)
+
+    def compact_stats(self) -> Dict[str, Any]:
+        """In-memory footprint of the compact indexes opened by this process."""
+        with self._lock:
+            stores = dict(self._stores)
+        return {name: store.index.stats() for name, store in stores.items() if isinstance(store, CompactChroma)}
+
+    def collection_names(self) -> List[str]:
+        return sorted(c.name if hasattr(c, "name") else str(c) for c in self._get_client().list_collections())
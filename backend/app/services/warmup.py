@@ -0,0 +1,153 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+from app.core.config import settings
+from app.services.ingest_state import ingest_state_store
+from app.services.rag_service import rag_service
+
+PROBE_QUERY = "course overview"
+
+
+class WarmupService:
+    """
+    Gets the process ready for chat traffic before the load balancer sends any: builds the RAG
+    service, embeds a probe query (loads the embedding model), runs a probe similarity search for
+    the most recently ingested courses (loads their Chroma segments) and pings the LLM provider
+    (opens its connection). /ready reports ready once this has finished.
+
+    Only building the RAG service or embedding the probe can keep the process unready; those are
+    retried with backoff. A failing course probe or LLM ping is recorded in the status, since
+    holding traffic back would not fix it.
+    """
+
+    def __init__(
+        self,
+        max_courses: int = 20,
+        ping_llm: bool = True,
+        llm_timeout_s: float = 20.0,
+        retry_delay_s: float = 5.0,
+    ):
+        self.max_courses = max(0, int(max_courses))
+        self.ping_llm = ping_llm
+        self.llm_timeout_s = llm_timeout_s
+        self.retry_delay_s = retry_delay_s
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._state = "pending"  # pending | warming | ready | disabled
+        self._attempts = 0
+        self._started_at: Optional[str] = None
+        self._finished_at: Optional[str] = None
+        self._error: Optional[str] = None
+        self._steps: Dict[str, Dict[str, Any]] = {}
+
+    def start(self) -> None:
+        """Runs the warmup in a daemon thread (once per process)."""
+        with self._lock:
+            if self._thread is not None or self._state == "ready":
+                return
+            self._state = "warming"
+            self._started_at = datetime.now().isoformat()
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def disable(self) -> None:
+        """Reports ready without warming up (services are then built by the first request)."""
+        with self._lock:
+            if self._state == "pending":
+                self._state = "disabled"
+
+    def _record(self, step: str, seconds: float, error: Optional[str] = None, **extra: Any) -> None:
+        entry = {"seconds": round(seconds, 3), "ok": error is None, **extra}
+        if error:
+            entry["error"] = error
+        with self._lock:
+            self._steps[step] = entry
+
+    def _timed(self, step: str, fn: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            self._record(step, time.perf_counter() - started, str(e))
+            raise
+        self._record(step, time.perf_counter() - started)
+        return result
+
+    def _run(self) -> None:
+        delay = self.retry_delay_s
+        while True:
+            with self._lock:
+                self._attempts += 1
+            try:
+                self._warm()
+            except Exception as e:
+                print(f"Warning: warmup failed (attempt {self._attempts}), retrying in {delay:g}s: {e}")
+                with self._lock:
+                    self._error = str(e)
+                time.sleep(delay)
+                delay = min(delay * 2, 300.0)
+                continue
+            with self._lock:
+                self._state = "ready"
+                self._error = None
+                self._finished_at = datetime.now().isoformat()
+                total = sum(step["seconds"] for step in self._steps.values())
+            print(f"Warmup finished in {total:.1f}s")
+            return
+
+    def _warm(self) -> None:
+        service = self._timed("rag_service", rag_service.get)
+        self._timed("embed_probe", lambda: service.embeddings.embed_query(PROBE_QUERY))
+
+        started = time.perf_counter()
+        courses = ingest_state_store.course_ids()[:self.max_courses]
+        failed: Dict[str, str] = {}
+        for course_id in courses:
+            try:
+                service._store(course_id).similarity_search(PROBE_QUERY, k=1, filter=service._course_filter(course_id))
+            except Exception as e:
+                failed[str(course_id)] = str(e)
+        self._record(
+            "course_probes", time.perf_counter() - started,
+            f"{len(failed)} of {len(courses)} course probe(s) failed" if failed else None,
+            courses=len(courses), failed=failed,
+        )
+
+        if self.ping_llm:
+            self._ping_llm(service)
+
+    def _ping_llm(self, service: Any) -> None:
+        # The provider call runs on its own thread so a hanging provider only costs llm_timeout_s.
+        started = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=1)
+        error = None
+        try:
+            executor.submit(service.llm.invoke, "Reply with OK.").result(timeout=self.llm_timeout_s)
+        except FutureTimeoutError:
+            error = f"no response within {self.llm_timeout_s:g}s"
+        except Exception as e:
+            error = str(e)
+        finally:
+            executor.shutdown(wait=False)
+        self._record("llm_ping", time.perf_counter() - started, error)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self._state in ("ready", "disabled"),
+                "state": self._state,
+                "attempts": self._attempts,
+                "started_at": self._started_at,
+                "finished_at": self._finished_at,
+                "error": self._error,
+                "steps": {name: dict(step) for name, step in self._steps.items()},
+            }
+
+
+warmup_service = WarmupService(
+    max_courses=settings.WARMUP_MAX_COURSES,
+    ping_llm=settings.WARMUP_PING_LLM,
+    llm_timeout_s=settings.WARMUP_LLM_TIMEOUT_S,
+)
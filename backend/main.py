@@ -1,10 +1,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 import os
 from app.core.config import settings
 from app.api.api import api_router
+from app.services.warmup import warmup_service
+from app.services.moodle_client import moodle_client
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -22,6 +24,18 @@ app.add_middleware(
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+@app.on_event("startup")
+def start_warmup():
+    # Loading the models and vector store off the request path keeps /health responsive.
+    if settings.RAG_INIT_ON_STARTUP:
+        warmup_service.start()
+    else:
+        warmup_service.disable()
+
+@app.on_event("shutdown")
+async def close_moodle_client():
+    await moodle_client.aclose()
+
 @app.get(settings.API_V1_STR)
 @app.get(f"{settings.API_V1_STR}/")
 def api_root():
@@ -30,12 +44,24 @@ def api_root():
         "openapi": f"{settings.API_V1_STR}/openapi.json",
         "docs": "/docs",
         "health": "/health",
+        "ready": "/ready",
     }
 
+# Health and readiness are async so they are answered on the event loop even when every worker
+# thread is busy.
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy", "moodle_url": settings.MOODLE_URL}
 
+@app.get("/ready")
+async def readiness_check():
+    # Unlike /health (the process is up), only 200 once the startup warmup has finished, so a
+    # load balancer can hold traffic until the first chat no longer pays for model loading.
+    status = warmup_service.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
 # Mount static files and serve frontend
 frontend_dist = os.path.join(os.path.dirname(__file__), "..", "frontend", "dist")
 
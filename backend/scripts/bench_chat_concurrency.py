@@ -0,0 +1,209 @@
+import sys
+import os
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import shutil
+import multiprocessing
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+ANSWER = "Summary:\n- Recursion solves a problem by calling itself on a smaller input.\nSource check:\n- Verify using sources below."
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(port: int, timeout_s: float = 120.0) -> None:
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def serve_moodle(port: int, latency_s: float) -> None:
+    """Stand-in Moodle REST endpoint answering the calls a chat makes, after `latency_s`."""
+    import uvicorn
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+
+    @app.api_route("/webservice/rest/server.php", methods=["GET", "POST"])
+    async def rest(request: Request):
+        params = dict(request.query_params)
+        params.update(dict(await request.form()))
+        await asyncio.sleep(latency_s)
+        if params.get("wsfunction") == "core_user_get_users":
+            user_id = params.get("criteria[0][value]", "0")
+            return {"users": [{"id": int(user_id), "firstname": "Student", "lastname": user_id, "email": f"s{user_id}@example.edu"}]}
+        if params.get("wsfunction") == "gradereport_user_get_grade_items":
+            return {"usergrades": [{"gradeitems": [
+                {"itemtype": "mod", "itemmodule": "quiz", "itemname": "Quiz 1 - Recursion", "percentageformatted": "62.00 %"},
+            ]}]}
+        return {}
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def serve_app(port: int, work_dir: str, llm_latency_s: float) -> None:
+    """The backend with a simulated LLM provider, plus /bench/chat-sync: the blocking pipeline."""
+    import uvicorn
+    from langchain_core.language_models.llms import LLM
+    from app.services.rag_service import RAGService, HashEmbeddings, rag_service
+    from synthetic_moodle import SyntheticMoodleClient
+    from app.services.conversation_service import conversation_service
+    from app.api.endpoints.chat import ChatRequest
+    import main
+
+    class SimulatedLLM(LLM):
+        """Answers after a fixed delay, like a hosted provider: the wait is network I/O, not CPU."""
+        latency_s: float = 2.0
+
+        @property
+        def _llm_type(self) -> str:
+            return "simulated"
+
+        def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+            time.sleep(self.latency_s)
+            return ANSWER
+
+        async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(self.latency_s)
+            return ANSWER
+
+    synthetic = SyntheticMoodleClient(courses=1, sections=6, modules_per_section=4, attachments=0, forums=0)
+    service = RAGService(
+        embeddings=HashEmbeddings(),
+        llm=SimulatedLLM(latency_s=llm_latency_s),
+        persist_directory=os.path.join(work_dir, "chroma"),
+        moodle=synthetic,
+    )
+    service.ingest_course_content(1)
+    rag_service._factory = lambda: service
+
+    @main.app.post("/bench/chat-sync")
+    def chat_sync(request: ChatRequest):
+        # The /ai/chat pipeline through blocking calls in a sync handler (the previous design).
+        conversation_service.add_message(request.course_id, request.student_id, "user", request.question)
+        result = rag_service.ask_question(request.course_id, request.question, request.student_id)
+        payload = json.dumps({"type": "chat", "text": result["answer"], "sources": result["sources"]})
+        conversation_service.add_message(request.course_id, request.student_id, "assistant", payload)
+        return result
+
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _pct(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+
+
+async def burst(base_url: str, path: str, concurrency: int, students: int):
+    """
+    Sends `concurrency` chats at once while probing GET /ai/chat/history every 100 ms; that
+    handler is a plain sync one, so its latency shows how long other requests queue for a
+    worker thread during the burst.
+    """
+    import httpx
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=600.0) as client:
+        latencies, probes, errors = [], [], 0
+        done = asyncio.Event()
+
+        async def one(i: int):
+            nonlocal errors
+            body = {"course_id": 1, "student_id": 1000 + i % students, "question": f"Explain recursion (request {i})"}
+            t0 = time.perf_counter()
+            response = await client.post(path, json=body)
+            latencies.append(time.perf_counter() - t0)
+            if response.status_code != 200:
+                errors += 1
+
+        async def probe():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                await client.get("/api/v1/ai/chat/history", params={"course_id": 1, "student_id": 1, "limit": 1})
+                probes.append((time.perf_counter() - t0) * 1000)
+                await asyncio.sleep(0.1)
+
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(concurrency)))
+        wall = time.perf_counter() - started
+        done.set()
+        await prober
+    return wall, latencies, probes, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Concurrent /ai/chat load against one uvicorn worker: async pipeline vs the blocking (sync handler) pipeline."
+    )
+    parser.add_argument("--concurrency", default="10,50,100,200,400", help="Comma-separated numbers of simultaneous chats")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Seconds the simulated LLM provider takes per answer")
+    parser.add_argument("--moodle-latency", type=float, default=0.05, help="Seconds the stand-in Moodle takes per call")
+    parser.add_argument("--moodle-max-concurrency", type=int, default=None, help="MOODLE_MAX_CONCURRENCY for the backend (default: settings)")
+    parser.add_argument("--students", type=int, default=50, help="Distinct student ids across the requests")
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench-chat-concurrency-")
+    moodle_port, app_port = _free_port(), _free_port()
+    # Inherited by the spawned server processes.
+    os.environ.update(
+        MOODLE_URL=f"http://127.0.0.1:{moodle_port}",
+        MOODLE_TOKEN="bench",
+        APP_DATA_DIR=os.path.join(work_dir, "app_data"),
+        CHAT_DB_PATH=os.path.join(work_dir, "chat.db"),
+        QUIZ_DATA_DIR=os.path.join(work_dir, "quizzes"),
+        CHROMA_PERSIST_DIR=os.path.join(work_dir, "chroma"),
+        RAG_INIT_ON_STARTUP="False",
+        ANONYMIZED_TELEMETRY="False",
+    )
+    if args.moodle_max_concurrency:
+        os.environ["MOODLE_MAX_CONCURRENCY"] = str(args.moodle_max_concurrency)
+
+    context = multiprocessing.get_context("spawn")
+    moodle = context.Process(target=serve_moodle, args=(moodle_port, args.moodle_latency), daemon=True)
+    backend = context.Process(target=serve_app, args=(app_port, work_dir, args.llm_latency), daemon=True)
+    rows = []
+    try:
+        moodle.start()
+        backend.start()
+        _wait_for(moodle_port)
+        _wait_for(app_port)
+        base_url = f"http://127.0.0.1:{app_port}"
+        paths = {"sync": "/bench/chat-sync", "async": "/api/v1/ai/chat"}
+        for mode in args.modes.split(","):
+            asyncio.run(burst(base_url, paths[mode], 2, 2))  # warm up both paths
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                wall, latencies, probes, errors = asyncio.run(burst(base_url, paths[mode], concurrency, args.students))
+                rows.append((mode, concurrency, wall, concurrency / wall, _pct(latencies, 0.5), _pct(latencies, 0.95),
+                             _pct(probes, 0.5), max(probes) if probes else float("nan"), errors))
+                print(f"{mode} x{concurrency}: {wall:.1f}s")
+    finally:
+        backend.terminate()
+        moodle.terminate()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\nOne worker, LLM {args.llm_latency:g}s per answer, Moodle {args.moodle_latency * 1000:g} ms per call, "
+          f"MOODLE_MAX_CONCURRENCY={args.moodle_max_concurrency or 'default'}")
+    print(f"{'pipeline':<8} {'chats':>6} {'wall s':>7} {'chats/s':>8} {'p50 s':>7} {'p95 s':>7} "
+          f"{'history p50 ms':>15} {'history max ms':>15} {'errors':>7}")
+    for mode, concurrency, wall, rate, p50, p95, h50, hmax, errors in rows:
+        print(f"{mode:<8} {concurrency:>6} {wall:>7.1f} {rate:>8.1f} {p50:>7.2f} {p95:>7.2f} {h50:>15.1f} {hmax:>15.1f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import sys
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def dataset(chunks: int, courses: int, dim: int, topics: int, noise: float, seed: int):
+    """
+    Clustered unit vectors standing in for chunk embeddings: each course has `topics` topic
+    centroids and every chunk is a noisy copy of one of them, so neighbours are close but
+    not trivially separated (uniform random vectors would flatter every method).
+    """
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((courses, topics, dim)).astype(np.float32)
+    course_of = rng.integers(1, courses + 1, size=chunks)
+    topic_of = rng.integers(0, topics, size=chunks)
+    vectors = centroids[course_of - 1, topic_of] + noise * rng.standard_normal((chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, course_of
+
+
+def queries_for(vectors: np.ndarray, course_of: np.ndarray, count: int, noise: float, seed: int):
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, len(vectors), size=count)
+    queries = vectors[picks] + noise * rng.standard_normal((count, vectors.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries, course_of[picks]
+
+
+def exact_top_k(vectors: np.ndarray, course_of: np.ndarray, query: np.ndarray, course_id: int, k: int):
+    rows = np.flatnonzero(course_of == course_id)
+    distances = ((vectors[rows] - query) ** 2).sum(axis=1)
+    return set(rows[np.argsort(distances)[:k]].tolist())
+
+
+def _registry(data_dir: str, mode: str, rerank_factor: int):
+    from app.services.vector_store_registry import VectorStoreRegistry
+    return VectorStoreRegistry(
+        None, data_dir, registry_path=os.path.join(data_dir, "registry.json"),
+        compact_mode=mode, rerank_factor=rerank_factor,
+    )
+
+
+def load(data_dir: str, mode: str, vectors: np.ndarray, course_of: np.ndarray, batch: int) -> float:
+    store = _registry(data_dir, mode, 4).shared()
+    t0 = time.perf_counter()
+    for start in range(0, len(vectors), batch):
+        end = min(len(vectors), start + batch)
+        ids = [str(i) for i in range(start, end)]
+        documents = [f"chunk {i}" for i in range(start, end)]
+        metadatas = [{"course_id": int(course_of[i]), "chunk": i} for i in range(start, end)]
+        if mode == "off":
+            store._collection.upsert(ids=ids, embeddings=vectors[start:end], documents=documents, metadatas=metadatas)
+        else:
+            store.upsert_vectors(ids, vectors[start:end], documents, metadatas)
+    return time.perf_counter() - t0
+
+
+def measure(data_dir: str, mode: str, rerank_factor: int, queries: np.ndarray, query_courses: np.ndarray, k: int):
+    """Runs in a fresh process so the RSS growth is what this storage mode loads to serve queries."""
+    registry = _registry(data_dir, mode, rerank_factor)
+    registry._get_client()  # chromadb's import and client start-up are not part of the measured growth
+    before = _rss_mb()
+    store = registry.shared()
+    results, latencies = [], []
+    for query, course_id in zip(queries, query_courses):
+        t0 = time.perf_counter()
+        hits = store.similarity_search_by_vector_with_relevance_scores(
+            query.tolist(), k=k, filter={"course_id": {"$eq": int(course_id)}}
+        )
+        latencies.append((time.perf_counter() - t0) * 1000)
+        results.append([doc.metadata["chunk"] for doc, _ in hits])
+    index_bytes = store.index.stats()["memory_bytes_per_chunk"] if hasattr(store, "index") else None
+    return results, latencies, _rss_mb() - before, index_bytes
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare memory, recall@k and latency of float32 Chroma storage with the compact int8/float16 modes."
+    )
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--courses", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size (384 = bge-small / HashEmbeddings)")
+    parser.add_argument("--topics", type=int, default=40, help="Topic clusters per course")
+    parser.add_argument("--noise", type=float, default=0.08, help="Per-dimension spread of chunks around their topic")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=6, help="Results per query (ask_question uses 6)")
+    parser.add_argument("--rerank-factor", type=int, default=4, help="VECTOR_COMPACT_RERANK_FACTOR")
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--data-dir", help="Work directory (default: a temporary directory, removed afterwards)")
+    args = parser.parse_args()
+
+    vectors, course_of = dataset(args.chunks, args.courses, args.dim, args.topics, args.noise, args.seed)
+    queries, query_courses = queries_for(vectors, course_of, args.queries, args.noise, args.seed)
+    truth = [exact_top_k(vectors, course_of, q, c, args.k) for q, c in zip(queries, query_courses)]
+
+    work_dir = args.data_dir or tempfile.mkdtemp(prefix="bench-compact-vectors-")
+    # Inherited by the spawned measurement processes.
+    os.environ.setdefault("MOODLE_URL", "http://synthetic.moodle")
+    os.environ["APP_DATA_DIR"] = os.path.join(work_dir, "app_data")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    full_dir, compact_dir = os.path.join(work_dir, "full"), os.path.join(work_dir, "compact")
+    # (label, data directory, VECTOR_COMPACT_MODE, rerank factor)
+    variants = [
+        ("float32 (off)", full_dir, "off", args.rerank_factor),
+        (f"int8 rerank x{args.rerank_factor}", compact_dir, "int8", args.rerank_factor),
+        ("int8 no rerank", compact_dir, "int8", 1),
+        (f"float16 rerank x{args.rerank_factor}", compact_dir, "float16", args.rerank_factor),
+    ]
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    try:
+        print(f"Loading {args.chunks:,} chunks (float32)...")
+        load_full = load(full_dir, "off", vectors, course_of, args.batch)
+        print(f"Loading {args.chunks:,} chunks (compact)...")
+        load_compact = load(compact_dir, "int8", vectors, course_of, args.batch)
+        disk = {full_dir: _dir_bytes(full_dir), compact_dir: _dir_bytes(compact_dir)}
+        for label, data_dir, mode, factor in variants:
+            with context.Pool(1) as pool:
+                results, latencies, rss_mb, index_bytes = pool.apply(
+                    measure, (data_dir, mode, factor, queries, query_courses, args.k)
+                )
+            recall = np.mean([len(set(r) & t) / args.k for r, t in zip(results, truth)])
+            rows.append((label, data_dir, rss_mb, index_bytes, recall, np.percentile(latencies, 50), np.percentile(latencies, 95)))
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{args.chunks:,} chunks, {args.courses} courses, dim {args.dim}, {args.queries} filtered queries, k={args.k}")
+    print(f"load: float32 {load_full:.1f}s, compact {load_compact:.1f}s")
+    print(f"{'storage':<20} {'RSS MB':>8} {'RSS B/chunk':>12} {'index B/chunk':>14} {'disk B/chunk':>13} "
+          f"{'recall@' + str(args.k):>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, data_dir, rss_mb, index_bytes, recall, p50, p95 in rows:
+        print(f"{label:<20} {rss_mb:>8.1f} {rss_mb * 2**20 / args.chunks:>12.0f} {index_bytes if index_bytes else '-':>14} "
+              f"{disk[data_dir] / args.chunks:>13.0f} {recall:>9.3f} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
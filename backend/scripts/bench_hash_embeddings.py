@@ -0,0 +1,95 @@
+import sys
+import os
+import math
+import time
+import hashlib
+import argparse
+import random
+from typing import List
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+
+class LegacyHashEmbeddings:
+    # The previous per-value implementation of HashEmbeddings, kept as the reference output.
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        base = hashlib.sha256(text.encode("utf-8", errors="ignore")).digest()
+        vec: List[float] = []
+        counter = 0
+        while len(vec) < self.dim:
+            h = hashlib.sha256(base + counter.to_bytes(4, "little")).digest()
+            for b in h:
+                vec.append((b / 127.5) - 1.0)
+                if len(vec) >= self.dim:
+                    break
+            counter += 1
+        norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+        return [x / norm for x in vec]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t or "") for t in texts]
+
+
+def make_chunks(n: int, seed: int) -> List[str]:
+    # Chunk-sized texts (~1000 chars, like RecursiveCharacterTextSplitter output), all distinct.
+    rng = random.Random(seed)
+    words = "course module lecture week quiz forum answer theorem proof vector matrix student".split()
+    return [f"Chunk {i}: " + " ".join(rng.choice(words) for _ in range(160)) for i in range(n)]
+
+
+def best_of(fn, repeats: int) -> float:
+    best = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HashEmbeddings against the previous per-value implementation.")
+    parser.add_argument("--chunks", type=int, default=10_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from app.services.rag_service import HashEmbeddings
+
+    texts = make_chunks(args.chunks, args.seed) + ["", "x"]
+    legacy = LegacyHashEmbeddings(args.dim)
+    current = HashEmbeddings(args.dim)
+
+    reference = legacy.embed_documents(texts)
+    as_lists = current.embed_documents(texts)
+    as_array = current.embed_batch(texts)
+    identical = as_lists == reference
+    identical_f32 = np.array_equal(as_array, np.asarray(reference, dtype=np.float32))
+    max_diff = float(np.max(np.abs(np.asarray(as_lists) - np.asarray(reference))))
+    print(f"{len(texts):,} texts, dim {args.dim}")
+    print(f"embed_documents identical to legacy: {identical} (max abs diff {max_diff:.1e})")
+    print(f"embed_batch identical to legacy as float32: {identical_f32} "
+          f"(dtype {as_array.dtype}, C-contiguous {as_array.flags['C_CONTIGUOUS']})")
+
+    texts = texts[:args.chunks]
+    legacy_s = best_of(lambda: legacy.embed_documents(texts), args.repeats)
+    lists_s = best_of(lambda: current.embed_documents(texts), args.repeats)
+    array_s = best_of(lambda: current.embed_batch(texts), args.repeats)
+    print(f"\n{'implementation':<28} {'total':>9} {'per chunk':>11} {'speedup':>8}")
+    for label, seconds in (
+        ("legacy (per value)", legacy_s),
+        ("embed_documents (lists)", lists_s),
+        ("embed_batch (float32 array)", array_s),
+    ):
+        print(f"{label:<28} {seconds * 1000:7.1f}ms {seconds / len(texts) * 1e6:9.1f}us {legacy_s / seconds:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
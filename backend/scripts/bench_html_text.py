@@ -0,0 +1,111 @@
+import sys
+import os
+import re
+import time
+import argparse
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from app.services.html_text import html_to_text
+
+# Page HTML as produced by Moodle's Atto/TinyMCE editors, with an embedded MathJax config
+# and a filter-injected style block, as found on typical course pages.
+SAMPLE_PAGE_HTML = """
+<div class="no-overflow"><h3 dir="ltr" style="text-align: left;">Week 3 &ndash; Sorting &amp; Searching</h3>
+<p dir="ltr" style="text-align: left;"><span style="font-size: 0.9375rem;">In this week&rsquo;s lecture we compare
+<strong>insertion sort</strong>, <strong>merge sort</strong> and <em>quick sort</em>.&nbsp;&nbsp;Read chapter&nbsp;7
+before the lab.</span><br></p>
+<p dir="ltr" style="text-align: left;"><br></p>
+<ul>
+  <li><p dir="ltr">Complexity: O(n&nbsp;log&nbsp;n) average, O(n<sup>2</sup>) worst case</p></li>
+  <li><p dir="ltr">Stable vs. unstable sorts &mdash; why it matters</p></li>
+  <li><p dir="ltr">Binary search requires sorted input &lt;= see notes</p></li>
+</ul>
+<table class="generaltable"><thead><tr><th>Algorithm</th><th>Best</th><th>Worst</th></tr></thead>
+<tbody><tr><td>Insertion</td><td>O(n)</td><td>O(n&sup2;)</td></tr>
+<tr><td>Merge</td><td>O(n log n)</td><td>O(n log n)</td></tr></tbody></table>
+<script type="text/x-mathjax-config">
+MathJax.Hub.Config({ config: ["Accessible.js", "Safe.js"], errorSettings: { message: ["!"] },
+  skipStartupTypeset: true, messageStyle: "none" });
+</script>
+<script src="https://cdn.jsdelivr.net/npm/mathjax@2.7.9/MathJax.js?delayStartupUntil=configured"></script>
+<style type="text/css">.filter_mathjaxloader_equation { display: inline-block; } .nolink { white-space: nowrap; }</style>
+<p dir="ltr" style="text-align: left;"><a href="https://moodle.example.edu/mod/resource/view.php?id=42">Lecture slides (PDF)</a>
+&nbsp;|&nbsp;<a href="https://moodle.example.edu/mod/quiz/view.php?id=43">Practice quiz</a></p>
+<!-- Generated by the course template -->
+</div>
+"""
+
+_LEGACY_TAG_RE_SOURCE = '<.*?>'
+
+
+def legacy_clean_html(raw_html: str) -> str:
+    # The previous RAGService._clean_html, including the per-call re.compile.
+    if not raw_html:
+        return ""
+    cleanr = re.compile(_LEGACY_TAG_RE_SOURCE)
+    cleantext = re.sub(cleanr, '', raw_html)
+    return cleantext.strip()
+
+
+def load_course_html(course_id: int):
+    from app.services.moodle_client import moodle_client
+
+    pages = []
+    for section in moodle_client.get_course_contents(course_id) or []:
+        for module in section.get("modules", []):
+            if module.get("description"):
+                pages.append(module["description"])
+            for item in module.get("contents") or []:
+                if isinstance(item, dict) and item.get("content"):
+                    pages.append(item["content"])
+    return pages
+
+
+def bench(label: str, fn, pages, repeats: int):
+    best = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = [fn(p) for p in pages]
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    per_page_us = best / max(1, len(pages)) * 1e6
+    print(f"{label:<22} {best * 1000:8.1f} ms total   {per_page_us:7.1f} us/page")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML-to-text extraction for Moodle content.")
+    parser.add_argument("--course-id", type=int, help="Use descriptions/page content of a live Moodle course")
+    parser.add_argument("--pages", type=int, default=2000, help="Pages built from the bundled sample (default 2000)")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.course_id:
+        pages = load_course_html(args.course_id)
+        print(f"Loaded {len(pages)} HTML fields from course {args.course_id}")
+        if not pages:
+            return
+    else:
+        # Pages of 1-6 sample blocks, so long pages span several chunks like real course pages.
+        pages = [SAMPLE_PAGE_HTML * (1 + i % 6) for i in range(args.pages)]
+        print(f"Using {len(pages)} pages built from the bundled Moodle page sample")
+
+    legacy_out = bench("legacy regex", legacy_clean_html, pages, args.repeats)
+    new_out = bench("html_to_text", html_to_text, pages, args.repeats)
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    legacy_chars = sum(len(t) for t in legacy_out)
+    new_chars = sum(len(t) for t in new_out)
+    legacy_chunks = sum(len(splitter.split_text(t)) for t in legacy_out)
+    new_chunks = sum(len(splitter.split_text(t)) for t in new_out)
+    print(f"\nText size:   {legacy_chars:,} -> {new_chars:,} chars ({100 * (1 - new_chars / max(1, legacy_chars)):.1f}% smaller)")
+    print(f"Chunk count: {legacy_chunks:,} -> {new_chunks:,} ({100 * (1 - new_chunks / max(1, legacy_chunks)):.1f}% fewer)")
+    if not args.course_id:
+        print("\nSample output (first block):\n" + html_to_text(SAMPLE_PAGE_HTML))
+
+
+if __name__ == "__main__":
+    main()
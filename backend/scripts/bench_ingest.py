@@ -0,0 +1,149 @@
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark ingest_course_content against a synthetic Moodle course with HashEmbeddings."
+    )
+    parser.add_argument("--sections", type=int, default=10)
+    parser.add_argument("--modules", type=int, default=8, help="Modules per section")
+    parser.add_argument("--attachments", type=int, default=20, help="PDF/DOCX files in the course (alternating)")
+    parser.add_argument("--pdf-pages", type=int, default=8)
+    parser.add_argument("--docx-pages", type=int, default=4)
+    parser.add_argument("--forums", type=int, default=4)
+    parser.add_argument("--discussions", type=int, default=5, help="Discussions per forum")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Added to every Moodle call and download")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0, help="Download bandwidth, 0 = unlimited")
+    parser.add_argument("--runs", type=int, default=1, help="Full ingests of the same course (later runs hit the caches)")
+    parser.add_argument("--incremental", action="store_true", help="Run an extra incremental ingest after the full runs")
+    parser.add_argument("--embedding-cache", action="store_true", help="Keep the embedding cache enabled")
+    parser.add_argument("--data-dir", help="Work directory (default: a temporary directory, removed afterwards)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so point every store at the work directory first.
+    work_dir = args.data_dir or tempfile.mkdtemp(prefix="bench-ingest-")
+    os.environ.setdefault("MOODLE_URL", "http://synthetic.moodle")
+    os.environ.setdefault("MOODLE_TOKEN", "synthetic")
+    os.environ["APP_DATA_DIR"] = os.path.join(work_dir, "app_data")
+    os.environ["CHROMA_PERSIST_DIR"] = os.path.join(work_dir, "chroma")
+    os.environ["CHAT_DB_PATH"] = os.path.join(work_dir, "chat_history.db")
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "true" if args.embedding_cache else "false"
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+    from synthetic_moodle import SyntheticMoodleClient
+    from app.services.rag_service import RAGService, HashEmbeddings
+
+    class TimedEmbeddings(HashEmbeddings):
+        """HashEmbeddings that accumulate the time spent embedding."""
+        def __init__(self):
+            super().__init__()
+            self.seconds = 0.0
+            self.texts = 0
+            self._lock = threading.Lock()
+
+        def embed_documents(self, texts):
+            t0 = time.perf_counter()
+            vectors = super().embed_documents(texts)
+            with self._lock:
+                self.seconds += time.perf_counter() - t0
+                self.texts += len(texts)
+            return vectors
+
+    moodle = SyntheticMoodleClient(
+        sections=args.sections,
+        modules_per_section=args.modules,
+        attachments=args.attachments,
+        pdf_pages=args.pdf_pages,
+        docx_pages=args.docx_pages,
+        forums=args.forums,
+        discussions_per_forum=args.discussions,
+        latency_ms=args.latency_ms,
+        bandwidth_mbps=args.bandwidth_mbps,
+        seed=args.seed,
+    )
+    embeddings = TimedEmbeddings()
+    rss_before = peak_rss_mb()
+    service = RAGService(embeddings=embeddings, persist_directory=os.environ["CHROMA_PERSIST_DIR"], moodle=moodle)
+
+    course_id = 1
+    plan = ["full"] * max(1, args.runs) + (["incremental"] if args.incremental else [])
+    results = []
+    try:
+        for mode in plan:
+            embed_s, embedded = embeddings.seconds, embeddings.texts
+            calls_before = dict(moodle.calls)
+            t0 = time.perf_counter()
+            result = service.ingest_course_content(course_id, incremental=(mode == "incremental"))
+            wall_s = time.perf_counter() - t0
+            timings = result.get("timings") or {}
+            run_embed_s = embeddings.seconds - embed_s
+            modules = result.get("progress", {}).get("modules_total", 0)
+            chunks = result.get("chunks_count", 0)
+            results.append({
+                "mode": mode,
+                "wall_s": round(wall_s, 3),
+                "modules": modules,
+                "files": result.get("progress", {}).get("files_total", 0),
+                "chunks": chunks,
+                "texts_embedded": embeddings.texts - embedded,
+                "modules_per_s": round(modules / wall_s, 1) if wall_s else None,
+                "chunks_per_s": round(chunks / wall_s, 1) if wall_s else None,
+                "embed_s": round(run_embed_s, 3),
+                "chroma_write_s": round(max(0.0, timings.get("store_s", 0.0) - run_embed_s), 3),
+                "timings": timings,
+                "moodle_calls": {k: v - calls_before.get(k, 0) for k, v in moodle.calls.items() if v - calls_before.get(k, 0)},
+                "peak_rss_mb": round(peak_rss_mb(), 1),
+            })
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "course": {
+            "sections": args.sections, "modules_per_section": args.modules, "attachments": args.attachments,
+            "pdf_pages": args.pdf_pages, "docx_pages": args.docx_pages, "forums": args.forums,
+            "latency_ms": args.latency_ms, "bandwidth_mbps": args.bandwidth_mbps,
+        },
+        "runs": results,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_before_ingest_mb": round(rss_before, 1),
+        "peak_rss_children_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"\nSynthetic course: {json.dumps(report['course'])}")
+    print(f"\n{'run':<12} {'wall s':>7} {'modules':>7} {'files':>5} {'chunks':>6} {'mod/s':>7} {'chunk/s':>8} "
+          f"{'embed s':>7} {'chroma s':>8} {'fetch s':>7} {'assemble s':>10} {'rss MB':>7}")
+    for r in results:
+        print(
+            f"{r['mode']:<12} {r['wall_s']:>7.2f} {r['modules']:>7} {r['files']:>5} {r['chunks']:>6} "
+            f"{r['modules_per_s']:>7} {r['chunks_per_s']:>8} {r['embed_s']:>7.2f} {r['chroma_write_s']:>8.2f} "
+            f"{r['timings'].get('fetch_s', 0):>7.2f} {r['timings'].get('assemble_s', 0):>10.2f} {r['peak_rss_mb']:>7.1f}"
+        )
+    print(f"\nPeak RSS: {report['peak_rss_mb']} MB (before ingest {report['peak_rss_before_ingest_mb']} MB, "
+          f"largest child process {report['peak_rss_children_mb']} MB)")
+
+
+if __name__ == "__main__":
+    main()
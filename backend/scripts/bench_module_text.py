@@ -0,0 +1,125 @@
+import sys
+import os
+import hashlib
+import time
+import random
+import tracemalloc
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+from app.services.module_text import ModuleTextBuilder
+
+# Synthetic module: ~5MB of page contents and extracted attachment bodies.
+PAGE_COUNT = 60
+PAGE_CHARS = 20_000
+ATTACHMENT_COUNT = 12
+ATTACHMENT_CHARS = 320_000
+REPEATS = 3
+
+WORDS = ["lecture", "module", "graph", "theorem", "student", "week", "matrix", "proof", "data", "model"]
+
+
+def _paragraphs(rng: random.Random, chars: int) -> str:
+    out = []
+    size = 0
+    while size < chars:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(12)) + ".\n"
+        out.append(sentence)
+        size += len(sentence)
+    return "".join(out)[:chars]
+
+
+def build_module():
+    rng = random.Random(42)
+    pages = [_paragraphs(rng, PAGE_CHARS) for _ in range(PAGE_COUNT)]
+    attachments = [(f"file_{i}.pdf", _paragraphs(rng, ATTACHMENT_CHARS)) for i in range(ATTACHMENT_COUNT)]
+    return pages, attachments
+
+
+def legacy_assemble(pages, attachments) -> str:
+    # Mirrors the previous `content_text +=` assembly in RAGService.
+    content_text = "Course ID: 1\nSection: Week 1\nModule: Big module\nType: resource\n"
+    content_text += "Description: A very large module\n"
+    for page in pages:
+        content_text += f"Content: {page}\n"
+    for filename, body in attachments:
+        content_text += f"File Attachment: {filename}\n"
+        content_text += f"--- PDF CONTENT START ({filename}) ---\n{body}\n--- PDF CONTENT END ---\n"
+    return content_text
+
+
+def builder_assemble(pages, attachments, max_chars: int = 0) -> ModuleTextBuilder:
+    text = ModuleTextBuilder(max_chars=max_chars)
+    text.append("Course ID: 1\nSection: Week 1\nModule: Big module\nType: resource\n")
+    text.append("Description: ")
+    text.line("A very large module")
+    for page in pages:
+        text.append("Content: ")
+        text.line(page)
+    for filename, body in attachments:
+        text.new_section()
+        text.line(f"File Attachment: {filename}")
+        text.line(f"--- PDF CONTENT START ({filename}) ---")
+        text.line(body)
+        text.line("--- PDF CONTENT END ---")
+    return text
+
+
+def measure(label: str, fn):
+    best = None
+    for _ in range(REPEATS):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if best is None or elapsed < best[0]:
+            best = (elapsed, peak, result)
+    elapsed, peak, result = best
+    print(f"{label:<42} {elapsed * 1000:9.1f} ms   peak {peak / 1e6:7.1f} MB   {result}")
+    return elapsed
+
+
+def main():
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    pages, attachments = build_module()
+    total = sum(len(p) for p in pages) + sum(len(b) for _, b in attachments)
+    print(f"Synthetic module: {total / 1e6:.1f}M chars ({PAGE_COUNT} pages, {ATTACHMENT_COUNT} attachments)\n")
+
+    print("Assembly only")
+    measure(
+        "legacy += assembly + sha256",
+        lambda: hashlib.sha256(legacy_assemble(pages, attachments).encode("utf-8", errors="ignore")).hexdigest()[:12],
+    )
+    measure("ModuleTextBuilder + content_hash", lambda: builder_assemble(pages, attachments).content_hash()[:12])
+
+    print("\nAssembly + hash + split")
+
+    def legacy_full():
+        content_text = legacy_assemble(pages, attachments)
+        hashlib.sha256(content_text.encode("utf-8", errors="ignore")).hexdigest()
+        chunks = splitter.split_documents([Document(page_content=content_text, metadata={"course_id": 1})])
+        return f"{len(chunks)} chunks"
+
+    def builder_full(max_chars: int = 0):
+        text = builder_assemble(pages, attachments, max_chars=max_chars)
+        text.content_hash()
+        count = 0
+        for section in text.iter_sections():
+            for chunk in splitter.split_text(section):
+                Document(page_content=chunk, metadata={"course_id": 1})
+                count += 1
+        return f"{count} chunks" + (" (truncated)" if text.truncated else "")
+
+    legacy = measure("legacy (materialize all chunks)", legacy_full)
+    builder = measure("builder, lazy sections", builder_full)
+    capped = measure("builder, MAX_MODULE_TEXT_CHARS=200000", lambda: builder_full(200_000))
+    print(f"\nSpeedup uncapped: {legacy / builder:.2f}x   capped: {legacy / capped:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import sys
+import os
+import time
+import shutil
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def unit_vectors(rng: np.random.Generator, n: int, dim: int) -> np.ndarray:
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def percentiles(samples_ms):
+    ordered = sorted(samples_ms)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "mean": sum(ordered) / len(ordered)}
+
+
+def load(client, layout: str, courses: int, chunks: int, dim: int, batch: int, seed: int):
+    """Writes `chunks` random unit vectors spread over `courses` courses in the given layout."""
+    rng = np.random.default_rng(seed)
+    # Course sizes vary like real courses: a few large ones and many small ones.
+    weights = rng.pareto(1.5, courses) + 1
+    course_of = rng.choice(np.arange(1, courses + 1), size=chunks, p=weights / weights.sum())
+    collections = {}
+
+    def collection_for(course_id: int):
+        name = "moodle_content" if layout == "single" else f"moodle_course_{course_id}"
+        if name not in collections:
+            collections[name] = client.get_or_create_collection(name)
+        return collections[name]
+
+    t0 = time.perf_counter()
+    for start in range(0, chunks, batch):
+        end = min(chunks, start + batch)
+        vectors = unit_vectors(rng, end - start, dim)
+        groups = {}
+        for offset, course_id in enumerate(course_of[start:end]):
+            groups.setdefault(int(course_id), []).append(offset)
+        for course_id, offsets in groups.items():
+            collection_for(course_id).add(
+                ids=[f"{layout}-{start + o}" for o in offsets],
+                embeddings=vectors[offsets],
+                documents=[f"chunk {start + o} of course {course_id}" for o in offsets],
+                metadatas=[{"course_id": course_id, "cmid": (start + o) % 500} for o in offsets],
+            )
+    return collection_for, course_of, time.perf_counter() - t0
+
+
+def bench(collection_for, course_of, queries: int, dim: int, k: int, seed: int):
+    rng = np.random.default_rng(seed + 1)
+    courses = [int(c) for c in rng.choice(course_of, size=queries)]
+    vectors = unit_vectors(rng, queries, dim)
+    search_ms, scan_ms = [], []
+    for course_id, vector in zip(courses, vectors):
+        collection = collection_for(course_id)
+        where = {"course_id": course_id}
+        t0 = time.perf_counter()
+        collection.query(query_embeddings=[vector], n_results=k, where=where, include=["metadatas", "documents"])
+        search_ms.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        collection.get(where=where, include=[])
+        scan_ms.append((time.perf_counter() - t0) * 1000)
+    return percentiles(search_ms), percentiles(scan_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare filtered queries on one shared collection with per-course collections."
+    )
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size (384 = bge-small / HashEmbeddings)")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=6, help="Results per query (ask_question uses 6)")
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--data-dir", help="Work directory (default: a temporary directory, removed afterwards)")
+    args = parser.parse_args()
+
+    import chromadb
+
+    work_dir = args.data_dir or tempfile.mkdtemp(prefix="bench-vector-layout-")
+    random.seed(args.seed)
+    results = {}
+    try:
+        for layout in ("single", "per_course"):
+            client = chromadb.PersistentClient(path=os.path.join(work_dir, layout))
+            print(f"Loading {args.chunks:,} chunks over {args.courses} courses ({layout})...")
+            collection_for, course_of, load_s = load(
+                client, layout, args.courses, args.chunks, args.dim, args.batch, args.seed
+            )
+            search, scan = bench(collection_for, course_of, args.queries, args.dim, args.k, args.seed)
+            results[layout] = {"load_s": load_s, "search": search, "scan": scan}
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{args.chunks:,} chunks, {args.courses} courses, dim {args.dim}, {args.queries} queries, k={args.k}")
+    print(f"{'layout':<12} {'load s':>7}   {'search p50':>10} {'p95':>7} {'p99':>7} {'mean':>7}   "
+          f"{'course get p50':>14} {'p95':>7}")
+    for layout, r in results.items():
+        s, g = r["search"], r["scan"]
+        print(f"{layout:<12} {r['load_s']:>7.1f}   {s['p50']:>8.2f}ms {s['p95']:>7.2f} {s['p99']:>7.2f} {s['mean']:>7.2f}   "
+              f"{g['p50']:>12.2f}ms {g['p95']:>7.2f}")
+    single, partitioned = results["single"]["search"], results["per_course"]["search"]
+    print(f"\nFiltered search p50 speedup with per-course collections: {single['p50'] / partitioned['p50']:.1f}x "
+          f"(p95 {single['p95'] / partitioned['p95']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
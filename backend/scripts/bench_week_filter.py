@@ -0,0 +1,96 @@
+import sys
+import os
+import re
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def percentiles(samples_ms):
+    ordered = sorted(samples_ms)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": pick(0.50), "p95": pick(0.95), "mean": sum(ordered) / len(ordered)}
+
+
+def probe_filter(service, course_id: int, question: str):
+    """
+    How week-scoped questions were resolved before the week index: a k=1 probe search with the
+    week filter, falling back to the course filter when it finds nothing. The probe filters on
+    the stored week number, so it narrows exactly like the index does.
+    """
+    filter_where = service._course_filter(course_id)
+    weeks = sorted({int(n) for n in re.findall(r"\bweek\s*(\d+)\b", question, flags=re.IGNORECASE)})
+    if weeks:
+        week_filter = service._course_filter(course_id, {"week": {"$in": weeks}})
+        if service._store(course_id).similarity_search(question, k=1, filter=week_filter):
+            filter_where = week_filter
+    return filter_where
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Latency of week-scoped retrieval: probe search + retrieval vs week index + retrieval."
+    )
+    parser.add_argument("--sections", type=int, default=12, help="Weeks (sections) in the synthetic course")
+    parser.add_argument("--modules-per-section", type=int, default=8)
+    parser.add_argument("--attachments", type=int, default=2, help="Attachments per resource module")
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench-week-filter-")
+    os.environ.setdefault("MOODLE_URL", "http://synthetic.moodle")
+    os.environ.update(
+        APP_DATA_DIR=os.path.join(work_dir, "app_data"),
+        CHROMA_PERSIST_DIR=os.path.join(work_dir, "chroma"),
+        EMBEDDING_CACHE_ENABLED="False",
+        # Measure uncached retrieval; the shared retrieval cache would hide both paths.
+        RETRIEVAL_CACHE_ENABLED="False",
+        ANONYMIZED_TELEMETRY="False",
+    )
+    try:
+        from app.services.rag_service import RAGService, HashEmbeddings
+        from synthetic_moodle import SyntheticMoodleClient
+
+        moodle = SyntheticMoodleClient(
+            courses=1, sections=args.sections, modules_per_section=args.modules_per_section, attachments=args.attachments
+        )
+        service = RAGService(embeddings=HashEmbeddings(), persist_directory=os.environ["CHROMA_PERSIST_DIR"], moodle=moodle)
+        result = service.ingest_course_content(1)
+        print(f"Ingested {result['chunks_count']} chunks in {args.sections} weeks")
+
+        rng = random.Random(args.seed)
+        templates = ["What did we cover in week {w}?", "Summarize the week {w} reading", "Explain the main idea of Week {w} (question {i})"]
+        questions = [rng.choice(templates).format(w=rng.randint(1, args.sections), i=i) for i in range(args.questions)]
+
+        def run(resolve):
+            samples = []
+            for question in questions:
+                t0 = time.perf_counter()
+                filter_where = resolve(service, 1, question)
+                service._store(1).similarity_search(question, k=6, filter=filter_where)
+                samples.append((time.perf_counter() - t0) * 1000)
+            return percentiles(samples)
+
+        resolvers = {"probe + retrieval": probe_filter, "week index + retrieval": lambda s, c, q: s._question_filter(c, q)}
+        for resolve in resolvers.values():
+            run(resolve)  # warm up
+        results = {name: run(resolve) for name, resolve in resolvers.items()}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{len(questions)} week-scoped questions, k=6")
+    print(f"{'path':<24} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, stats in results.items():
+        print(f"{name:<24} {stats['p50']:>8.2f} {stats['p95']:>8.2f} {stats['mean']:>8.2f}")
+    saved = results["probe + retrieval"]["mean"] - results["week index + retrieval"]["mean"]
+    print(f"Saved per week-scoped question: {saved:.2f} ms on average")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import sys
+import os
+import json
+import argparse
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.bulk_ingest import bulk_ingest_service
+
+
+def print_report(run):
+    summary = run.get("summary") or {}
+    print(f"\nRun {run['run_id']}: {run['status']}")
+    print(
+        f"  courses: {summary.get('total', 0)}  succeeded: {summary.get('succeeded', 0)}  "
+        f"failed: {summary.get('failed', 0)}  pending: {summary.get('pending', 0)}"
+    )
+    print(f"  wall time: {summary.get('wall_time_s')}s  summed course time: {summary.get('course_time_s')}s")
+    print("\n  course      status      time(s)  chunks  modules(+/~/=/-)")
+    for course_id in run.get("order", []):
+        course = run["courses"][str(course_id)]
+        result = course.get("result") or {}
+        modules = "/".join(
+            str(result.get(k, "-")) for k in ("modules_added", "modules_changed", "modules_unchanged", "modules_removed")
+        )
+        duration = course.get("duration_s")
+        print(
+            f"  {course_id:<10}  {course['status']:<10}  {duration if duration is not None else '-':>7}  "
+            f"{result.get('chunks_count', '-'):>6}  {modules}"
+        )
+    for failure in summary.get("failures", []):
+        print(f"  FAILED {failure['course_id']}: {failure['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest many Moodle courses into the knowledge base.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--courses", help="Comma-separated course ids, e.g. 12,15,31")
+    target.add_argument("--all", action="store_true", help="All courses returned by Moodle")
+    target.add_argument("--resume", metavar="RUN_ID", help="Resume an interrupted or cancelled run")
+    target.add_argument("--report", metavar="RUN_ID", help="Print the report of a run and exit")
+    target.add_argument("--list", action="store_true", help="List recent runs and exit")
+    parser.add_argument("--incremental", action="store_true", help="Only re-embed modules changed since the last ingest")
+    parser.add_argument("--concurrency", type=int, help="Courses ingested at once (default BULK_INGEST_CONCURRENCY)")
+    parser.add_argument("--retry-failed", action="store_true", help="With --resume, also retry failed courses")
+    parser.add_argument("--json", action="store_true", help="Print the final report as JSON")
+    args = parser.parse_args()
+
+    if args.list:
+        print(json.dumps(bulk_ingest_service.list_runs(), indent=2))
+        return
+
+    if args.report or args.resume:
+        run_id = args.report or args.resume
+        run = bulk_ingest_service.report(run_id)
+        if not run:
+            print(f"Run {run_id} not found")
+            sys.exit(1)
+        if args.resume:
+            run = bulk_ingest_service.run(run_id, retry_failed=args.retry_failed)
+    else:
+        course_ids = [int(c) for c in args.courses.split(",") if c.strip()] if args.courses else None
+        run = bulk_ingest_service.create_run(course_ids, incremental=args.incremental, concurrency=args.concurrency)
+        print(f"Created run {run['run_id']} for {run['summary']['total']} course(s). Resume with --resume {run['run_id']}")
+        run = bulk_ingest_service.run(run["run_id"])
+
+    if args.json:
+        print(json.dumps(run, indent=2))
+    else:
+        print_report(run)
+    if run.get("status") == "completed_with_errors":
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
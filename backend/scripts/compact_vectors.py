@@ -0,0 +1,154 @@
+import sys
+import os
+import argparse
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.config import settings
+from app.services.compact_vectors import (
+    CompactVectorIndex, COMPACT_COLLECTION_KEY, COMPACT_COLLECTION_VALUE, COMPACT_QUANTIZATIONS,
+)
+from app.services.vector_store_registry import VectorStoreRegistry
+
+TO_COMPACT = "compact"
+TO_FULL = "full"
+# Collections are converted into a temporary collection that replaces the original once complete.
+_TMP_SUFFIX = "_convert_tmp"
+
+
+def _is_compact(collection) -> bool:
+    return (collection.metadata or {}).get(COMPACT_COLLECTION_KEY) == COMPACT_COLLECTION_VALUE
+
+
+def _pages(collection, include, batch_size: int):
+    offset = 0
+    while True:
+        page = collection.get(limit=batch_size, offset=offset, include=include)
+        if not page.get("ids"):
+            break
+        offset += len(page["ids"])
+        yield page
+
+
+def _recover(client, names):
+    """Finishes conversions interrupted after the original collection was dropped."""
+    for name in list(names):
+        if not name.endswith(_TMP_SUFFIX):
+            continue
+        base = name[:-len(_TMP_SUFFIX)]
+        if base in names:
+            client.delete_collection(name)
+            print(f"Dropped incomplete conversion '{name}'")
+        else:
+            client.get_collection(name).modify(name=base)
+            print(f"Completed interrupted conversion of '{base}'")
+
+
+def _to_compact(client, registry, name: str, batch_size: int, dry_run: bool) -> None:
+    source = client.get_collection(name)
+    total = source.count()
+    print(f"Converting '{name}' ({total} chunks) to compact storage")
+    if dry_run:
+        return
+    index_path = registry.compact_index_path(name)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    # The quantization is only applied in memory, so any mode builds the same file.
+    index = CompactVectorIndex(index_path, COMPACT_QUANTIZATIONS[0])
+    target = client.create_collection(f"{name}{_TMP_SUFFIX}", metadata={COMPACT_COLLECTION_KEY: COMPACT_COLLECTION_VALUE})
+    copied = 0
+    for page in _pages(source, ["embeddings", "documents", "metadatas"], batch_size):
+        ids = page["ids"]
+        index.upsert(ids, page["embeddings"])
+        target.upsert(ids=ids, embeddings=[[0.0]] * len(ids), documents=page["documents"], metadatas=page["metadatas"])
+        copied += len(ids)
+        print(f"  {copied}/{total}")
+    _swap(client, source, target, name, total)
+
+
+def _to_full(client, registry, name: str, batch_size: int, dry_run: bool) -> None:
+    source = client.get_collection(name)
+    total = source.count()
+    index_path = registry.compact_index_path(name)
+    print(f"Converting '{name}' ({total} chunks) to full float32 storage")
+    if dry_run:
+        return
+    index = CompactVectorIndex(index_path, COMPACT_QUANTIZATIONS[0])
+    target = client.create_collection(f"{name}{_TMP_SUFFIX}")
+    copied = missing = 0
+    for page in _pages(source, ["documents", "metadatas"], batch_size):
+        vectors = index.vectors(page["ids"])
+        keep = [i for i, chunk_id in enumerate(page["ids"]) if chunk_id in vectors]
+        missing += len(page["ids"]) - len(keep)
+        if keep:
+            target.upsert(
+                ids=[page["ids"][i] for i in keep],
+                embeddings=[vectors[page["ids"][i]] for i in keep],
+                documents=[page["documents"][i] for i in keep],
+                metadatas=[page["metadatas"][i] for i in keep],
+            )
+        copied += len(keep)
+        print(f"  {copied}/{total}")
+    if missing:
+        client.delete_collection(target.name)
+        print(f"  {missing} chunk(s) have no vector in {index_path}; '{name}' left untouched "
+              f"(re-ingest the affected courses, then convert again)")
+        return
+    if _swap(client, source, target, name, total):
+        os.remove(index_path)
+
+
+def _swap(client, source, target, name: str, expected: int) -> bool:
+    if target.count() != expected:
+        client.delete_collection(target.name)
+        print(f"  copied {target.count()} of {expected} chunk(s); '{name}' left untouched")
+        return False
+    client.delete_collection(source.name)
+    target.modify(name=name)
+    print(f"  '{name}' converted")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert Chroma collections between full float32 vectors and compact storage "
+                    "(VECTOR_COMPACT_MODE). Stop the backend while converting."
+    )
+    parser.add_argument("--to", choices=[TO_COMPACT, TO_FULL], default=TO_COMPACT)
+    parser.add_argument("--collection", action="append", help="Collection to convert (repeatable; default: all)")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be converted")
+    args = parser.parse_args()
+
+    registry = VectorStoreRegistry(None, settings.CHROMA_PERSIST_DIR)
+    client = registry._get_client()
+    names = registry.collection_names()
+    if not args.dry_run:
+        _recover(client, names)
+        names = registry.collection_names()
+    selected = args.collection or [n for n in names if not n.endswith(_TMP_SUFFIX)]
+
+    converted = 0
+    for name in selected:
+        if name not in names:
+            print(f"Collection '{name}' does not exist; skipped")
+            continue
+        compact = _is_compact(client.get_collection(name))
+        if compact == (args.to == TO_COMPACT):
+            print(f"'{name}' is already {args.to}; skipped")
+            continue
+        if args.to == TO_COMPACT:
+            _to_compact(client, registry, name, args.batch_size, args.dry_run)
+        else:
+            _to_full(client, registry, name, args.batch_size, args.dry_run)
+        converted += 1
+
+    print(f"\n{'Would convert' if args.dry_run else 'Converted'} {converted} collection(s).")
+    if not args.dry_run and converted:
+        mode = "int8 (or float16)" if args.to == TO_COMPACT else "off"
+        print(f"Set VECTOR_COMPACT_MODE={mode} so new collections use the same storage, then restart the backend.")
+
+
+if __name__ == "__main__":
+    main()
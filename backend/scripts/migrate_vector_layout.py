@@ -0,0 +1,139 @@
+import sys
+import os
+import argparse
+from collections import defaultdict
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.config import settings
+from app.services.compact_vectors import CompactChroma
+from app.services.vector_store_registry import (
+    VectorStoreRegistry, SHARED_COLLECTION, LAYOUT_PER_COURSE, LAYOUT_SINGLE,
+)
+
+def _read_page(source, batch_size: int, offset: int):
+    """A page of ids, embeddings, documents and metadata; compact stores read vectors from their index."""
+    if isinstance(source, CompactChroma):
+        page = source._collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+        vectors = source.index.vectors(page.get("ids") or [])
+        page["embeddings"] = [vectors.get(chunk_id) for chunk_id in page.get("ids") or []]
+        return page
+    return source._collection.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+
+
+def _write(target, group) -> None:
+    if isinstance(target, CompactChroma):
+        target.upsert_vectors(**group)
+    else:
+        target._collection.upsert(**group)
+
+
+def _copy(source, target_for, batch_size: int, dry_run: bool):
+    """
+    Copies every chunk of `source` (a collection wrapper) to the collection returned by
+    target_for(course_id), keeping ids, embeddings, documents and metadata (nothing is
+    re-embedded). Returns (course_id -> copied ids, chunks skipped for lack of a course_id
+    or of a stored vector).
+    """
+    copied = defaultdict(list)
+    skipped = 0
+    offset = 0
+    while True:
+        page = _read_page(source, batch_size, offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        offset += len(ids)
+        groups = defaultdict(lambda: {"ids": [], "embeddings": [], "documents": [], "metadatas": []})
+        for i, chunk_id in enumerate(ids):
+            meta = page["metadatas"][i] or {}
+            if meta.get("course_id") is None or page["embeddings"][i] is None:
+                skipped += 1
+                continue
+            group = groups[int(meta["course_id"])]
+            group["ids"].append(chunk_id)
+            group["embeddings"].append(page["embeddings"][i])
+            group["documents"].append(page["documents"][i])
+            group["metadatas"].append(meta)
+        for course_id, group in groups.items():
+            if not dry_run:
+                _write(target_for(course_id), group)
+            copied[course_id].extend(group["ids"])
+        print(f"  {offset} chunks read, {sum(len(v) for v in copied.values())} copied")
+    return copied, skipped
+
+
+def _delete_ids(store, ids, batch_size: int):
+    for start in range(0, len(ids), batch_size):
+        store.delete(ids=ids[start:start + batch_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Move course chunks between the single shared collection and per-course collections."
+    )
+    parser.add_argument("--to", choices=[LAYOUT_PER_COURSE, LAYOUT_SINGLE], default=LAYOUT_PER_COURSE)
+    parser.add_argument("--shards", type=int, default=settings.VECTOR_STORE_COURSE_SHARDS,
+                        help="With --to per_course, spread courses over this many shard collections (0 = one per course); "
+                             "courses already in the registry keep their collection")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--delete-source", action="store_true", help="Delete the migrated chunks from the source after verifying")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be copied")
+    args = parser.parse_args()
+
+    registry = VectorStoreRegistry(
+        None, settings.CHROMA_PERSIST_DIR, layout=LAYOUT_PER_COURSE, shards=args.shards,
+        compact_mode=settings.VECTOR_COMPACT_MODE,
+    )
+    shared = registry.shared()
+
+    if args.to == LAYOUT_PER_COURSE:
+        print(f"Migrating '{SHARED_COLLECTION}' ({len(shared)} chunks) to per-course collections "
+              f"({'%d shards' % args.shards if args.shards else 'one per course'})")
+        sources = [shared]
+        target_for = lambda course_id: registry.for_course(course_id, write=True)
+    else:
+        names = sorted(set(registry.course_collections().values()))
+        print(f"Migrating {len(names)} per-course collection(s) to '{SHARED_COLLECTION}'")
+        sources = [registry.store(name) for name in names]
+        target_for = lambda course_id: shared
+
+    totals = defaultdict(int)
+    skipped = 0
+    for source in sources:
+        print(f"Reading {source._collection.name} ({len(source)} chunks)")
+        copied, source_skipped = _copy(source, target_for, args.batch_size, args.dry_run)
+        skipped += source_skipped
+        for course_id, ids in copied.items():
+            totals[course_id] += len(ids)
+        if args.dry_run or not args.delete_source or not copied:
+            continue
+        # Only delete once every copied id is readable in its target collection.
+        missing = 0
+        for course_id, ids in copied.items():
+            target = target_for(course_id)
+            for start in range(0, len(ids), args.batch_size):
+                batch = ids[start:start + args.batch_size]
+                missing += len(batch) - len(target._collection.get(ids=batch, include=[])["ids"])
+        if missing:
+            print(f"  {missing} chunk(s) not found in their target collection; source left untouched")
+            continue
+        migrated = [chunk_id for ids in copied.values() for chunk_id in ids]
+        _delete_ids(source, migrated, args.batch_size)
+        print(f"  deleted {len(migrated)} migrated chunk(s) from {source._collection.name}")
+
+    assignments = registry.course_collections()
+    print(f"\n{'Would copy' if args.dry_run else 'Copied'} {sum(totals.values())} chunk(s) for {len(totals)} course(s)"
+          + (f"; {skipped} chunk(s) without course_id left in place" if skipped else ""))
+    for course_id in sorted(totals):
+        target = SHARED_COLLECTION if args.to == LAYOUT_SINGLE else assignments.get(str(course_id), "(new collection)")
+        print(f"  course {course_id:<8} {totals[course_id]:>8} -> {target}")
+    if not args.dry_run:
+        print(f"\nSet VECTOR_STORE_LAYOUT={args.to}"
+              + (f" and VECTOR_STORE_COURSE_SHARDS={args.shards}" if args.to == LAYOUT_PER_COURSE and args.shards else "")
+              + " and restart the backend.")
+
+
+if __name__ == "__main__":
+    main()
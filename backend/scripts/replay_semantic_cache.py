@@ -0,0 +1,124 @@
+import sys
+import os
+import sqlite3
+import argparse
+import hashlib
+from collections import Counter
+
+# Add backend directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def load_questions(db_path: str, course_id=None):
+    """Student chat questions in the order they were asked, without quiz requests (those never reach ask_question)."""
+    from app.api.endpoints.chat import _chat_quiz_topic
+
+    query = "SELECT course_id, student_id, content FROM messages WHERE role = 'user'"
+    params = []
+    if course_id is not None:
+        query += " AND course_id = ?"
+        params.append(course_id)
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(query + " ORDER BY id", params).fetchall()
+    return [(int(c), int(s), q) for c, s, q in rows if q and q.strip() and _chat_quiz_topic(q) is None]
+
+
+def _chunk_key(doc) -> str:
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def _overlap(a, b) -> float:
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if (a or b) else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Replays the questions of chat_history.db through the semantic answer cache at several "
+            "thresholds and reports the LLM calls it would save and how many of its hits are false. "
+            "A hit counts as false when the question retrieves different course chunks than the "
+            "cached one did (Jaccard overlap of the top-k below --min-overlap), i.e. the cached "
+            "answer was grounded in other material. Entries do not expire during the replay."
+        )
+    )
+    parser.add_argument("--db", default=None, help="Chat history database (default: CHAT_DB_PATH)")
+    parser.add_argument("--course-id", type=int, default=None, help="Only replay this course")
+    parser.add_argument("--thresholds", default="0.80,0.85,0.90,0.93,0.95,0.97", help="Comma-separated cosine thresholds")
+    parser.add_argument("--scope", choices=["student", "course"], default="student",
+                        help="student: only a student's own earlier questions can match (the cache's student-context "
+                             "fingerprint, approximated by the student id); course: any student's (upper bound)")
+    parser.add_argument("--embeddings", choices=["configured", "hash"], default="configured",
+                        help="hash: HashEmbeddings, only meaningful for a knowledge base ingested with them")
+    parser.add_argument("--k", type=int, default=6, help="Chunks retrieved per question, as in ask_question")
+    parser.add_argument("--min-overlap", type=float, default=0.5, help="Retrieval overlap below which a hit is false")
+    parser.add_argument("--show", type=int, default=5, help="Print this many false hits at the lowest threshold")
+    args = parser.parse_args()
+
+    from app.core.config import settings
+    from app.services.answer_cache import normalize_question
+    from app.services.semantic_cache import SemanticAnswerCache
+
+    questions = load_questions(args.db or settings.CHAT_DB_PATH, args.course_id)
+    if not questions:
+        print("No chat questions to replay.")
+        return
+
+    if args.embeddings == "hash":
+        from app.services.rag_service import RAGService, HashEmbeddings
+        service = RAGService(embeddings=HashEmbeddings())
+    else:
+        from app.services.rag_service import rag_service
+        service = rag_service.get()
+
+    # Embeddings and retrievals do not depend on the threshold, so they are computed once.
+    prepared = []
+    for course_id, student_id, question in questions:
+        vector = service.embeddings.embed_query(question)
+        docs = service._store(course_id).similarity_search_by_vector(
+            vector, k=args.k, filter=service._question_filter(course_id, question)
+        )
+        prepared.append((course_id, student_id, question, vector, [_chunk_key(doc) for doc in docs]))
+
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+    print(f"{len(prepared)} questions from {len({(c, s) for c, s, *_ in prepared})} student/course pairs, "
+          f"scope={args.scope}, embeddings={args.embeddings}")
+    print(f"{'threshold':>9} {'exact hits':>10} {'semantic hits':>13} {'LLM calls saved':>16} {'false hits':>10} {'false-hit rate':>14}")
+    false_examples = {}
+    for threshold in thresholds:
+        cache = SemanticAnswerCache(threshold=threshold, max_entries_per_course=10 ** 9, ttl_s=float("inf"), enabled=True)
+        seen = set()
+        counts = Counter()
+        examples = []
+        for course_id, student_id, question, vector, chunks in prepared:
+            fingerprint = str(student_id) if args.scope == "student" else "course"
+            exact_key = (course_id, fingerprint, normalize_question(question))
+            if exact_key in seen:
+                counts["exact"] += 1
+                continue
+            match = cache.match(course_id, "replay", fingerprint, vector)
+            if match is None:
+                seen.add(exact_key)
+                cache.put(course_id, "replay", fingerprint, question, vector, {"chunks": chunks})
+                continue
+            # The cache also stores a semantic hit under the question's exact key.
+            seen.add(exact_key)
+            counts["semantic"] += 1
+            if _overlap(chunks, match["value"]["chunks"]) < args.min_overlap:
+                counts["false"] += 1
+                examples.append((match["similarity"], question, match["question"]))
+        false_examples[threshold] = examples
+        saved = counts["exact"] + counts["semantic"]
+        rate = counts["false"] / counts["semantic"] if counts["semantic"] else 0.0
+        print(f"{threshold:>9.2f} {counts['exact']:>10} {counts['semantic']:>13} "
+              f"{saved:>7} ({saved / len(prepared):>5.1%}) {counts['false']:>10} {rate:>14.1%}")
+
+    examples = false_examples[min(thresholds)][:args.show]
+    if examples:
+        print(f"\nFalse hits at threshold {min(thresholds):.2f}:")
+        for similarity, question, cached_question in examples:
+            print(f"  {similarity:.3f}  {question!r} served the answer to {cached_question!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import io
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    import docx
+except ImportError:
+    docx = None
+
+from app.services.moodle_client import MoodleClient
+
+_WORDS = (
+    "algorithm analysis array binary boundary cache compiler complexity concurrency data "
+    "derivative distribution entropy equation experiment function gradient graph hypothesis "
+    "integral iteration kernel lemma matrix memory model network node optimization parameter "
+    "pointer probability proof protocol queue recursion regression sample schema search "
+    "sequence signal stack statistics structure theorem thread transaction tree variable vector"
+).split()
+
+SYNTHETIC_URL = "http://synthetic.moodle"
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(_sentence(rng, rng.randint(8, 16)) for _ in range(sentences))
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(pages: List[List[str]]) -> bytes:
+    """Builds a minimal, valid PDF with one Helvetica text line per entry of each page."""
+    objects: List[bytes] = []
+    page_ids = [3 + 2 * i for i in range(len(pages))]
+    font_id = 3 + 2 * len(pages)
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    for pid, lines in zip(page_ids, pages):
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 780 Td"]
+        for line in lines:
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", errors="replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {pid + 1} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode()
+        )
+        objects.append(b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref_at = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def build_docx(pages: List[List[str]]) -> Optional[bytes]:
+    """Builds a DOCX with one paragraph per line and a page break between pages (None without python-docx)."""
+    if not docx:
+        return None
+    document = docx.Document()
+    for index, lines in enumerate(pages):
+        if index:
+            document.add_page_break()
+        for line in lines:
+            document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+class SyntheticMoodleClient(MoodleClient):
+    """
+    Offline Moodle client serving generated courses, for ingestion benchmarks.
+
+    Every course has `sections` sections of `modules_per_section` modules (pages, resources,
+    forums and quizzes in rotation). `attachments` PDF/DOCX files (alternating, `pdf_pages` /
+    `docx_pages` pages each) are spread over the resource modules, and `forums` of the modules
+    are forums with `discussions_per_forum` discussions. Content is deterministic for a given
+    seed and course id, and every file has unique text so caches keyed by content do not hit.
+
+    `latency_ms` is added to every API call and download, and `bandwidth_mbps` (0 = unlimited)
+    adds transfer time to downloads. Calls go through the shared concurrency slots and rate
+    limiter of MoodleClient, so MOODLE_MAX_CONCURRENCY and MOODLE_RATE_LIMIT_* apply as they
+    would against a real site.
+    """
+
+    def __init__(
+        self,
+        courses: int = 1,
+        sections: int = 10,
+        modules_per_section: int = 8,
+        attachments: int = 20,
+        pdf_pages: int = 8,
+        docx_pages: int = 4,
+        forums: int = 4,
+        discussions_per_forum: int = 5,
+        latency_ms: float = 0.0,
+        bandwidth_mbps: float = 0.0,
+        seed: int = 0,
+    ):
+        super().__init__()
+        self.url = SYNTHETIC_URL
+        self.courses = max(1, int(courses))
+        self.sections = max(1, int(sections))
+        self.modules_per_section = max(1, int(modules_per_section))
+        self.attachments = max(0, int(attachments))
+        self.pdf_pages = max(1, int(pdf_pages))
+        self.docx_pages = max(1, int(docx_pages))
+        self.forums = max(0, int(forums))
+        self.discussions_per_forum = max(0, int(discussions_per_forum))
+        self.latency_s = max(0.0, float(latency_ms)) / 1000.0
+        self.bandwidth_bps = max(0.0, float(bandwidth_mbps)) * 125_000
+        self.seed = seed
+        self._contents: Dict[int, List[Dict[str, Any]]] = {}
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.bytes_served = 0
+
+    def _count(self, name: str, nbytes: int = 0) -> None:
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.bytes_served += nbytes
+
+    def _wait(self, nbytes: int = 0) -> None:
+        delay = self.latency_s
+        if nbytes and self.bandwidth_bps:
+            delay += nbytes / self.bandwidth_bps
+        if delay:
+            time.sleep(delay)
+
+    def _call_moodle(self, function_name: str, params: Dict[str, Any] = None, method: str = "POST") -> Any:
+        params = params or {}
+        self.rate_limiter.acquire()
+        with self._request_slots:
+            self._wait()
+        self._count(function_name)
+        if function_name == "core_webservice_get_site_info":
+            return {"sitename": "Synthetic Moodle", "username": "admin", "userid": 1}
+        if function_name == "core_course_get_courses":
+            return [
+                {"id": course_id, "fullname": f"Synthetic Course {course_id}", "shortname": f"SYN-{course_id}"}
+                for course_id in range(1, self.courses + 1)
+            ]
+        if function_name == "core_course_get_contents":
+            return self.course_contents(int(params.get("courseid", 1)))
+        if function_name == "mod_forum_get_forum_discussions_paginated":
+            return {"discussions": self._discussions(int(params.get("forumid", 0)), int(params.get("perpage", 5)))}
+        return {}
+
+    def download_file(self, file_url: str, max_bytes: Optional[int] = None) -> Optional[bytes]:
+        if not file_url:
+            return None
+        spec = self._files.get(file_url.split("?", 1)[0])
+        data = self._file_bytes(spec) if spec else None
+        self.rate_limiter.acquire()
+        with self._request_slots:
+            self._wait(len(data) if data else 0)
+        self._count("download_file", len(data) if data else 0)
+        if data is None or (max_bytes is not None and len(data) > max_bytes):
+            return None
+        return data
+
+    def course_contents(self, course_id: int) -> List[Dict[str, Any]]:
+        """The generated core_course_get_contents response of a course (built once, then reused)."""
+        with self._lock:
+            if course_id not in self._contents:
+                self._contents[course_id] = self._generate_course(course_id)
+            return self._contents[course_id]
+
+    def _generate_course(self, course_id: int) -> List[Dict[str, Any]]:
+        rng = random.Random(f"{self.seed}:{course_id}")
+        total = self.sections * self.modules_per_section
+        forum_slots = set(range(1, total, max(1, total // max(1, self.forums))))
+        forum_slots = set(sorted(forum_slots)[: self.forums])
+        resource_slots = [i for i in range(total) if i not in forum_slots and i % 4 in (1, 2)] or [
+            i for i in range(total) if i not in forum_slots
+        ]
+        files_per_slot: Dict[int, int] = {}
+        for n in range(self.attachments):
+            slot = resource_slots[n % len(resource_slots)] if resource_slots else None
+            if slot is not None:
+                files_per_slot[slot] = files_per_slot.get(slot, 0) + 1
+
+        sections = []
+        file_number = 0
+        for s in range(self.sections):
+            modules = []
+            for m in range(self.modules_per_section):
+                slot = s * self.modules_per_section + m
+                cmid = course_id * 100_000 + slot + 1
+                module: Dict[str, Any] = {
+                    "id": cmid,
+                    "url": f"{SYNTHETIC_URL}/mod/view.php?id={cmid}",
+                    "timemodified": 1_700_000_000 + slot,
+                }
+                if slot in forum_slots:
+                    module.update({
+                        "modname": "forum",
+                        "name": f"Week {s + 1} discussion",
+                        "instance": cmid,
+                        "description": f"<p>{_paragraph(rng, 2)}</p>",
+                    })
+                elif slot in files_per_slot:
+                    contents = []
+                    for _ in range(files_per_slot[slot]):
+                        file_number += 1
+                        kind = "pdf" if file_number % 2 else "docx"
+                        filename = f"lecture-{course_id}-{file_number}.{kind}"
+                        fileurl = f"{SYNTHETIC_URL}/pluginfile.php/{course_id}/{file_number}/{filename}"
+                        self._files[fileurl] = {
+                            "kind": kind,
+                            "seed": f"{self.seed}:{course_id}:{file_number}",
+                            "pages": self.pdf_pages if kind == "pdf" else self.docx_pages,
+                        }
+                        contents.append({
+                            "type": "file",
+                            "filename": filename,
+                            "fileurl": fileurl,
+                            "filesize": 0,
+                            "timemodified": 1_700_000_000 + file_number,
+                            "mimetype": "application/pdf" if kind == "pdf" else (
+                                "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                            ),
+                        })
+                    module.update({
+                        "modname": "resource",
+                        "name": f"Lecture notes {s + 1}.{m + 1}",
+                        "description": f"<p>{_sentence(rng, 12)}</p>",
+                        "contents": contents,
+                    })
+                elif m % 4 == 3:
+                    module.update({
+                        "modname": "quiz",
+                        "name": f"Quiz {s + 1}.{m + 1}",
+                        "description": f"<p>{_sentence(rng, 14)}</p>",
+                        "dates": [{"label": "Opens", "timestamp": 1_700_000_000 + slot * 86_400}],
+                    })
+                else:
+                    body = "".join(f"<h3>{_sentence(rng, 4)}</h3><p>{_paragraph(rng, 6)}</p>" for _ in range(3))
+                    module.update({
+                        "modname": "page",
+                        "name": f"Reading {s + 1}.{m + 1}",
+                        "description": f"<p>{_sentence(rng, 10)}</p>",
+                        "contents": [{"type": "content", "filename": "index.html", "content": body}],
+                    })
+                modules.append(module)
+            sections.append({"id": course_id * 1000 + s, "name": f"Week {s + 1}", "section": s + 1, "modules": modules})
+        return sections
+
+    def _discussions(self, forum_id: int, per_page: int) -> List[Dict[str, Any]]:
+        rng = random.Random(f"{self.seed}:forum:{forum_id}")
+        count = min(per_page, self.discussions_per_forum)
+        return [
+            {"id": forum_id * 100 + d, "name": _sentence(rng, 6).rstrip("."), "timemodified": 1_700_000_000 + d * 3600}
+            for d in range(count)
+        ]
+
+    def _file_bytes(self, spec: Dict[str, Any]) -> Optional[bytes]:
+        # Generated on demand so large synthetic courses do not sit in memory.
+        rng = random.Random(spec["seed"])
+        pages = [
+            [f"{spec['seed']} page {p + 1}"] + [_sentence(rng, rng.randint(8, 14)) for _ in range(40)]
+            for p in range(spec["pages"])
+        ]
+        if spec["kind"] == "pdf":
+            return build_pdf(pages)
+        return build_docx(pages)
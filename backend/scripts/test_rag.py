@@ -2,6 +2,7 @@ import sys
 import os
 import requests
 import json
+import time
 
 # Add backend directory to sys.path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
@@ -18,7 +19,16 @@ def test_rag_pipeline():
     try:
         response = requests.post(f"{BASE_URL}/ingest", json={"course_id": 101})
         response.raise_for_status()
-        print(f"Ingestion result: {json.dumps(response.json(), indent=2)}")
+        job = response.json()
+        # Ingestion runs as a background job; poll until it finishes.
+        while job.get("status") in ("queued", "running"):
+            time.sleep(2)
+            response = requests.get(f"{BASE_URL}/ingest/{job['job_id']}")
+            response.raise_for_status()
+            job = response.json()
+        print(f"Ingestion result: {json.dumps(job, indent=2)}")
+        if job.get("status") != "succeeded":
+            return
     except Exception as e:
         print(f"Ingestion failed: {e}")
         return
@@ -0,0 +1,49 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Settings and the module-level stores read the environment on import, so it points at a
+# scratch directory before any app module is imported.
+_DATA_DIR = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.update(
+    MOODLE_URL="http://synthetic.moodle",
+    MOODLE_TOKEN="test",
+    APP_DATA_DIR=os.path.join(_DATA_DIR, "app_data"),
+    CHROMA_PERSIST_DIR=os.path.join(_DATA_DIR, "chroma"),
+    CHAT_DB_PATH=os.path.join(_DATA_DIR, "chat_history.db"),
+    EMBEDDING_CACHE_ENABLED="False",
+    RAG_INIT_ON_STARTUP="False",
+    ANONYMIZED_TELEMETRY="False",
+)
+sys.path[:0] = [BACKEND_DIR, os.path.join(BACKEND_DIR, "scripts")]
+
+
+@pytest.fixture
+def ingest_state_dir(tmp_path, monkeypatch):
+    """A per-test directory for the ingest state files."""
+    from app.services import ingest_state
+
+    path = tmp_path / "ingest_state"
+    path.mkdir()
+    monkeypatch.setattr(ingest_state, "INGEST_STATE_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def make_service(tmp_path, ingest_state_dir):
+    """Builds a RAGService on HashEmbeddings and a temporary Chroma directory over a synthetic course."""
+    from app.services.rag_service import RAGService, HashEmbeddings
+    from synthetic_moodle import SyntheticMoodleClient
+
+    def _make(**course):
+        options = dict(courses=1, sections=3, modules_per_section=4, attachments=0, forums=1, discussions_per_forum=2)
+        options.update(course)
+        moodle = SyntheticMoodleClient(**options)
+        return RAGService(embeddings=HashEmbeddings(), persist_directory=str(tmp_path / "chroma"), moodle=moodle)
+
+    return _make
+
@@ -0,0 +1,18 @@
+def stored_chunks(service, course_id: int):
+    """Chunk id -> metadata of everything stored for a course."""
+    data = service._store(course_id).get(where={"course_id": course_id}, include=["metadatas"]) or {}
+    return dict(zip(data.get("ids") or [], data.get("metadatas") or []))
+
+
+def first_module(service, course_id: int, modname: str):
+    for section in service.moodle.course_contents(course_id):
+        for module in section["modules"]:
+            if module.get("modname") == modname:
+                return module
+    raise LookupError(f"No {modname} module in course {course_id}")
+
+
+def edit_page(module) -> None:
+    """Changes a page module the way a teacher's edit would (new text, newer timemodified)."""
+    module["contents"][0]["content"] += "<p>An added paragraph about amortized analysis.</p>"
+    module["timemodified"] += 1
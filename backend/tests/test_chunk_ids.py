@@ -0,0 +1,88 @@
+from langchain_core.documents import Document
+
+from app.services.rag_service import RAGService
+from helpers import edit_page, first_module, stored_chunks
+
+
+def _chunks_by_module(chunks):
+    modules = {}
+    for chunk_id in chunks:
+        modules.setdefault(chunk_id.split(":")[1], set()).add(chunk_id)
+    return modules
+
+
+def test_chunk_id_depends_only_on_position_and_content():
+    doc = Document(page_content="Binary search halves the range.", metadata={"course_id": 1, "cmid": 5})
+    same = Document(page_content="Binary search halves the range.", metadata={"cmid": 5, "course_id": 1})
+    edited = Document(page_content="Binary search halves the interval.", metadata={"course_id": 1, "cmid": 5})
+
+    chunk_id = RAGService._chunk_id(1, 5, 0, 2, doc)
+    assert chunk_id == RAGService._chunk_id(1, 5, 0, 2, same)
+    assert chunk_id.startswith("1:5:0:2:")
+    assert chunk_id != RAGService._chunk_id(1, 5, 0, 2, edited)
+    assert chunk_id != RAGService._chunk_id(1, 5, 1, 2, doc)
+
+
+def test_second_full_ingest_writes_no_chunks(make_service):
+    service = make_service()
+
+    first = service.ingest_course_content(1)
+    before = stored_chunks(service, 1)
+    second = service.ingest_course_content(1)
+
+    assert first["status"] == "success"
+    assert first["chunks_written"] == first["chunks_count"] == len(before) > 0
+    assert second["chunks_count"] == first["chunks_count"]
+    assert second["chunks_written"] == 0
+    assert second["chunks_deleted"] == 0
+    assert stored_chunks(service, 1).keys() == before.keys()
+
+
+def test_edited_module_replaces_only_its_own_chunks(make_service):
+    service = make_service()
+    service.ingest_course_content(1)
+    before = _chunks_by_module(stored_chunks(service, 1))
+    page = first_module(service, 1, "page")
+    cmid = str(page["id"])
+
+    edit_page(page)
+    result = service.ingest_course_content(1)
+    after = _chunks_by_module(stored_chunks(service, 1))
+
+    assert after.keys() == before.keys()
+    for module, ids in before.items():
+        if module != cmid:
+            assert after[module] == ids
+    replaced = before[cmid] - after[cmid]
+    added = after[cmid] - before[cmid]
+    assert replaced and added
+    assert result["chunks_written"] == len(added)
+    assert result["chunks_deleted"] == len(replaced)
+
+
+def test_upsert_skips_ids_that_are_already_stored(make_service):
+    service = make_service()
+    docs = [
+        Document(page_content=f"Chunk {i} about heaps.", metadata={"course_id": 7, "cmid": 1}, id=f"7:1:0:{i}:x")
+        for i in range(3)
+    ]
+
+    assert service._upsert_chunks(7, docs[:2]) == 2
+    assert service._upsert_chunks(7, docs) == 1
+    assert service._upsert_chunks(7, docs) == 0
+    assert sorted(stored_chunks(service, 7)) == sorted(doc.id for doc in docs)
+
+
+def test_stale_deletion_is_limited_to_one_generation(make_service):
+    service = make_service()
+    docs = [
+        Document(page_content=f"Generation {g} text.", metadata={"course_id": 7, "cmid": 1, "generation": g}, id=f"7:1:0:0:g{g}")
+        for g in (1, 2)
+    ]
+    docs.append(Document(page_content="Generation 2, kept.", metadata={"course_id": 7, "cmid": 1, "generation": 2}, id="7:1:0:1:g2"))
+    service._upsert_chunks(7, docs)
+
+    deleted = service._delete_stale_chunks(7, service._module_where(7, 1), {"7:1:0:1:g2"}, generation=2)
+
+    assert deleted == 1
+    assert sorted(stored_chunks(service, 7)) == ["7:1:0:0:g1", "7:1:0:1:g2"]
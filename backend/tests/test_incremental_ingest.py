@@ -0,0 +1,89 @@
+import copy
+
+from app.services.ingest_state import ingest_state_store
+from helpers import edit_page, first_module, stored_chunks
+
+MODULES = 3 * 4  # sections x modules_per_section of the default synthetic course
+
+
+def _cmids(chunks):
+    return {meta["cmid"] for meta in chunks.values()}
+
+
+def _counts(result):
+    return {key: result[key] for key in ("modules_added", "modules_changed", "modules_unchanged", "modules_removed")}
+
+
+def test_first_incremental_ingest_falls_back_to_full(make_service):
+    service = make_service()
+
+    result = service.ingest_course_content(1, incremental=True)
+
+    assert result["mode"] == "full"
+    assert _counts(result) == {"modules_added": MODULES, "modules_changed": 0, "modules_unchanged": 0, "modules_removed": 0}
+    assert len(ingest_state_store.load(1)["modules"]) == MODULES
+
+
+def test_unchanged_course_rewrites_nothing(make_service):
+    service = make_service()
+    service.ingest_course_content(1)
+    before = stored_chunks(service, 1)
+
+    result = service.ingest_course_content(1, incremental=True)
+
+    assert result["mode"] == "incremental"
+    assert _counts(result) == {"modules_added": 0, "modules_changed": 0, "modules_unchanged": MODULES, "modules_removed": 0}
+    assert result["chunks_written"] == result["chunks_deleted"] == 0
+    assert stored_chunks(service, 1).keys() == before.keys()
+
+
+def test_changed_module_is_the_only_one_rebuilt(make_service):
+    service = make_service()
+    service.ingest_course_content(1)
+    page = first_module(service, 1, "page")
+    before = stored_chunks(service, 1)
+    others = {chunk_id for chunk_id, meta in before.items() if meta["cmid"] != page["id"]}
+
+    edit_page(page)
+    result = service.ingest_course_content(1, incremental=True)
+    after = stored_chunks(service, 1)
+
+    assert _counts(result) == {"modules_added": 0, "modules_changed": 1, "modules_unchanged": MODULES - 1, "modules_removed": 0}
+    assert result["chunks_written"] > 0 and result["chunks_deleted"] > 0
+    assert {chunk_id for chunk_id, meta in after.items() if meta["cmid"] != page["id"]} == others
+    texts = service._store(1).get(where={"cmid": page["id"]}, include=["documents"])["documents"]
+    assert any("amortized analysis" in text for text in texts)
+
+
+def test_removed_module_loses_its_chunks(make_service):
+    service = make_service()
+    service.ingest_course_content(1)
+    section = service.moodle.course_contents(1)[1]
+    removed = section["modules"].pop(0)
+    assert removed["id"] in _cmids(stored_chunks(service, 1))
+
+    result = service.ingest_course_content(1, incremental=True)
+    after = stored_chunks(service, 1)
+
+    assert _counts(result) == {"modules_added": 0, "modules_changed": 0, "modules_unchanged": MODULES - 1, "modules_removed": 1}
+    assert result["chunks_deleted"] > 0
+    assert removed["id"] not in _cmids(after)
+    assert str(removed["id"]) not in ingest_state_store.load(1)["modules"]
+    assert len(_cmids(after)) == MODULES - 1
+
+
+def test_added_module_is_ingested(make_service):
+    service = make_service()
+    service.ingest_course_content(1)
+    before = stored_chunks(service, 1)
+    section = service.moodle.course_contents(1)[2]
+    added = copy.deepcopy(first_module(service, 1, "page"))
+    added.update(id=199_999, name="Extra reading", url="http://synthetic.moodle/mod/view.php?id=199999")
+    section["modules"].append(added)
+
+    result = service.ingest_course_content(1, incremental=True)
+    after = stored_chunks(service, 1)
+
+    assert _counts(result) == {"modules_added": 1, "modules_changed": 0, "modules_unchanged": MODULES, "modules_removed": 0}
+    assert before.keys() <= after.keys()
+    assert {meta["cmid"] for chunk_id, meta in after.items() if chunk_id not in before} == {added["id"]}
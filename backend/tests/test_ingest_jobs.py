@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from app.services import ingest_jobs
+from app.services.ingest_jobs import IngestJobConflict, IngestJobService
+from app.services.rag_service import IngestCancelled
+
+
+class BlockingIngest:
+    """Stands in for rag_service: every ingest runs until released or cancelled."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = []
+
+    def ingest_course_content(self, course_id, incremental=False, progress=None, should_cancel=None, rebuild=False):
+        self.calls.append((course_id, incremental, rebuild))
+        self.started.set()
+        while not self.release.wait(0.01):
+            if should_cancel():
+                raise IngestCancelled(f"Ingestion of course {course_id} was cancelled")
+        return {"status": "success", "progress": {"modules_processed": 1}}
+
+
+@pytest.fixture
+def ingest(monkeypatch):
+    fake = BlockingIngest()
+    monkeypatch.setattr(ingest_jobs, "rag_service", fake)
+    yield fake
+    fake.release.set()
+
+
+@pytest.fixture
+def jobs(tmp_path, ingest):
+    service = IngestJobService(db_path=str(tmp_path / "ingest_jobs.db"))
+    yield service
+    ingest.release.set()
+    service._executor.shutdown(wait=True)
+
+
+def _wait_for(service, job_id, status, timeout_s=5.0):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        job = service.get(job_id)
+        if job["status"] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} is {service.get(job_id)['status']}, expected {status}")
+
+
+def test_same_options_coalesce_into_the_active_job(jobs, ingest):
+    first = jobs.submit(1, incremental=True)
+    assert ingest.started.wait(5)
+    second = jobs.submit(1, incremental=True)
+
+    assert first["coalesced"] is False
+    assert second["coalesced"] is True
+    assert second["job_id"] == first["job_id"]
+    ingest.release.set()
+    assert _wait_for(jobs, first["job_id"], "succeeded")["result"]["status"] == "success"
+    assert ingest.calls == [(1, True, False)]
+
+
+def test_other_options_conflict_with_the_active_job(jobs, ingest):
+    first = jobs.submit(1, incremental=True)
+    assert ingest.started.wait(5)
+
+    with pytest.raises(IngestJobConflict) as conflict:
+        jobs.submit(1, rebuild=True)
+
+    assert conflict.value.job["job_id"] == first["job_id"]
+    assert first["job_id"] in str(conflict.value)
+    ingest.release.set()
+    _wait_for(jobs, first["job_id"], "succeeded")
+    rebuild = jobs.submit(1, rebuild=True)
+    assert rebuild["coalesced"] is False and rebuild["rebuild"] is True
+
+
+def test_other_courses_do_not_coalesce(jobs, ingest):
+    first = jobs.submit(1)
+    second = jobs.submit(2)
+
+    assert second["coalesced"] is False
+    assert second["job_id"] != first["job_id"]
+
+
+def test_cancel_stops_a_running_job(jobs, ingest):
+    job = jobs.submit(1)
+    assert ingest.started.wait(5)
+
+    jobs.cancel(job["job_id"])
+
+    cancelled = _wait_for(jobs, job["job_id"], "cancelled")
+    assert "cancelled" in cancelled["error"]
+    assert cancelled["finished_at"]
+
+
+def test_cancel_of_a_queued_job_keeps_it_from_running(jobs, ingest):
+    running = jobs.submit(1)
+    assert ingest.started.wait(5)
+    queued = jobs.submit(2)
+
+    assert jobs.cancel(queued["job_id"])["status"] == "cancelled"
+    ingest.release.set()
+    _wait_for(jobs, running["job_id"], "succeeded")
+    jobs._executor.shutdown(wait=True)
+    assert ingest.calls == [(1, False, False)]
+    assert jobs.get(queued["job_id"])["status"] == "cancelled"
+
+
+def test_restart_marks_active_jobs_interrupted(jobs, ingest):
+    running = jobs.submit(1)
+    assert ingest.started.wait(5)
+    queued = jobs.submit(2)
+
+    restarted = IngestJobService(db_path=jobs.db_path)
+
+    for job_id in (running["job_id"], queued["job_id"]):
+        job = restarted.get(job_id)
+        assert job["status"] == "interrupted"
+        assert job["error"] == "Server restarted before the job finished"
+    assert restarted.submit(1)["coalesced"] is False
+    restarted._executor.shutdown(wait=False)
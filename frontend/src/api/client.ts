@@ -72,11 +72,52 @@ export interface QuizResponse {
   matched_topic?: string | null;
 }
 
+export interface IngestJob {
+  job_id: string;
+  course_id: number;
+  incremental: boolean;
+  status: 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled' | 'interrupted';
+  progress: {
+    stage?: string;
+    modules_total?: number;
+    modules_processed?: number;
+    files_total?: number;
+    files_parsed?: number;
+    chunks_embedded?: number;
+  };
+  result?: Record<string, unknown> | null;
+  error?: string | null;
+  coalesced?: boolean;
+}
+
+const INGEST_POLL_INTERVAL_MS = 2000;
+
 export const chatApi = {
-  ingestCourse: async (courseId: number) => {
-        const response = await api.post('/ai/ingest', { course_id: courseId });
+  startIngest: async (courseId: number, incremental: boolean = false) => {
+        const response = await api.post<IngestJob>('/ai/ingest', { course_id: courseId, incremental });
+        return response.data;
+    },
+    getIngestJob: async (jobId: string) => {
+        const response = await api.get<IngestJob>(`/ai/ingest/${jobId}`);
+        return response.data;
+    },
+    cancelIngestJob: async (jobId: string) => {
+        const response = await api.post<IngestJob>(`/ai/ingest/${jobId}/cancel`);
         return response.data;
     },
+    // Queues ingestion and polls the background job until it finishes; resolves with the ingest result.
+    ingestCourse: async (courseId: number, onProgress?: (job: IngestJob) => void) => {
+        let job = await chatApi.startIngest(courseId);
+        while (job.status === 'queued' || job.status === 'running') {
+            onProgress?.(job);
+            await new Promise((resolve) => setTimeout(resolve, INGEST_POLL_INTERVAL_MS));
+            job = await chatApi.getIngestJob(job.job_id);
+        }
+        if (job.status !== 'succeeded') {
+            throw new Error(job.error || `Ingestion ${job.status}`);
+        }
+        return job.result;
+    },
     getHistory: async (courseId: number, studentId: number) => {
         const response = await api.get<Array<{ id: number; role: 'user' | 'assistant'; content: string; created_at: string }>>(
             '/ai/chat/history',